@@ -1,56 +1,380 @@
 import pandas as pd
+import numpy as np
 import streamlit as st
 import io
 import time
 import plotly.graph_objects as go
-from cutting_optimizer import optimize_cutting
-from utils import create_output_excel, create_accessory_summary, validate_input_excel, save_optimization_history, load_optimization_history, delete_optimization_history_entry
+from cutting_optimizer import run_optimization, OptimizationCancelled, OPTIMIZATION_METHODS, ANYTIME_METHODS
+from cut_plan import CutPlan, LENGTH_SCALE, length_texts, to_unit, from_unit
+import remnant_store
+from utils import create_output_excel, create_accessory_summary, save_optimization_history, load_optimization_metrics, record_export_time, list_optimization_history, count_optimization_history, load_optimization_history_entry, rename_optimization_history_entry, delete_optimization_history_entry, LRUCache, files_digest, optimization_cache_key, read_order_files
 import uuid
 from datetime import datetime
 import threading
-import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Số thanh trên mỗi trang mô phỏng
+BAR_PAGE_SIZES = [20, 50, 100, 200]
+
+def piece_color(position):
+    return f"rgba({(position*40)%255}, {(position*70)%255}, {(position*90)%255}, 0.7)" if position > 0 else "rgba(255, 100, 100, 0.9)"
+
+# Hàm dựng một biểu đồ cho cả trang thanh: mỗi vị trí mảnh là một trace Bar ngang (base = điểm bắt đầu),
+# nên số trace chỉ phụ thuộc số mảnh tối đa trên một thanh, không phụ thuộc số thanh
+@st.cache_resource(max_entries=32, show_spinner=False)
+def build_bars_figure(plan_id, profile_code, page, page_size, cutting_gap, _plan):
+    bars = np.flatnonzero(_plan.bar_profile_codes == profile_code)[page * page_size:(page + 1) * page_size]
+    plan = _plan.take(bars)
+    counts = plan.bar_piece_counts()
+    units = plan.piece_lengths
+
+    # Điểm bắt đầu của mỗi mảnh: tổng (chiều dài + khoảng cách cắt) các mảnh trước nó trên cùng thanh,
+    # cộng dồn trên số nguyên phần mười mm rồi mới quy đổi ra mm để vẽ
+    steps = units + to_unit(cutting_gap)
+    ends = np.cumsum(steps)
+    bar_base = np.concatenate(([0], ends))[plan.piece_offsets[:-1]]
+    starts = (ends - steps - np.repeat(bar_base, counts)) / LENGTH_SCALE
+    lengths = units / LENGTH_SCALE
+    positions = np.arange(plan.n_pieces) - np.repeat(plan.piece_offsets[:-1], counts)
+
+    labels = np.array([f"#{number} · {from_unit(stock)}mm" for number, stock in zip(plan.bar_numbers.tolist(), plan.bar_stock_lengths.tolist())], dtype=object)
+    piece_labels = np.repeat(labels, counts)
+    texts = np.array(length_texts(units), dtype=object)
+    item_ids = plan.piece_item_ids
 
-# Hàm hiển thị mô phỏng cắt thanh
-def display_pattern(row, cutting_gap):
-    pattern = row['Mẫu Cắt']
-    parts = pattern.split('+')
-    current_pos = 0
     fig = go.Figure()
-
-    for i, part in enumerate(parts):
-        length = float(part)
-        color = f"rgba({(i*40)%255}, {(i*70)%255}, {(i*90)%255}, 0.7)" if i > 0 else "rgba(255, 100, 100, 0.9)"
-        fig.add_shape(
-            type="rect",
-            x0=current_pos, x1=current_pos + length,
-            y0=0, y1=1,
-            line=dict(width=1),
-            fillcolor=color
-        )
-        fig.add_annotation(
-            x=current_pos + length / 2, y=0.5,
-            text=str(int(length)) if length % 1 == 0 else f"{length:.1f}",
-            showarrow=False,
-            font=dict(size=10, color="white")
-        )
-        current_pos += length + cutting_gap
+    for position in range(int(counts.max()) if plan.n_bars else 0):
+        mask = positions == position
+        fig.add_trace(go.Bar(
+            orientation='h', y=piece_labels[mask], x=lengths[mask], base=starts[mask],
+            marker=dict(color=piece_color(position), line=dict(width=1)),
+            text=texts[mask], textposition='inside', insidetextanchor='middle', textfont=dict(size=10, color="white"),
+            customdata=item_ids[mask], hovertemplate="%{y}<br>%{text}mm — %{customdata}<extra></extra>"
+        ))
+
+    # Phần còn lại của mỗi thanh
+    remaining = plan.bar_remaining / LENGTH_SCALE
+    has_remaining = remaining > 0
+    stock = plan.bar_stock_lengths / LENGTH_SCALE
+    fig.add_trace(go.Bar(
+        orientation='h', y=labels[has_remaining], x=remaining[has_remaining], base=(stock - remaining)[has_remaining],
+        marker=dict(color="rgba(200, 200, 200, 0.5)", line=dict(width=1)),
+        hovertemplate="%{y}<br>Còn lại %{x}mm<extra></extra>"
+    ))
 
     fig.update_layout(
-        height=100,
-        margin=dict(l=10, r=10, t=10, b=10),
-        xaxis=dict(title="", range=[0, row['Chiều Dài Thanh']]),
-        yaxis=dict(visible=False),
+        barmode='overlay',
+        height=60 + 28 * plan.n_bars,
+        margin=dict(l=10, r=10, t=10, b=30),
+        xaxis=dict(title="", range=[0, float(stock.max()) if plan.n_bars else 1]),
+        yaxis=dict(type='category', autorange='reversed'),
         showlegend=False
     )
-    
-    unique_key = f"plot_{row['Số Thanh']}_{uuid.uuid4()}"
-    st.plotly_chart(fig, use_container_width=True, key=unique_key)
+    return fig
+
+# Hàm hiển thị mô phỏng một trang thanh của một mã thanh bằng một biểu đồ duy nhất
+def show_bars_page(plan_id, plan, profile_code, page, page_size, cutting_gap):
+    fig = build_bars_figure(plan_id, profile_code, page, page_size, cutting_gap, plan)
+    st.plotly_chart(fig, use_container_width=True, key=f"bars_{plan_id}_{profile_code}_{page}_{page_size}")
+
+# Đọc và kiểm tra Excel một lần cho mỗi nội dung tệp, dùng chung giữa các phiên
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_excel_cached(file_hash, _files):
+    return pd.concat([pd.read_excel(io.BytesIO(file_bytes)) for _, file_bytes in _files], ignore_index=True)
+
+# Đơn hàng gộp từ mọi tệp và mọi sheet, đọc theo luồng và cộng dồn theo mã thanh
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_order_cached(file_hash, _files):
+    return read_order_files(_files)
+
+# Số mục lịch sử trên mỗi trang danh sách
+HISTORY_PAGE_SIZE = 20
+
+# Dữ liệu kết quả của một mục lịch sử, chỉ giải nén khi được chọn xem
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_history_frames(entry_id):
+    entry = load_optimization_history_entry(entry_id)
+    if entry is None:
+        return None
+    return entry['result_df'], entry['patterns_df'], entry['summary_df']
+
+# Phương án cắt dạng mảng của một kết quả/lịch sử, dựng một lần từ result_df và patterns_df
+@st.cache_resource(max_entries=8, show_spinner=False)
+def load_cut_plan(plan_id, _result_df, _patterns_df):
+    return CutPlan.from_frames(_result_df, _patterns_df)
+
+# Bộ nhớ đệm kết quả tối ưu theo nội dung tệp và tham số, LRU dùng chung giữa các phiên
+@st.cache_resource
+def get_result_cache():
+    return LRUCache(max_entries=16)
+
+# Bộ chạy nền cho tối ưu hóa, dùng chung giữa các phiên; luồng nền không gọi Streamlit
+@st.cache_resource
+def get_job_runner():
+    return {'executor': ThreadPoolExecutor(max_workers=2), 'jobs': {}, 'exports': {}}
+
+# Bộ nhớ đệm file Excel đã xuất theo mã kết quả/lịch sử, chỉ tạo khi người dùng yêu cầu
+@st.cache_resource
+def get_export_cache():
+    return LRUCache(max_entries=8)
+
+# Hàm tạo file Excel trong luồng nền, kết quả (hoặc lỗi) được ghi vào bộ nhớ đệm
+def start_export_job(export_id, result_df, patterns_df, summary_df, stock_length_options, cutting_gap):
+    runner = get_job_runner()
+    if export_id in runner['exports']:
+        return
+
+    def run():
+        try:
+            started = time.perf_counter()
+            output = io.BytesIO()
+            create_output_excel(output, result_df, patterns_df, summary_df, stock_length_options, cutting_gap)
+            get_export_cache().put(export_id, ('ok', output.getvalue()))
+        except Exception as export_err:
+            get_export_cache().put(export_id, ('error', str(export_err)))
+            return
+        # Mã xuất file cũng là mã lịch sử: ghi thời gian xuất vào chỉ số hiệu năng. Chỉ số chỉ để tham khảo,
+        # lỗi ghi (ví dụ CSDL đang bị khóa) không được làm mất file đã tạo xong
+        try:
+            record_export_time(export_id, time.perf_counter() - started)
+        except Exception:
+            pass
+
+    runner['exports'][export_id] = runner['executor'].submit(run)
+
+# Hàm chờ file Excel đang tạo, làm mới toàn trang khi xong để hiện nút tải xuống
+@st.fragment(run_every=0.5)
+def show_export_progress(export_id):
+    future = get_job_runner()['exports'].get(export_id)
+    if future is None or future.done():
+        st.rerun()
+    st.info("⏳ Đang tạo file Excel...")
+
+# Hàm hiển thị nút xuất Excel hai bước: tạo file khi được yêu cầu, sau đó tải xuống từ bộ nhớ đệm
+def show_export_button(export_id, label, file_name, result_df, patterns_df, summary_df, stock_length_options, cutting_gap):
+    exports = get_job_runner()['exports']
+    future = exports.get(export_id)
+    if future is not None and future.done():
+        exports.pop(export_id, None)
+    cached = get_export_cache().get(export_id)
+    if cached is not None:
+        status, payload = cached
+        if status == 'ok':
+            st.download_button(label, payload, file_name, key=f"download_{export_id}")
+            return
+        st.error(f"❌ Lỗi tạo file Excel: {payload}")
+
+    if export_id in exports:
+        show_export_progress(export_id)
+    elif st.button("📦 Tạo File Excel", key=f"export_{export_id}"):
+        start_export_job(export_id, result_df, patterns_df, summary_df, stock_length_options, cutting_gap)
+        show_export_progress(export_id)
+
+# Tên hiển thị các cột chỉ số hiệu năng theo mã thanh
+METRIC_COLUMNS = {
+    'profile_code': 'Mã Thanh',
+    'method': 'Phương Pháp',
+    'pieces': 'Số Đoạn',
+    'distinct_lengths': 'Số Chiều Dài',
+    'expand_s': 'Gom Chiều Dài (s)',
+    'pattern_count': 'Số Mẫu/Thanh',
+    'pattern_s': 'Sinh Mẫu (s)',
+    'build_s': 'Dựng Mô Hình (s)',
+    'solve_s': 'Giải Mô Hình (s)',
+    'solver_calls': 'Số Lần Giải',
+    'solver_status': 'Trạng Thái',
+    'hit_limit': 'Chạm Giới Hạn',
+    'lower_bound_bars': 'Cận Dưới Số Thanh',
+    'lower_bound_stock': 'Cận Dưới Nguyên Liệu (mm)',
+    'lp_bound': 'Cận LP (mm)',
+    'heuristic_s': 'Heuristic Thử (s)',
+    'stage': 'Giới Hạn Thời Gian',
+    'reused': 'Dùng Lại',
+    'cache_hit': 'Bộ Nhớ Đệm Nghiệm',
+    'remnant_s': 'Xếp Phần Dư (s)',
+    'remnants_used': 'Phần Dư Đã Dùng',
+    'assign_s': 'Gán Mảnh (s)',
+    'total_s': 'Tổng (s)'
+}
+
+# Hàm hiển thị bảng chẩn đoán hiệu năng của một lần chạy (đọc từ lịch sử, không tải dữ liệu kết quả)
+def show_diagnostics(history_id):
+    metrics = load_optimization_metrics(history_id)
+    with st.expander("🩺 Chẩn đoán hiệu năng"):
+        if not metrics:
+            st.info("Lần chạy này không có chỉ số hiệu năng.")
+            return
+        if metrics.get('reused'):
+            st.info("Kết quả dùng lại từ bộ nhớ đệm; chỉ số dưới đây là của lần tính ban đầu.")
+        phases = metrics.get('phases', {})
+        phase_labels = [
+            ("Gom nhu cầu", phases.get('demand_s')), ("Giải các mã thanh", phases.get('solve_s')),
+            ("Ghép kết quả", phases.get('merge_s')), ("Tổng tối ưu", phases.get('total_s')),
+            ("Xuất Excel", metrics.get('export_s'))
+        ]
+        for column, (label, seconds) in zip(st.columns(len(phase_labels)), phase_labels):
+            column.metric(label, "-" if seconds is None else f"{seconds:.2f} s")
+        if phases.get('time_budget'):
+            st.caption(
+                f"Giới hạn thời gian {phases['time_budget']} giây: heuristic {phases.get('heuristic_s', 0):.2f} s, "
+                f"cải thiện {phases.get('improve_s', 0):.2f} s, {phases.get('improved_codes', 0)} mã thanh được cải thiện."
+            )
+        if phases.get('reused_codes'):
+            st.caption(f"Dùng lại {phases['reused_codes']} mã thanh không đổi từ lần chạy trước.")
+        if phases.get('cache_hits'):
+            st.caption(f"{phases['cache_hits']} mã thanh lấy nghiệm từ bộ nhớ đệm (cùng tập chiều dài đã giải trước đây).")
+        if phases.get('remnant_codes'):
+            st.caption(f"{phases['remnant_codes']} mã thanh dùng phần dư tồn kho (luôn được giải lại).")
+        if phases.get('workers'):
+            st.caption(f"Số tiến trình giải: {phases['workers']}. Thời gian theo mã thanh là thời gian trong tiến trình giải.")
+        profiles = pd.DataFrame(metrics.get('profiles', []))
+        if not profiles.empty:
+            profiles = profiles.sort_values('total_s', ascending=False).rename(columns=METRIC_COLUMNS)
+            st.dataframe(profiles, use_container_width=True, hide_index=True)
+
+# Hàm hiển thị và quản lý kho phần dư theo mã thanh
+def show_remnant_inventory():
+    with st.expander("🧱 Kho Phần Dư"):
+        inventory = remnant_store.inventory_summary()
+        if inventory.empty:
+            st.info("Kho phần dư đang trống.")
+        else:
+            st.dataframe(inventory, use_container_width=True, hide_index=True)
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            profile_code = st.text_input("Mã thanh", key="remnant_code").strip()
+        with col2:
+            length = st.number_input("Chiều dài (mm)", 1.0, 100000.0, 1000.0, 10.0, key="remnant_length")
+        with col3:
+            quantity = st.number_input("Số lượng", 1, 1000, 1, 1, key="remnant_quantity")
+        if st.button("➕ Thêm Vào Kho", disabled=not profile_code):
+            remnant_store.add_remnants([(profile_code, length)] * quantity, source="Nhập tay")
+            st.rerun()
+
+        if not inventory.empty:
+            clear_code = st.selectbox("Xóa phần dư của mã thanh", inventory['Mã Thanh'].tolist())
+            if st.button("🗑️ Xóa Phần Dư Mã Thanh Này"):
+                remnant_store.clear_profile(clear_code)
+                st.rerun()
+
+# Hàm khởi chạy tối ưu hóa trong luồng nền, trả về mã công việc
+def start_optimization_job(df, cutting_gap, optimization_method, stock_length_options, max_workers, history_name, cache_key, time_budget=None, previous=None,
+                           remnants=None, min_remnant_length=None):
+    runner = get_job_runner()
+    job = {
+        'progress': {'done': 0, 'total': 0, 'phase': "Đang chuẩn bị"},
+        'cancel': threading.Event(),
+        'started': time.time(),
+        'finished': None,
+        'params': {
+            'cutting_gap': cutting_gap,
+            'optimization_method': optimization_method,
+            'stock_length_options': stock_length_options,
+            'history_name': history_name,
+            'cache_key': cache_key,
+            'min_remnant_length': min_remnant_length
+        }
+    }
 
-# Hàm đếm ngược thời gian
-def countdown_placeholder(placeholder, max_time):
-    for i in range(max_time, -1, -1):
-        placeholder.markdown(f"⏳ **Đang tối ưu hóa... Còn {i} giây**")
-        time.sleep(1)
+    def on_progress(done, total, phase):
+        job['progress'] = {'done': done, 'total': total, 'phase': phase}
+
+    def run():
+        try:
+            return run_optimization(
+                df,
+                cutting_gap=cutting_gap,
+                optimization_method=optimization_method,
+                stock_length_options=stock_length_options,
+                max_workers=max_workers,
+                progress_callback=on_progress,
+                cancel_event=job['cancel'],
+                time_budget=time_budget,
+                previous=previous,
+                remnants=remnants
+            )
+        finally:
+            job['finished'] = time.time()
+
+    job_id = str(uuid.uuid4())
+    runner['jobs'][job_id] = job
+    job['future'] = runner['executor'].submit(run)
+    return job_id
+
+# Hàm nhận kết quả công việc đã xong: lưu kết quả, lịch sử và thông báo cho phiên hiện tại
+def collect_finished_job():
+    job_id = st.session_state.get('job_id')
+    if not job_id:
+        return
+    runner = get_job_runner()
+    job = runner['jobs'].get(job_id)
+    if job is None:
+        st.session_state.job_id = None
+        return
+    if not job['future'].done():
+        return
+
+    runner['jobs'].pop(job_id, None)
+    st.session_state.job_id = None
+    params = job['params']
+    try:
+        result = job['future'].result()
+    except OptimizationCancelled:
+        st.session_state.job_notice = ('warning', "⛔ Đã hủy tối ưu hóa.")
+        return
+    except Exception as opt_err:
+        st.session_state.job_notice = ('error', f"❌ Lỗi tối ưu hóa: {opt_err}")
+        return
+
+    result_df, patterns_df, summary_df = result.frames()
+    st.session_state.job_messages = list(result.warnings)
+    # Giữ kết quả để lần chạy sau chỉ tối ưu lại các mã thanh thay đổi
+    st.session_state.last_result = result
+    elapsed = job['finished'] - job['started']
+    elapsed_formatted = f"{elapsed:.1f}" if elapsed % 1 != 0 else f"{int(elapsed)}"
+    phases = result.metrics['phases']
+    reused_codes = phases.get('reused_codes', 0) + phases.get('cache_hits', 0)
+    reused_text = f" (dùng lại {reused_codes} mã thanh đã giải)" if reused_codes else ""
+    st.session_state.job_notice = ('success', f"✅ Hoàn tất trong {elapsed_formatted} giây{reused_text}")
+    if params['min_remnant_length'] is None:
+        get_result_cache().put(params['cache_key'], (result_df, patterns_df, summary_df, list(result.warnings), result.metrics))
+    else:
+        # Kết quả dùng phần dư phụ thuộc kho lúc chạy nên không đưa vào bộ nhớ đệm; cập nhật kho ngay
+        used_ids = result.used_remnant_ids()
+        consumed, added = remnant_store.apply_run(used_ids, result.offcuts(params['min_remnant_length']), source=params['history_name'])
+        st.session_state.job_notice = ('success', f"✅ Hoàn tất trong {elapsed_formatted} giây{reused_text}. Kho phần dư: dùng {consumed}, thêm {added}.")
+        if consumed < len(used_ids):
+            st.session_state.job_messages.append({
+                'level': 'warning', 'profile_code': None,
+                'message': f"{len(used_ids) - consumed} phần dư trong phương án đã được lần tối ưu khác lấy khỏi kho trước đó, vui lòng kiểm tra lại."
+            })
+
+    # Lưu vào lịch sử với tên; mã lịch sử cũng là mã của file Excel xuất ra
+    history_id = save_optimization_history(
+        result_df, patterns_df, summary_df, params['stock_length_options'], params['cutting_gap'], params['optimization_method'],
+        name=params['history_name'], metrics=result.metrics
+    )
+    st.session_state.result_data = (result_df, patterns_df, summary_df, params['stock_length_options'], params['cutting_gap'], history_id)
+
+# Hàm hiển thị tiến độ thực và nút hủy, tự làm mới cho tới khi công việc xong
+@st.fragment(run_every=0.5)
+def show_job_progress(job_id):
+    job = get_job_runner()['jobs'].get(job_id)
+    if job is None:
+        return
+    if job['future'].done():
+        st.rerun()
+
+    progress = job['progress']
+    done, total = progress['done'], progress['total']
+    elapsed = time.time() - job['started']
+    st.progress(done / total if total else 0.0, text=f"⏳ {progress['phase']} — {done}/{total} mã thanh, {elapsed:.1f} giây")
+    if job['cancel'].is_set():
+        st.info("Đang dừng sau mã thanh hiện tại...")
+    elif st.button("⛔ Hủy Tối Ưu Hóa", key=f"cancel_{job_id}"):
+        job['cancel'].set()
 
 # Cấu hình giao diện
 st.set_page_config(page_title="Phần mềm Hỗ Trợ Sản Xuất Cửa", layout="wide")
@@ -87,9 +411,17 @@ st.markdown("""
 Hãy chọn tab phù hợp để bắt đầu! Xem hướng dẫn chi tiết trong tab **Giới Thiệu**.
 """)
 
-uploaded_file = st.file_uploader("📤 Tải lên tệp Excel dữ liệu", type=["xlsx", "xls"])
+uploaded_files = st.file_uploader("📤 Tải lên tệp Excel dữ liệu (chọn được nhiều tệp)", type=["xlsx", "xls"], accept_multiple_files=True)
+if uploaded_files:
+    uploaded_sources = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+    uploaded_hash = files_digest(uploaded_sources)
 if 'result_data' not in st.session_state:
     st.session_state.result_data = None
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+
+# Nhận kết quả công việc nền trước khi vẽ các tab để lịch sử hiển thị ngay lần chạy mới
+collect_finished_job()
 
 # Các tab chính
 tab_intro, tab_upload, tab_phu_kien, tab_cat_nhom = st.tabs(["📖 Giới Thiệu", "📁 Tải Mẫu Nhập", "📦 Tổng Hợp Phụ Kiện", "✂️ Tối Ưu Cắt"])
@@ -122,7 +454,7 @@ with tab_intro:
     #### 3. ✂️ Tối Ưu Cắt Nhôm
     - **Chức năng**: Tối ưu hóa việc cắt nhôm để giảm phế liệu và tăng hiệu suất, hỗ trợ nhiều phương pháp tối ưu và tùy chỉnh khoảng cách cắt.
     - **Hướng dẫn sử dụng**:
-      1. Tải file cắt nhôm (đã nhập liệu theo mẫu) bằng cách kéo thả hoặc chọn file từ máy.
+      1. Tải file cắt nhôm (đã nhập liệu theo mẫu) bằng cách kéo thả hoặc chọn file từ máy. Có thể chọn nhiều tệp và tệp nhiều sheet: mọi sheet có đủ cột được gộp theo mã thanh để tối ưu chung, mỗi mảnh cắt ghi rõ **Tệp Nguồn** và **Sheet**.
       2. Nhập các thông số cần thiết:
          - **Kích thước thanh**: Nhập các kích thước thanh có sẵn (mm), phân cách bằng dấu phẩy (ví dụ: 5800, 6000).
          - **Khoảng cách cắt**: Nhập khoảng cách giữa các mảnh cắt trên thanh (mm), thường do lưỡi cắt tạo ra (mặc định: 10mm, có thể điều chỉnh từ 1-100mm). Khoảng cách này ảnh hưởng đến tính toán phế liệu và hiệu suất.
@@ -130,10 +462,14 @@ with tab_intro:
            - **Tối Ưu Hiệu Suất Cao Nhất**: Chọn kích thước thanh để tối đa hóa hiệu suất sử dụng nguyên liệu.
            - **Tối Ưu Số Lượng Thanh**: Chọn kích thước thanh để sử dụng ít thanh nhất.
            - **Tối Ưu Linh Hoạt**: Sử dụng nhiều kích thước thanh để giảm thiểu phế liệu.
-           - **Tối Ưu PuLP**: Sử dụng lập trình tuyến tính với PuLP (chuyển sang Tối Ưu Linh Hoạt nếu dữ liệu lớn).
+           - **Tối Ưu PuLP**: Sử dụng lập trình tuyến tính với PuLP (chuyển sang Tối Ưu Sinh Cột nếu dữ liệu lớn).
+           - **Tối Ưu Sinh Cột**: Sinh mẫu cắt dần bằng PuLP (Gilmore–Gomory), phù hợp cho đơn hàng lớn với hàng nghìn đoạn cắt mỗi mã thanh.
+         - **Giới hạn thời gian** (PuLP, Sinh Cột): tổng thời gian cho cả lần chạy; mọi mã thanh có nghiệm nhanh trước, thời gian còn lại dùng để cải thiện các mã còn xa cận dưới.
+         - **Chỉ tối ưu lại mã thanh thay đổi**: khi sửa vài dòng rồi tải lại tệp, các mã thanh không đổi dùng lại phương án của lần chạy trước.
+         - **Dùng phần dư tồn kho**: đoạn cắt được xếp vào phần dư trong **Kho Phần Dư** trước khi mở thanh mới; sau khi chạy, phần dư đã dùng được lấy ra khỏi kho và phần còn lại đủ dài của các thanh được thêm vào kho.
       3. Nhấn nút **"Tối Ưu Hóa"** để chạy tính toán.
       4. Xem kết quả:
-         - **Bảng Tổng Hợp Hiệu Suất**: Hiển thị hiệu suất tổng thể, số lượng thanh, và phế liệu.
+         - **Bảng Tổng Hợp Hiệu Suất**: Hiển thị hiệu suất tổng thể, số lượng thanh, phế liệu và chênh lệch so với cận dưới (0% là chắc chắn tối ưu).
          - **Danh Sách Mẫu Cắt**: Hiển thị chi tiết mẫu cắt cho từng thanh.
          - **Bảng Chi Tiết Mảnh Cắt**: Hiển thị thông tin từng mảnh cắt.
          - **Mô Phỏng Cắt Từng Thanh**: Hiển thị trực quan cách cắt từng thanh.
@@ -143,7 +479,7 @@ with tab_intro:
     ### Lưu ý khi sử dụng
     - Đảm bảo file nhập liệu đúng định dạng theo mẫu.
     - Kích thước thanh và khoảng cách cắt phải là số dương.
-    - Phương pháp "Tối Ưu PuLP" sẽ tự động chuyển sang "Tối Ưu Linh Hoạt" nếu dữ liệu quá lớn (>100 mục mỗi mã thanh).
+    - Phương pháp "Tối Ưu PuLP" sẽ tự động chuyển sang "Tối Ưu Sinh Cột" nếu một mã thanh có quá nhiều chiều dài khác nhau (>20 chiều dài).
     """)
 
 # Tab Tải Mẫu Nhập
@@ -179,9 +515,9 @@ with tab_upload:
 # Tab Tổng Hợp Phụ Kiện
 with tab_phu_kien:
     st.subheader("📦 Tổng Hợp Phụ Kiện")
-    if uploaded_file:
+    if uploaded_files:
         try:
-            acc_df = pd.read_excel(uploaded_file)
+            acc_df = load_excel_cached(uploaded_hash, uploaded_sources)
             output = io.BytesIO()
             summary_df = create_accessory_summary(acc_df, output)
             output.seek(0)
@@ -201,12 +537,21 @@ with tab_cat_nhom:
     # Sub-tab Lịch Sử Tối Ưu Hóa
     with subtab_history:
         st.markdown("### 📜 Lịch Sử Tối Ưu Hóa")
-        history_data = load_optimization_history()
-        if history_data:
+        # Chỉ đọc metadata của một trang lịch sử; dữ liệu kết quả chỉ nạp cho mục được chọn
+        search_text = st.text_input("🔍 Tìm theo tên, thời gian, phương pháp hoặc mã thanh", key="history_search").strip()
+        if st.session_state.get('history_list_search') != search_text:
+            st.session_state.history_list_search = search_text
+            st.session_state.history_list_page = 0
+        total_entries = count_optimization_history(search_text)
+        if total_entries:
+            num_list_pages = (total_entries + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+            list_page = min(st.session_state.get('history_list_page', 0), num_list_pages - 1)
+            history_data = list_optimization_history(search_text, limit=HISTORY_PAGE_SIZE, offset=list_page * HISTORY_PAGE_SIZE)
+
             # Tạo bảng lịch sử không có cột STT
             history_df = pd.DataFrame([
                 {
-                    'Tên': entry.get('name', entry['timestamp']),
+                    'Tên': entry['name'],
                     'Thời Gian': entry['timestamp'],
                     'Phương Pháp Tối Ưu': entry['optimization_method'],
                     'Mã Thanh': ', '.join(entry['profile_codes']),
@@ -216,28 +561,37 @@ with tab_cat_nhom:
                 for entry in history_data
             ])
             st.dataframe(history_df, use_container_width=True)
-            
-            # Chọn lịch sử bằng tên
-            history_names = [''] + [entry.get('name', entry['timestamp']) for entry in history_data]
-            selected_history_name = st.selectbox("Chọn lịch sử để xem chi tiết", history_names)
-            if selected_history_name:
-                # Tìm entry dựa trên tên
-                selected_entry = next((entry for entry in history_data if entry.get('name', entry['timestamp']) == selected_history_name), None)
-                if selected_entry:
-                    result_df = pd.DataFrame(selected_entry['result_df'])
-                    patterns_df = pd.DataFrame(selected_entry['patterns_df'])
-                    summary_df = pd.DataFrame(selected_entry['summary_df'])
+
+            col1, col2 = st.columns(2)
+            with col1:
+                if list_page > 0 and st.button("Trang trước", key="history_list_prev"):
+                    st.session_state.history_list_page = list_page - 1
+                    st.rerun()
+            with col2:
+                if list_page < num_list_pages - 1 and st.button("Trang sau", key="history_list_next"):
+                    st.session_state.history_list_page = list_page + 1
+                    st.rerun()
+            st.caption(f"Trang {list_page + 1}/{num_list_pages} — {total_entries} lần tối ưu hóa")
+
+            # Chọn lịch sử trong trang hiện tại
+            entries_by_id = {entry['id']: entry for entry in history_data}
+            selected_id = st.selectbox(
+                "Chọn lịch sử để xem chi tiết", [''] + list(entries_by_id),
+                format_func=lambda entry_id: f"{entries_by_id[entry_id]['name']} ({entries_by_id[entry_id]['timestamp']})" if entry_id else ''
+            )
+            if selected_id:
+                selected_entry = entries_by_id[selected_id]
+                frames = load_history_frames(selected_id)
+                if frames:
+                    result_df, patterns_df, summary_df = frames
                     stock_length_options = selected_entry['stock_length_options']
                     cutting_gap = selected_entry['cutting_gap']
                     
                     # Cho phép chỉnh sửa tên lịch sử
-                    current_name = selected_entry.get('name', selected_entry['timestamp'])
+                    current_name = selected_entry['name']
                     new_name = st.text_input("Đặt tên cho lịch sử này", value=current_name, key=f"name_{selected_entry['id']}")
                     if new_name != current_name:
-                        history_data = [entry for entry in history_data if entry['id'] != selected_entry['id']]
-                        selected_entry['name'] = new_name
-                        with open("history.json", 'w', encoding='utf-8') as f:
-                            json.dump(history_data, f, ensure_ascii=False, indent=2)
+                        rename_optimization_history_entry(selected_entry['id'], new_name)
                         st.success("✅ Đã cập nhật tên lịch sử!")
                         st.rerun()  # Làm mới giao diện để hiển thị tên mới
                     
@@ -246,8 +600,10 @@ with tab_cat_nhom:
                     summary_df_display = summary_df.style.format({
                         'Hiệu Suất Tổng Thể': "{:.1f}%",
                         'Hiệu Suất Trung Bình': "{:.1f}%",
+                        'Chênh Lệch Số Thanh (%)': "{:.1f}%",
+                        'Chênh Lệch Nguyên Liệu (%)': "{:.1f}%",
                         'Phế Liệu (mm)': lambda x: f"{x:.1f}" if isinstance(x, float) and x % 1 != 0 else f"{int(x)}"
-                    })
+                    }, na_rep="-")
                     st.dataframe(summary_df_display, use_container_width=True)
 
                     st.subheader("📋 Danh Sách Mẫu Cắt")
@@ -259,44 +615,41 @@ with tab_cat_nhom:
                     st.dataframe(patterns_df_display, use_container_width=True)
 
                     st.subheader("📄 Bảng Chi Tiết Mảnh Cắt")
-                    result_df = result_df.rename(columns={'Item ID': 'Mã Mảnh', 'Bar Number': 'Số Thanh'})
-                    st.dataframe(result_df, use_container_width=True)
+                    st.dataframe(result_df.rename(columns={'Item ID': 'Mã Mảnh', 'Bar Number': 'Số Thanh'}), use_container_width=True)
 
                     st.subheader("📊 Mô Phỏng Cắt Từng Thanh")
                     selected_profile = st.selectbox("Chọn Mã Thanh", patterns_df['Mã Thanh'].unique(), key=f"history_profile_{selected_entry['id']}")
-                    filtered = patterns_df[patterns_df['Mã Thanh'] == selected_profile]
-                    rows_per_page = 5
-                    total_rows = len(filtered)
-                    num_pages = (total_rows + rows_per_page - 1) // rows_per_page
+                    plan = load_cut_plan(selected_entry['id'], result_df, patterns_df)
+                    rows_per_page = st.selectbox("Số thanh mỗi trang", BAR_PAGE_SIZES, index=1, key=f"history_page_size_{selected_entry['id']}")
+                    total_rows = int((plan.bar_profile_codes == selected_profile).sum())
+                    num_pages = max(1, (total_rows + rows_per_page - 1) // rows_per_page)
                     page_key = f"history_page_{selected_entry['id']}"
                     if page_key not in st.session_state:
                         st.session_state[page_key] = 0
+                    st.session_state[page_key] = min(st.session_state[page_key], num_pages - 1)
 
-                    start_idx = st.session_state[page_key] * rows_per_page
-                    end_idx = min(start_idx + rows_per_page, total_rows)
-                    display_rows = filtered.iloc[start_idx:end_idx]
-
-                    for idx, row in display_rows.iterrows():
-                        st.markdown(f"**🔹 #{row['Số Thanh']} | {selected_profile} | {int(row['Chiều Dài Thanh'])}mm**")
-                        display_pattern(row, cutting_gap)
+                    show_bars_page(selected_entry['id'], plan, selected_profile, st.session_state[page_key], rows_per_page, cutting_gap)
 
                     col1, col2 = st.columns(2)
                     with col1:
                         if st.session_state[page_key] > 0:
                             if st.button("Trang trước", key=f"prev_{selected_entry['id']}"):
                                 st.session_state[page_key] -= 1
+                                st.rerun()
                     with col2:
                         if st.session_state[page_key] < num_pages - 1:
                             if st.button("Trang sau", key=f"next_{selected_entry['id']}"):
                                 st.session_state[page_key] += 1
+                                st.rerun()
 
                     st.info(f"Đang hiển thị trang {st.session_state[page_key] + 1}/{num_pages}")
 
-                    # Tải xuống kết quả lịch sử
-                    output = io.BytesIO()
-                    create_output_excel(output, result_df, patterns_df, summary_df, stock_length_options, cutting_gap)
-                    output.seek(0)
-                    st.download_button("📥 Tải Xuống Kết Quả Lịch Sử", output, f"ket_qua_cat_nhom_{selected_entry['timestamp'].replace(':', '-')}.xlsx")
+                    # Tải xuống kết quả lịch sử, file chỉ được tạo khi yêu cầu
+                    show_export_button(
+                        selected_entry['id'], "📥 Tải Xuống Kết Quả Lịch Sử", f"ket_qua_cat_nhom_{selected_entry['timestamp'].replace(':', '-')}.xlsx",
+                        result_df, patterns_df, summary_df, stock_length_options, cutting_gap
+                    )
+                    show_diagnostics(selected_entry['id'])
                     
                     # Nút xóa lịch sử
                     if st.button("🗑️ Xóa Lịch Sử Này"):
@@ -304,19 +657,19 @@ with tab_cat_nhom:
                         st.success("✅ Đã xóa lịch sử!")
                         st.rerun()
         else:
-            st.info("ℹ️ Chưa có lịch sử tối ưu hóa.")
+            st.info("ℹ️ Không tìm thấy lịch sử phù hợp." if search_text else "ℹ️ Chưa có lịch sử tối ưu hóa.")
 
     # Sub-tab Tối Ưu Hóa Mới
     with subtab_new:
         st.markdown("### 📊 Tối Ưu Hóa")
-        if uploaded_file:
+        show_remnant_inventory()
+        if uploaded_files:
             try:
-                df = pd.read_excel(uploaded_file)
-                valid, message = validate_input_excel(df)
+                df, valid, message = load_order_cached(uploaded_hash, uploaded_sources)
                 if not valid:
                     st.error(message)
                 else:
-                    st.success("✅ Dữ liệu nhôm hợp lệ!")
+                    st.success(f"✅ Dữ liệu nhôm hợp lệ! {message}, tối ưu chung theo mã thanh.")
                     st.dataframe(df, use_container_width=True)
 
                     col1, col2, col3 = st.columns(3)
@@ -328,63 +681,88 @@ with tab_cat_nhom:
                         cutting_gap = st.number_input("Khoảng cách cắt (mm)", 1, 100, 10, 1)
 
                     with col3:
-                        optimization_method = st.selectbox("Phương pháp tối ưu", ["Tối Ưu Hiệu Suất Cao Nhất", "Tối Ưu Số Lượng Thanh", "Tối Ưu Linh Hoạt", "Tối Ưu PuLP"])
+                        optimization_method = st.selectbox("Phương pháp tối ưu", OPTIMIZATION_METHODS)
 
                     # Thêm trường nhập tên cho lần tối ưu hóa
                     history_name = st.text_input("Tên cho lần tối ưu hóa này", value=f"Tối ưu hóa {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
-                    # Nút tối ưu hóa
-                    if st.button("🚀 Tối Ưu Hóa"):
+                    # Số tiến trình giải song song các mã thanh
+                    cpu_count = os.cpu_count() or 1
+                    max_workers = st.number_input("Số tiến trình song song", 1, cpu_count, min(4, cpu_count), 1)
+
+                    # Giới hạn thời gian cho cả lần chạy: heuristic trước, thời gian còn lại để cải thiện
+                    time_budget = None
+                    if optimization_method in ANYTIME_METHODS:
+                        budget_seconds = st.number_input("Giới hạn thời gian (giây, 0 = không giới hạn)", 0, 3600, 0, 5)
+                        time_budget = budget_seconds or None
+
+                    # Chỉ giải lại các mã thanh có nhu cầu hoặc tham số khác lần chạy trước trong phiên
+                    incremental = st.checkbox("♻️ Chỉ tối ưu lại mã thanh thay đổi so với lần chạy trước", value=True)
+
+                    # Xếp đoạn cắt vào phần dư tồn kho trước khi mở thanh mới
+                    use_remnants = st.checkbox("🧱 Dùng phần dư tồn kho trước khi mở thanh mới", value=False)
+                    min_remnant_length = None
+                    if use_remnants:
+                        min_remnant_length = st.number_input(
+                            "Lưu phần dư từ (mm) vào kho sau khi cắt", 0, 10000, remnant_store.DEFAULT_MIN_REMNANT_LENGTH, 50
+                        )
+
+                    # Nút tối ưu hóa, chạy nền để giao diện không bị chặn
+                    job_running = st.session_state.job_id is not None
+                    if st.button("🚀 Tối Ưu Hóa", disabled=job_running):
                         stock_length_options = [int(x.strip()) for x in length_text.split(",") if x.strip().isdigit()]
 
                         if not stock_length_options:
                             st.error("Vui lòng nhập ít nhất một kích thước thanh.")
                         else:
-                            try:
-                                start_time = time.time()
-                                max_time = 30  # Thời gian tối đa 30 giây
-                                placeholder = st.empty()
-                                countdown_thread = threading.Thread(target=countdown_placeholder, args=(placeholder, max_time))
-                                countdown_thread.start()
-
-                                result_df, patterns_df, summary_df = optimize_cutting(
-                                    df,
-                                    cutting_gap=cutting_gap,
-                                    optimization_method=optimization_method,
-                                    stock_length_options=stock_length_options,
-                                    optimize_stock_length=True
-                                )
-
-                                countdown_thread.join()
-                                placeholder.empty()
-                                elapsed = time.time() - start_time
-                                elapsed_formatted = f"{elapsed:.1f}" if elapsed % 1 != 0 else f"{int(elapsed)}"
-                                st.success(f"✅ Hoàn tất trong {elapsed_formatted} giây")
-                                st.session_state.result_data = (result_df, patterns_df, summary_df, stock_length_options, cutting_gap)
-                                
-                                # Lưu vào lịch sử với tên
-                                save_optimization_history(
-                                    result_df, patterns_df, summary_df, stock_length_options, cutting_gap, optimization_method, name=history_name
+                            st.session_state.job_notice = None
+                            st.session_state.job_messages = []
+                            cache_key = optimization_cache_key(uploaded_hash, cutting_gap, stock_length_options, optimization_method, time_budget)
+                            cached = get_result_cache().get(cache_key) if not use_remnants else None
+                            if cached is not None:
+                                # Cùng tệp và tham số: dùng lại kết quả đã tính, không chạy lại tối ưu
+                                result_df, patterns_df, summary_df, cached_messages, cached_metrics = cached
+                                st.session_state.job_messages = cached_messages
+                                st.session_state.job_notice = ('success', "⚡ Hoàn tất tức thì (dùng lại kết quả đã tính với cùng dữ liệu và tham số)")
+                                history_id = save_optimization_history(
+                                    result_df, patterns_df, summary_df, stock_length_options, cutting_gap, optimization_method,
+                                    name=history_name, metrics=dict(cached_metrics, reused=True)
                                 )
+                                st.session_state.result_data = (result_df, patterns_df, summary_df, stock_length_options, cutting_gap, history_id)
                                 st.rerun()  # Làm mới giao diện để hiển thị lịch sử mới
-                            except Exception as opt_err:
-                                placeholder.empty()
-                                st.error(f"❌ Lỗi tối ưu hóa: {opt_err}")
+                            else:
+                                st.session_state.job_id = start_optimization_job(
+                                    df, cutting_gap, optimization_method, stock_length_options, max_workers, history_name, cache_key, time_budget,
+                                    previous=st.session_state.get('last_result') if incremental else None,
+                                    remnants=remnant_store.load_inventory(df['Mã Thanh'].unique()) if use_remnants else None,
+                                    min_remnant_length=min_remnant_length
+                                )
             except Exception as e:
                 st.error(f"❌ Lỗi xử lý file: {e}")
         else:
             st.info("Vui lòng tải lên tệp Excel để bắt đầu tối ưu hóa.")
 
+        # Tiến độ công việc đang chạy và thông báo của lần chạy gần nhất
+        if st.session_state.job_id:
+            show_job_progress(st.session_state.job_id)
+        for message in st.session_state.get('job_messages') or []:
+            getattr(st, message['level'])(message['message'])
+        if st.session_state.get('job_notice'):
+            level, text = st.session_state.job_notice
+            getattr(st, level)(text)
+
         # Hiển thị kết quả nếu có
         if st.session_state.result_data:
-            result_df, patterns_df, summary_df, stock_length_options, cutting_gap = st.session_state.result_data
+            result_df, patterns_df, summary_df, stock_length_options, cutting_gap, history_id = st.session_state.result_data
 
             st.subheader("📊 Bảng Tổng Hợp Hiệu Suất")
             summary_df_display = summary_df.style.format({
                 'Hiệu Suất Tổng Thể': "{:.1f}%",
                 'Hiệu Suất Trung Bình': "{:.1f}%",
+                'Chênh Lệch Số Thanh (%)': "{:.1f}%",
+                'Chênh Lệch Nguyên Liệu (%)': "{:.1f}%",
                 'Phế Liệu (mm)': lambda x: f"{x:.1f}" if isinstance(x, float) and x % 1 != 0 else f"{int(x)}"
-            })
+            }, na_rep="-")
             st.dataframe(summary_df_display, use_container_width=True)
 
             st.subheader("📋 Danh Sách Mẫu Cắt")
@@ -396,11 +774,10 @@ with tab_cat_nhom:
             st.dataframe(patterns_df_display, use_container_width=True)
 
             st.subheader("📄 Bảng Chi Tiết Mảnh Cắt")
-            result_df = result_df.rename(columns={
+            st.dataframe(result_df.rename(columns={
                 'Item ID': 'Mã Mảnh',
                 'Bar Number': 'Số Thanh'
-            })
-            st.dataframe(result_df, use_container_width=True)
+            }), use_container_width=True)
 
             st.subheader("📊 Mô Phỏng Cắt Từng Thanh")
             if 'current_profile' not in st.session_state:
@@ -413,36 +790,34 @@ with tab_cat_nhom:
                 st.session_state.current_profile = selected_profile
                 st.session_state.page = 0
 
-            filtered = patterns_df[patterns_df['Mã Thanh'] == selected_profile]
-            rows_per_page = 5
-            total_rows = len(filtered)
-            num_pages = (total_rows + rows_per_page - 1) // rows_per_page
+            plan = load_cut_plan(history_id, result_df, patterns_df)
+            rows_per_page = st.selectbox("Số thanh mỗi trang", BAR_PAGE_SIZES, index=1, key="page_size")
+            total_rows = int((plan.bar_profile_codes == selected_profile).sum())
+            num_pages = max(1, (total_rows + rows_per_page - 1) // rows_per_page)
+            st.session_state.page = min(st.session_state.page, num_pages - 1)
 
-            start_idx = st.session_state.page * rows_per_page
-            end_idx = min(start_idx + rows_per_page, total_rows)
-            display_rows = filtered.iloc[start_idx:end_idx]
-
-            for idx, row in display_rows.iterrows():
-                st.markdown(f"**🔹 #{row['Số Thanh']} | {selected_profile} | {int(row['Chiều Dài Thanh'])}mm**")
-                display_pattern(row, cutting_gap)
+            show_bars_page(history_id, plan, selected_profile, st.session_state.page, rows_per_page, cutting_gap)
 
             col1, col2 = st.columns(2)
             with col1:
                 if st.session_state.page > 0:
                     if st.button("Trang trước"):
                         st.session_state.page -= 1
+                        st.rerun()
             with col2:
                 if st.session_state.page < num_pages - 1:
                     if st.button("Trang sau"):
                         st.session_state.page += 1
+                        st.rerun()
 
             st.info(f"Đang hiển thị trang {st.session_state.page + 1}/{num_pages}")
 
-            # Tải xuống kết quả
-            output = io.BytesIO()
-            create_output_excel(output, result_df, patterns_df, summary_df, stock_length_options, cutting_gap)
-            output.seek(0)
-            st.download_button("📥 Tải Xuống File Kết Quả Cắt Nhôm", output, "ket_qua_cat_nhom.xlsx")
+            # Tải xuống kết quả, file chỉ được tạo khi yêu cầu
+            show_export_button(
+                history_id, "📥 Tải Xuống File Kết Quả Cắt Nhôm", "ket_qua_cat_nhom.xlsx",
+                result_df, patterns_df, summary_df, stock_length_options, cutting_gap
+            )
+            show_diagnostics(history_id)
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,126 @@
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+from cutting_optimizer import run_optimization, OPTIMIZATION_METHODS
+import solution_cache
+import remnant_store
+from utils import validate_input_excel, read_order_files, create_output_excel, save_optimization_history
+
+# Chạy tối ưu hàng loạt từ dòng lệnh, không cần Streamlit/Plotly:
+#   python batch_cli.py don_hang/ -o ket_qua/ -s 5800,6000,6500 -g 10 -m "Tối Ưu Linh Hoạt" -w 4
+#   python batch_cli.py don_hang/ --merge   # gộp mọi tệp/sheet, tối ưu chung một lần theo mã thanh
+
+def parse_stock_lengths(text):
+    stock_length_options = [int(x.strip()) for x in text.split(",") if x.strip().isdigit()]
+    if not stock_length_options:
+        raise argparse.ArgumentTypeError("Vui lòng nhập ít nhất một kích thước thanh.")
+    return stock_length_options
+
+def list_order_files(input_dir):
+    """Các tệp .xlsx trong thư mục (bỏ tệp tạm '~$' của Excel), sắp theo tên."""
+    return sorted(
+        os.path.join(input_dir, name) for name in os.listdir(input_dir)
+        if name.lower().endswith('.xlsx') and not name.startswith('~$')
+    )
+
+def process_file(path, output_dir, args):
+    """Tối ưu một tệp đơn hàng và ghi file kết quả; trả về (đường dẫn kết quả, OptimizationResult)."""
+    df = pd.read_excel(path)
+    valid, message = validate_input_excel(df)
+    if not valid:
+        raise ValueError(message)
+    return optimize_order(df, os.path.basename(path), output_dir, args)
+
+def process_merged(paths, output_dir, args):
+    """Gộp mọi tệp (mọi sheet) thành một đơn hàng, tối ưu chung theo mã thanh và ghi một file kết quả."""
+    files = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            files.append((os.path.basename(path), f.read()))
+    df, valid, message = read_order_files(files)
+    if not valid:
+        raise ValueError(message)
+    return optimize_order(df, "gop", output_dir, args)
+
+def optimize_order(df, name, output_dir, args):
+    """Tối ưu một đơn hàng đã kiểm tra và ghi file kết quả ket_qua_<name>.xlsx."""
+    remnants = remnant_store.load_inventory(df['Mã Thanh'].unique(), db_path=args.remnants) if args.remnants else None
+    result = run_optimization(
+        df, args.gap, args.method, args.stock_lengths, max_workers=args.workers, time_budget=args.time_budget,
+        solution_cache_path=args.solution_cache or None, remnants=remnants
+    )
+    if args.remnants:
+        # Các tệp được xử lý lần lượt nên tệp sau dùng được phần dư của tệp trước
+        remnant_store.apply_run(result.used_remnant_ids(), result.offcuts(args.min_remnant_length), source=name, db_path=args.remnants)
+    output_path = os.path.join(output_dir, f"ket_qua_{os.path.splitext(name)[0]}.xlsx")
+    with open(output_path, 'wb') as output:
+        create_output_excel(output, result.result_df, result.patterns_df, result.summary_df, args.stock_lengths, args.gap)
+    if args.save_history:
+        save_optimization_history(
+            result.result_df, result.patterns_df, result.summary_df, args.stock_lengths, args.gap, args.method,
+            name=f"{name} ({time.strftime('%Y-%m-%d %H:%M:%S')})", metrics=result.metrics
+        )
+    return output_path, result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tối ưu cắt nhôm hàng loạt cho mọi tệp đơn hàng .xlsx trong một thư mục.")
+    parser.add_argument("input_dir", help="Thư mục chứa các tệp đơn hàng .xlsx")
+    parser.add_argument("-o", "--output-dir", help="Thư mục ghi file kết quả (mặc định: <input_dir>/ket_qua)")
+    parser.add_argument("-s", "--stock-lengths", type=parse_stock_lengths, default=parse_stock_lengths("5800, 6000, 6200, 6500"),
+                        help="Kích thước thanh (mm, phân cách bằng dấu phẩy)")
+    parser.add_argument("-g", "--gap", type=int, default=10, help="Khoảng cách cắt (mm)")
+    parser.add_argument("-m", "--method", choices=OPTIMIZATION_METHODS, default=OPTIMIZATION_METHODS[0], help="Phương pháp tối ưu")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Số tiến trình giải song song các mã thanh")
+    parser.add_argument("-t", "--time-budget", type=float, help="Giới hạn thời gian mỗi tệp (giây) cho PuLP/Sinh Cột")
+    parser.add_argument("--solution-cache", default=solution_cache.DEFAULT_CACHE_PATH,
+                        help="Tệp SQLite bộ nhớ đệm nghiệm PuLP/Sinh Cột (chuỗi rỗng để tắt)")
+    parser.add_argument("--remnants", help="Tệp SQLite kho phần dư: dùng phần dư trước khi mở thanh mới và lưu phần dư mới sau khi cắt")
+    parser.add_argument("--min-remnant-length", type=float, default=remnant_store.DEFAULT_MIN_REMNANT_LENGTH,
+                        help="Chiều dài tối thiểu (mm) để phần còn lại của thanh được lưu vào kho phần dư")
+    parser.add_argument("--merge", action="store_true", help="Gộp mọi tệp và sheet thành một đơn hàng, tối ưu chung theo mã thanh")
+    parser.add_argument("--save-history", action="store_true", help="Lưu mỗi lần chạy vào lịch sử tối ưu hóa")
+    args = parser.parse_args(argv)
+
+    output_dir = args.output_dir or os.path.join(args.input_dir, "ket_qua")
+    os.makedirs(output_dir, exist_ok=True)
+    files = list_order_files(args.input_dir)
+    if not files:
+        print(f"Không có tệp .xlsx nào trong {args.input_dir}", file=sys.stderr)
+        return 1
+
+    if args.merge:
+        started = time.time()
+        try:
+            output_path, result = process_merged(files, output_dir, args)
+        except Exception as e:
+            print(f"❌ Gộp {len(files)} tệp: {e}", file=sys.stderr)
+            return 1
+        for warning in result.warnings:
+            print(f"⚠️ {warning['message']}", file=sys.stderr)
+        print(f"✅ Gộp {len(files)} tệp: {len(result.patterns_df)} thanh, {len(result.result_df)} đoạn cắt, "
+              f"{time.time() - started:.1f} giây -> {output_path}")
+        return 0
+
+    failures = 0
+    for path in files:
+        started = time.time()
+        try:
+            output_path, result = process_file(path, output_dir, args)
+        except Exception as e:
+            failures += 1
+            print(f"❌ {os.path.basename(path)}: {e}", file=sys.stderr)
+            continue
+        for warning in result.warnings:
+            print(f"⚠️ {os.path.basename(path)}: {warning['message']}", file=sys.stderr)
+        print(f"✅ {os.path.basename(path)}: {len(result.patterns_df)} thanh, {len(result.result_df)} đoạn cắt, "
+              f"{time.time() - started:.1f} giây -> {output_path}")
+
+    print(f"Hoàn tất {len(files) - failures}/{len(files)} tệp.")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
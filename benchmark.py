@@ -0,0 +1,187 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+from cutting_optimizer import run_optimization, OPTIMIZATION_METHODS
+from bounds import profile_lower_bound, gap_percent
+from cut_plan import to_units, to_unit, from_unit
+
+# Bộ đo hiệu năng các phương pháp tối ưu trên đơn hàng sinh ngẫu nhiên có seed:
+#   python benchmark.py --tiers small,medium --output bao_cao.json
+#   python benchmark.py --tiers small --compare bao_cao.json   # báo hồi quy so với lần đo trước
+
+# Quy mô đơn hàng theo số bộ cửa
+SIZE_TIERS = {
+    'small': 20,
+    'medium': 150,
+    'large': 600,
+    'xlarge': 2000,
+}
+
+DEFAULT_STOCK_LENGTHS = [5800, 6000, 6500]
+
+# Họ thanh nhôm: mỗi bộ cửa cắt khung, cánh và đố theo kích thước ô cửa
+PROFILE_FAMILIES = [
+    ('KHUNG', [('H', 0, 2), ('W', 0, 2)]),
+    ('CANH', [('H', -45, 2), ('W', -40, 2)]),
+    ('DO', [('W', -80, 1)]),
+    ('NEP', [('H', -95, 2), ('W', -95, 2)]),
+]
+
+def generate_order(n_doors, seed, series_count=3):
+    """Sinh đơn hàng có seed: mỗi cửa có rộng/cao thực tế, mỗi họ thanh cắt theo kích thước cửa."""
+    rng = random.Random(seed)
+    rows = []
+    for door in range(1, n_doors + 1):
+        series = f"{rng.randint(1, series_count):02d}"
+        width = rng.choice([600, 700, 750, 800, 900, 1000, 1200, 1400, 1600]) + rng.choice([0, 0, 0, 5, 12.5])
+        height = rng.choice([1200, 1400, 1800, 2000, 2100, 2200, 2400, 2700]) + rng.choice([0, 0, 0, 8, 15.5])
+        sets = rng.choice([1, 1, 1, 2, 2, 4])
+        for family, cuts in PROFILE_FAMILIES:
+            if family == 'DO' and width < 900:
+                continue
+            for dimension, offset, count in cuts:
+                base = height if dimension == 'H' else width
+                rows.append({
+                    'Mã Thanh': f"{family}-{series}",
+                    'Chiều Dài': base + offset,
+                    'Số Lượng': count * sets,
+                    'Mã Cửa': f"C{door:04d}"
+                })
+    return pd.DataFrame(rows)
+
+def lower_bounds(df, cutting_gap, stock_length_options):
+    """Cận dưới của cả đơn hàng theo cận của bộ tối ưu (L2 Martello–Toth): (số thanh, tổng nguyên liệu mm)."""
+    bars = stock = 0
+    stock_units = [to_unit(stock_length) for stock_length in stock_length_options]
+    for _, group in df.groupby('Mã Thanh'):
+        group = group.assign(**{'Chiều Dài': to_units(group['Chiều Dài'])})
+        bound = profile_lower_bound(group, to_unit(cutting_gap), stock_units)
+        bars += bound['bars']
+        stock += bound['stock_length']
+    return bars, from_unit(stock)
+
+def run_case(df, method, cutting_gap, stock_length_options, max_workers, measure_memory):
+    started = time.perf_counter()
+    # Tắt bộ nhớ đệm nghiệm để mỗi lần đo đều giải thật
+    result = run_optimization(df, cutting_gap, method, stock_length_options, max_workers=max_workers, solution_cache_path=None)
+    wall_time = time.perf_counter() - started
+
+    peak_memory_mb = None
+    if measure_memory:
+        # Đo bộ nhớ ở lần chạy riêng để tracemalloc không làm sai lệch thời gian
+        tracemalloc.start()
+        try:
+            run_optimization(df, cutting_gap, method, stock_length_options, max_workers=1, solution_cache_path=None)
+            peak_memory_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+
+    summary = result.summary_df
+    bars = len(result.patterns_df)
+    stock_length = float(summary['Tổng Chiều Dài Nguyên Liệu (mm)'].sum()) if not summary.empty else 0.0
+    lower_bound, lower_bound_stock = lower_bounds(df, cutting_gap, stock_length_options)
+    return {
+        'wall_time_s': round(wall_time, 4),
+        'peak_memory_mb': None if peak_memory_mb is None else round(peak_memory_mb, 2),
+        'bars': bars,
+        'pieces': len(result.result_df),
+        'stock_length_mm': stock_length,
+        'waste_mm': float(summary['Phế Liệu (mm)'].sum()) if not summary.empty else 0.0,
+        'lower_bound_bars': lower_bound,
+        'gap_to_lower_bound_pct': round(gap_percent(bars, lower_bound), 3),
+        'lower_bound_stock_mm': lower_bound_stock,
+        'stock_gap_to_lower_bound_pct': round(gap_percent(stock_length, lower_bound_stock), 3),
+        'warnings': len(result.warnings),
+    }
+
+def compare_reports(report, baseline, time_tolerance):
+    """Các hồi quy so với báo cáo trước: chậm hơn quá ngưỡng, hoặc dùng nhiều thanh hơn."""
+    previous = {(r['tier'], r['seed'], r['method']): r for r in baseline.get('results', [])}
+    regressions = []
+    for r in report['results']:
+        old = previous.get((r['tier'], r['seed'], r['method']))
+        if old is None:
+            continue
+        if r['wall_time_s'] > old['wall_time_s'] * (1 + time_tolerance) and r['wall_time_s'] - old['wall_time_s'] > 0.05:
+            regressions.append(f"{r['tier']}/{r['method']}: thời gian {old['wall_time_s']}s -> {r['wall_time_s']}s")
+        if r['bars'] > old['bars']:
+            regressions.append(f"{r['tier']}/{r['method']}: số thanh {old['bars']} -> {r['bars']}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng các phương pháp tối ưu cắt nhôm trên đơn hàng sinh ngẫu nhiên.")
+    parser.add_argument("--tiers", default="small,medium,large", help=f"Quy mô, phân cách bằng dấu phẩy ({', '.join(SIZE_TIERS)})")
+    parser.add_argument("--methods", default=",".join(OPTIMIZATION_METHODS), help="Phương pháp, phân cách bằng dấu phẩy")
+    parser.add_argument("--seeds", default="1", help="Các seed, phân cách bằng dấu phẩy")
+    parser.add_argument("--gap", type=int, default=10, help="Khoảng cách cắt (mm)")
+    parser.add_argument("--stock-lengths", default=",".join(map(str, DEFAULT_STOCK_LENGTHS)), help="Kích thước thanh (mm)")
+    parser.add_argument("--workers", type=int, default=1, help="Số tiến trình giải song song")
+    parser.add_argument("--no-memory", action="store_true", help="Bỏ qua đo bộ nhớ đỉnh (nhanh gấp đôi)")
+    parser.add_argument("--output", default="benchmark_report.json", help="Tệp JSON ghi báo cáo")
+    parser.add_argument("--compare", help="Báo cáo JSON trước đó để phát hiện hồi quy")
+    parser.add_argument("--time-tolerance", type=float, default=0.25, help="Ngưỡng chậm hơn cho phép khi so sánh (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    tiers = [tier.strip() for tier in args.tiers.split(",") if tier.strip()]
+    methods = [method.strip() for method in args.methods.split(",") if method.strip()]
+    for tier in tiers:
+        if tier not in SIZE_TIERS:
+            parser.error(f"Quy mô không hợp lệ: {tier}")
+    for method in methods:
+        if method not in OPTIMIZATION_METHODS:
+            parser.error(f"Phương pháp không hợp lệ: {method}")
+    seeds = [int(seed) for seed in args.seeds.split(",")]
+    stock_length_options = [int(x) for x in args.stock_lengths.split(",")]
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'config': {
+            'cutting_gap': args.gap,
+            'stock_length_options': stock_length_options,
+            'max_workers': args.workers,
+        },
+        'results': [],
+    }
+    for tier in tiers:
+        for seed in seeds:
+            df = generate_order(SIZE_TIERS[tier], seed)
+            for method in methods:
+                metrics = run_case(df, method, args.gap, stock_length_options, args.workers, not args.no_memory)
+                entry = {
+                    'tier': tier, 'seed': seed, 'method': method,
+                    'order_rows': len(df), 'order_pieces': int(df['Số Lượng'].sum()),
+                    'profile_codes': int(df['Mã Thanh'].nunique()),
+                    **metrics
+                }
+                report['results'].append(entry)
+                memory = f"{entry['peak_memory_mb']:.1f} MB" if entry['peak_memory_mb'] is not None else "-"
+                print(f"{tier:>7} seed={seed} {method:<28} {entry['wall_time_s']:>8.3f}s {memory:>10} "
+                      f"{entry['bars']:>6} thanh (cận dưới {entry['lower_bound_bars']}, lệch {entry['gap_to_lower_bound_pct']:.2f}%) "
+                      f"nguyên liệu lệch {entry['stock_gap_to_lower_bound_pct']:.2f}% "
+                      f"phế liệu {entry['waste_mm']:.0f}mm")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Đã ghi báo cáo: {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare_reports(report, json.load(f), args.time_tolerance)
+        for line in regressions:
+            print(f"⚠️ Hồi quy: {line}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+
+from cut_plan import round_up_stock
+
+# Cận dưới cho bài toán cắt một mã thanh. Đoạn cắt chiếm length + cutting_gap trên thanh;
+# đoạn vượt khổ lớn nhất luôn được cắt riêng trên thanh làm tròn lên 100mm nên được cộng thẳng vào cận.
+# Mọi chiều dài tính bằng số nguyên phần mười mm (xem cut_plan.LENGTH_SCALE) nên các phép chia lấy trần là chính xác.
+
+def bar_lower_bounds(sizes, counts, capacity):
+    """Cận L1 (tổng kích thước / khổ) và cận L2 Martello–Toth về số thanh khổ capacity.
+
+    sizes là kích thước đã cộng khoảng cách cắt, mọi kích thước phải <= capacity.
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    capacity = int(capacity)
+    if not len(sizes) or not counts.sum():
+        return 0, 0
+    l1 = -(-int((sizes * counts).sum()) // capacity)
+
+    # L2: với mỗi ngưỡng alpha <= C/2, J1 = {w > C - alpha}, J2 = {C/2 < w <= C - alpha}, J3 = {alpha <= w <= C/2};
+    # mỗi đoạn trong J1 ∪ J2 cần một thanh riêng, J3 chỉ lấp được phần trống của thanh J2
+    half = capacity / 2
+    l2 = 0
+    for alpha in np.concatenate(([0], np.unique(sizes[sizes <= half]))):
+        j1 = sizes > capacity - alpha
+        j2 = (sizes > half) & ~j1
+        j3 = (sizes >= alpha) & (sizes <= half)
+        j2_count = counts[j2].sum()
+        free = int(j2_count) * capacity - int((sizes[j2] * counts[j2]).sum())
+        overflow = int((sizes[j3] * counts[j3]).sum()) - free
+        bound = counts[j1].sum() + j2_count + max(0, -(-overflow // capacity))
+        l2 = max(l2, int(bound))
+    return l1, max(l1, l2)
+
+def min_stock_total(stock_lengths, min_bars, min_total, max_units=5_000_000):
+    """Tổng khổ nhỏ nhất ghép được từ ít nhất min_bars thanh (các khổ trong stock_lengths) và >= min_total.
+
+    Mọi phương án phải có tổng khổ như vậy nên đây là cận dưới về nguyên liệu. Tính bằng quy
+    hoạch động trên bội chung lớn nhất của các khổ; nếu bảng quá lớn thì trả về cận đơn giản.
+    """
+    stock_lengths = sorted(set(int(s) for s in stock_lengths))
+    min_bars = int(min_bars)
+    min_total = int(min_total)
+    simple = max(min_total, min_bars * stock_lengths[0])
+    if min_total <= 0 and min_bars <= 0:
+        return 0
+    unit = math.gcd(*stock_lengths)
+    units = [s // unit for s in stock_lengths]
+    target = max(-(-min_total // unit), min_bars * units[0])
+    # Dùng toàn khổ lớn nhất luôn đạt cả hai điều kiện nên là giới hạn trên của lời giải
+    limit = max(min_bars, -(-target // units[-1])) * units[-1]
+    if limit + 1 > max_units:
+        return simple
+
+    # most[t]: số thanh nhiều nhất có tổng đúng bằng t đơn vị (-1 nếu không ghép được)
+    most = np.full(limit + 1, -1, dtype=np.int64)
+    most[0] = 0
+    for size in units:
+        # Cập nhật theo từng khối độ dài size để phụ thuộc tuần tự vẫn được vector hóa
+        for start in range(size, limit + 1, size):
+            end = min(start + size, limit + 1)
+            previous = most[start - size:end - size]
+            np.maximum(most[start:end], np.where(previous >= 0, previous + 1, -1), out=most[start:end])
+    feasible = np.flatnonzero(most[target:] >= min_bars)
+    return int((target + feasible[0]) * unit) if len(feasible) else simple
+
+def profile_lower_bound(profile_demand, cutting_gap, stock_length_options):
+    """Cận dưới của một mã thanh: dict số thanh (L1, L2) và tổng chiều dài nguyên liệu (phần mười mm).
+
+    Phần dư của thanh vượt khổ (do làm tròn lên 100mm) có thể chứa thêm đoạn nhỏ, nên phần
+    dư này được trừ khỏi tổng kích thước cần xếp trên các thanh thường.
+    """
+    max_stock_length = max(stock_length_options)
+    grouped = profile_demand.groupby('Chiều Dài', sort=False)['Số Lượng'].sum()
+    lengths = grouped.index.to_numpy(dtype=np.int64)
+    counts = grouped.to_numpy(dtype=np.int64)
+    sizes = lengths + cutting_gap
+    fits = sizes <= max_stock_length
+
+    # Đoạn vượt khổ: mỗi đoạn một thanh làm tròn lên, như khi xếp thật
+    oversized_bars = int(counts[~fits].sum())
+    oversized_stocks = np.array([round_up_stock(size) for size in sizes[~fits].tolist()], dtype=np.int64)
+    oversized_stock = int((oversized_stocks * counts[~fits]).sum())
+    oversized_free = oversized_stocks - sizes[~fits]
+    free_total = int((oversized_free * counts[~fits]).sum())
+    max_free = int(oversized_free.max()) if len(oversized_free) else 0
+
+    fit_sizes = sizes[fits]
+    fit_counts = counts[fits]
+    total_size = max(0, int((fit_sizes * fit_counts).sum()) - free_total)
+    l1 = -(-total_size // max_stock_length)
+    # Đoạn lớn hơn mọi phần dư của thanh vượt khổ chỉ xếp được trên thanh thường, nên L2 tính trên các đoạn đó
+    large = fit_sizes > max_free
+    l2 = max(l1, bar_lower_bounds(fit_sizes[large], fit_counts[large], max_stock_length)[1])
+    stock = min_stock_total(stock_length_options, l2, total_size) if l2 else 0
+    return {
+        'l1': l1 + oversized_bars,
+        'bars': l2 + oversized_bars,
+        'stock_length': stock + oversized_stock,
+        'fitting_bars': l2,
+        'oversized_stock_length': oversized_stock,
+        # Có đoạn xếp được vào phần dư của thanh vượt khổ: cận chỉ tính trên thanh thường (như cận LP) không còn hợp lệ
+        'oversized_slack_usable': bool((fit_sizes <= max_free).any())
+    }
+
+def gap_percent(value, bound):
+    """Chênh lệch (%) của nghiệm so với cận dưới."""
+    return (value - bound) / bound * 100 if bound else 0.0
@@ -0,0 +1,211 @@
+import numpy as np
+import pandas as pd
+
+# Bên trong bộ tối ưu và CutPlan, mọi chiều dài, khoảng cách cắt và khổ thanh là số nguyên phần mười
+# milimét: so sánh và cộng dồn chính xác, chỉ quy đổi ra mm khi dựng bảng kết quả.
+LENGTH_SCALE = 10
+OVERSIZE_STEP = 100 * LENGTH_SCALE  # Đoạn vượt khổ lớn nhất được cắt trên thanh làm tròn lên bội 100mm
+
+def to_units(values):
+    """Quy đổi mảng chiều dài (mm) sang số nguyên phần mười mm."""
+    return np.rint(np.asarray(values, dtype=float) * LENGTH_SCALE).astype(np.int64)
+
+def to_unit(value):
+    """Quy đổi một chiều dài (mm) sang số nguyên phần mười mm."""
+    return int(round(float(value) * LENGTH_SCALE))
+
+def from_units(units):
+    """Cột chiều dài mm từ số nguyên phần mười mm: kiểu int nếu toàn mm nguyên, ngược lại float 1 chữ số thập phân."""
+    units = np.asarray(units, dtype=np.int64)
+    if not (units % LENGTH_SCALE).any():
+        return units // LENGTH_SCALE
+    return units / LENGTH_SCALE
+
+def from_unit(value):
+    """Một chiều dài mm từ số phần mười mm: int nếu là mm nguyên, ngược lại float."""
+    return int(value) // LENGTH_SCALE if value % LENGTH_SCALE == 0 else value / LENGTH_SCALE
+
+def round_up_stock(required):
+    """Khổ thanh (phần mười mm) cho đoạn vượt khổ: làm tròn lên bội 100mm."""
+    return -(-int(required) // OVERSIZE_STEP) * OVERSIZE_STEP
+
+def length_texts(units):
+    """Chuỗi hiển thị cho từng chiều dài (phần mười mm): '3170' với mm nguyên, '3170.5' với số lẻ."""
+    whole, tenths = np.divmod(np.asarray(units, dtype=np.int64), LENGTH_SCALE)
+    return [str(w) if t == 0 else f"{w}.{t}" for w, t in zip(whole.tolist(), tenths.tolist())]
+
+class CutPlan:
+    """Phương án cắt dạng mảng NumPy.
+
+    Mỗi thanh có mã thanh, số thanh, khổ thanh, phần còn lại và ghi chú. Chiều dài lưu bằng số
+    nguyên phần mười mm (LENGTH_SCALE), bảng kết quả quy đổi ra mm. Các mảnh cắt của
+    thanh i nằm liên tiếp trong piece_lengths[piece_offsets[i]:piece_offsets[i + 1]], kèm mã
+    mảnh (None nếu mảnh không gán được) và mã cửa. Bảng kết quả và chuỗi 'Mẫu Cắt' chỉ được
+    dựng theo cột khi cần.
+    """
+
+    def __init__(self, bar_profile_codes, bar_numbers, bar_stock_lengths, bar_remaining, bar_notes,
+                 piece_offsets, piece_lengths, piece_item_ids, piece_door_codes=None):
+        self.bar_profile_codes = np.asarray(bar_profile_codes, dtype=object)
+        self.bar_numbers = np.asarray(bar_numbers, dtype=np.int64)
+        self.bar_stock_lengths = np.asarray(bar_stock_lengths, dtype=np.int64)
+        self.bar_remaining = np.asarray(bar_remaining, dtype=np.int64)
+        self.bar_notes = np.asarray(bar_notes, dtype=object)
+        self.piece_offsets = np.asarray(piece_offsets, dtype=np.int64)
+        self.piece_lengths = np.asarray(piece_lengths, dtype=np.int64)
+        self.piece_item_ids = np.asarray(piece_item_ids, dtype=object)
+        self.piece_door_codes = None if piece_door_codes is None else np.asarray(piece_door_codes, dtype=object)
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], [], [], [0], [], [])
+
+    @classmethod
+    def from_bars(cls, profile_code, patterns, remaining_lengths, stock_lengths, notes, item_ids, door_codes=None):
+        """Dựng phương án của một mã thanh từ danh sách mẫu cắt (mỗi thanh một list chiều dài, phần mười mm)."""
+        counts = [len(pattern) for pattern in patterns]
+        offsets = np.zeros(len(patterns) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        piece_lengths = [length for pattern in patterns for length in pattern]
+        return cls(
+            [profile_code] * len(patterns), np.arange(1, len(patterns) + 1), stock_lengths, remaining_lengths, notes,
+            offsets, piece_lengths, item_ids, door_codes
+        )
+
+    @classmethod
+    def concat(cls, plans):
+        plans = [plan for plan in plans if plan.n_bars]
+        if not plans:
+            return cls.empty()
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for plan in plans:
+            offsets.append(plan.piece_offsets[1:] + base)
+            base += plan.n_pieces
+        has_door_code = any(plan.piece_door_codes is not None for plan in plans)
+        return cls(
+            np.concatenate([plan.bar_profile_codes for plan in plans]),
+            np.concatenate([plan.bar_numbers for plan in plans]),
+            np.concatenate([plan.bar_stock_lengths for plan in plans]),
+            np.concatenate([plan.bar_remaining for plan in plans]),
+            np.concatenate([plan.bar_notes for plan in plans]),
+            np.concatenate(offsets),
+            np.concatenate([plan.piece_lengths for plan in plans]),
+            np.concatenate([plan.piece_item_ids for plan in plans]),
+            np.concatenate([
+                plan.piece_door_codes if plan.piece_door_codes is not None else np.full(plan.n_pieces, None, dtype=object)
+                for plan in plans
+            ]) if has_door_code else None
+        )
+
+    @classmethod
+    def from_frames(cls, result_df, patterns_df):
+        """Dựng lại phương án từ result_df/patterns_df (ví dụ kết quả trong lịch sử) mà không tách chuỗi 'Mẫu Cắt'."""
+        if patterns_df.empty:
+            return cls.empty()
+        bar_keys = pd.MultiIndex.from_arrays([patterns_df['Mã Thanh'], patterns_df['Số Thanh']])
+        if result_df.empty:
+            piece_bars = np.zeros(0, dtype=np.int64)
+        else:
+            piece_bars = bar_keys.get_indexer(pd.MultiIndex.from_arrays([result_df['Mã Thanh'], result_df['Số Thanh']]))
+        keep = np.flatnonzero(piece_bars >= 0)
+        order = keep[np.argsort(piece_bars[keep], kind='stable')]
+        offsets = np.zeros(len(patterns_df) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(piece_bars[order], minlength=len(patterns_df)), out=offsets[1:])
+        notes = patterns_df['Ghi Chú'].fillna('') if 'Ghi Chú' in patterns_df.columns else [''] * len(patterns_df)
+        return cls(
+            patterns_df['Mã Thanh'].to_numpy(), patterns_df['Số Thanh'].to_numpy(),
+            to_units(patterns_df['Chiều Dài Thanh']), to_units(patterns_df['Chiều Dài Còn Lại']), notes,
+            offsets,
+            to_units(result_df['Chiều Dài'].to_numpy()[order]) if len(order) else np.zeros(0, dtype=np.int64),
+            result_df['Item ID'].to_numpy()[order] if len(order) else [],
+            result_df['Mã Cửa'].to_numpy()[order] if 'Mã Cửa' in result_df.columns else None
+        )
+
+    @property
+    def n_bars(self):
+        return len(self.bar_numbers)
+
+    @property
+    def n_pieces(self):
+        return len(self.piece_lengths)
+
+    def bar_piece_counts(self):
+        return np.diff(self.piece_offsets)
+
+    def bar_pieces(self, index):
+        return self.piece_lengths[self.piece_offsets[index]:self.piece_offsets[index + 1]]
+
+    def piece_bar_index(self):
+        return np.repeat(np.arange(self.n_bars), self.bar_piece_counts())
+
+    def bar_used_lengths(self):
+        """Tổng chiều dài các mảnh trên từng thanh (phần mười mm, không tính khoảng cách cắt)."""
+        sums = np.zeros(self.n_bars, dtype=np.int64)
+        np.add.at(sums, self.piece_bar_index(), self.piece_lengths)
+        return sums
+
+    def bar_efficiency(self):
+        stock = self.bar_stock_lengths.astype(float)
+        used = self.bar_used_lengths().astype(float)
+        efficiency = np.divide(used, stock, out=np.zeros(self.n_bars), where=stock > 0) * 100
+        return np.clip(efficiency, 0, 100)
+
+    def pattern_strings(self):
+        """Chuỗi 'Mẫu Cắt' ('+' nối các mảnh) của từng thanh."""
+        texts = length_texts(self.piece_lengths)
+        offsets = self.piece_offsets.tolist()
+        return ['+'.join(texts[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def take(self, bar_order):
+        """Phương án mới với các thanh theo thứ tự bar_order (mảnh đi theo thanh)."""
+        bar_order = np.asarray(bar_order, dtype=np.int64)
+        counts = self.bar_piece_counts()[bar_order]
+        offsets = np.zeros(len(bar_order) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        starts = self.piece_offsets[bar_order]
+        piece_index = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+        return CutPlan(
+            self.bar_profile_codes[bar_order], self.bar_numbers[bar_order], self.bar_stock_lengths[bar_order],
+            self.bar_remaining[bar_order], self.bar_notes[bar_order], offsets,
+            self.piece_lengths[piece_index], self.piece_item_ids[piece_index],
+            None if self.piece_door_codes is None else self.piece_door_codes[piece_index]
+        )
+
+    def sorted(self):
+        """Sắp xếp thanh theo (mã thanh, số thanh), giữ nguyên thứ tự mảnh trong mỗi thanh."""
+        code_rank, _ = pd.factorize(pd.Series(self.bar_profile_codes), sort=True)
+        return self.take(np.lexsort((self.bar_numbers, code_rank)))
+
+    def select_profile(self, profile_code):
+        return self.take(np.flatnonzero(self.bar_profile_codes == profile_code))
+
+    def to_patterns_df(self):
+        if not self.n_bars:
+            return pd.DataFrame()
+        return pd.DataFrame({
+            'Mã Thanh': self.bar_profile_codes,
+            'Số Thanh': self.bar_numbers,
+            'Chiều Dài Thanh': from_units(self.bar_stock_lengths),
+            'Chiều Dài Sử Dụng': from_units(self.bar_used_lengths()),
+            'Chiều Dài Còn Lại': from_units(self.bar_remaining),
+            'Hiệu Suất': self.bar_efficiency(),
+            'Mẫu Cắt': self.pattern_strings(),
+            'Số Đoạn Cắt': self.bar_piece_counts(),
+            'Ghi Chú': self.bar_notes
+        })
+
+    def to_result_df(self):
+        assigned = np.flatnonzero(pd.notna(self.piece_item_ids)) if self.n_pieces else np.zeros(0, dtype=np.int64)
+        if not len(assigned):
+            return pd.DataFrame()
+        bar_index = self.piece_bar_index()[assigned]
+        columns = {
+            'Mã Thanh': self.bar_profile_codes[bar_index],
+            'Item ID': self.piece_item_ids[assigned],
+            'Chiều Dài': from_units(self.piece_lengths[assigned]),
+            'Số Thanh': self.bar_numbers[bar_index]
+        }
+        if self.piece_door_codes is not None:
+            columns['Mã Cửa'] = self.piece_door_codes[assigned]
+        return pd.DataFrame(columns)
@@ -1,10 +1,33 @@
 import pandas as pd
-import streamlit as st
-import io
-import openpyxl
-from openpyxl.styles import PatternFill
-from pulp import LpMinimize, LpProblem, LpVariable, lpSum, PULP_CBC_CMD
+import logging
+from pulp import LpMinimize, LpProblem, LpVariable, LpAffineExpression, lpSum, PULP_CBC_CMD, LpStatus, LpSolutionIntegerFeasible
 import math
+import hashlib
+import time
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from bisect import bisect_left
+from sortedcontainers import SortedList
+from cut_plan import CutPlan, LENGTH_SCALE, to_units, to_unit, from_units, from_unit, round_up_stock
+from bounds import profile_lower_bound, min_stock_total, gap_percent
+import solution_cache
+
+logger = logging.getLogger(__name__)
+
+# Các phương pháp tối ưu được hỗ trợ (tên hiển thị trên giao diện và dùng trong CLI)
+OPTIMIZATION_METHODS = ["Tối Ưu Hiệu Suất Cao Nhất", "Tối Ưu Số Lượng Thanh", "Tối Ưu Linh Hoạt", "Tối Ưu PuLP", "Tối Ưu Sinh Cột"]
+
+MILP_MAX_NODES = 500  # Giới hạn nút nhánh cận của MILP sinh cột khi không đặt giới hạn thời gian
+PULP_MAX_NODES = 200  # Giới hạn nút nhánh cận của mô hình PuLP liệt kê mẫu
+
+# Cột truy vết nguồn của đơn hàng gộp từ nhiều tệp/sheet (xem utils.read_order_files)
+SOURCE_COLUMNS = ['Tệp Nguồn', 'Sheet']
+
+# Chế độ giới hạn thời gian chỉ áp dụng cho các phương pháp gọi CBC
+ANYTIME_METHODS = ["Tối Ưu PuLP", "Tối Ưu Sinh Cột"]
+MIN_IMPROVE_SECONDS = 1.0     # Thời gian còn lại tối thiểu để bắt đầu giải một mã thanh hoặc gọi CBC
+DEADLINE_GRACE_SECONDS = 0.5  # Thời gian chờ thêm sau hạn chót để CBC trả nghiệm đang có
 
 def validate_input_excel(df):
     required_columns = ["Mã Thanh", "Chiều Dài", "Số Lượng"]
@@ -48,407 +71,1372 @@ def create_accessory_summary(input_df, output_stream):
 
     return grouped
 
-def optimize_with_pulp(profile_data, cutting_gap, stock_length_options):
-    """Tối ưu hóa cắt nhôm bằng PuLP với giới hạn số mẫu cắt và số đoạn cắt tối đa."""
-    lengths = profile_data['Chiều Dài'].values
-    quantities = [1] * len(lengths)  # Mỗi mục đã được mở rộng theo số lượng
-    item_ids = profile_data['Item ID'].values
-    profile_code = profile_data['Mã Thanh'].iloc[0]
-    has_door_code = "Mã Cửa" in profile_data.columns
-    max_cuts_per_pattern = 8  # Số đoạn cắt tối đa mỗi mẫu
-    total_items = len(lengths)
-    max_patterns = min(10000 + 50 * total_items, 20000)  # Giới hạn động dựa trên số mục
-    max_stock_length = max(stock_length_options)
+class OptimizationCancelled(Exception):
+    """Người dùng hủy lần tối ưu hóa đang chạy."""
 
-    # Tạo danh sách mẫu cắt khả thi
-    patterns = []
-    pattern_count = 0
-
-    for stock_length in stock_length_options:
-        def generate_patterns(current_pattern, remaining_length, index):
-            nonlocal pattern_count
-            if pattern_count >= max_patterns or len(current_pattern) >= max_cuts_per_pattern:
-                return
-            if index >= len(lengths):
-                if current_pattern:
-                    # Kiểm tra tổng chiều dài các đoạn cắt
-                    used_length = sum(lengths[idx] for idx in current_pattern)
-                    total_required = used_length + (len(current_pattern) - 1) * cutting_gap
-                    selected_stock_length = stock_length
-                    if total_required > stock_length:
-                        # Chọn khổ lớn nhất khả thi trong stock_length_options, không làm tròn
-                        selected_stock_length = max([sl for sl in stock_length_options if sl >= total_required], default=max_stock_length)
-                    efficiency = used_length / selected_stock_length if selected_stock_length > 0 else 0
-                    if efficiency >= 0.7:  # Chỉ giữ mẫu có hiệu suất >= 70%
-                        patterns.append((current_pattern[:], selected_stock_length))
-                        pattern_count += 1
-                return
-            length = lengths[index]
-            if length > max_stock_length:
-                # Làm tròn lên khổ thanh đủ lớn cho đoạn cắt đơn lẻ
-                selected_stock_length = math.ceil((length + cutting_gap) / 100) * 100
-                st.warning(f"Đoạn cắt {length}mm cho {profile_code} vượt khổ lớn nhất ({max_stock_length}mm). Đã làm tròn lên {selected_stock_length}mm.")
-                current_pattern.append(index)
-                patterns.append(([index], selected_stock_length))
-                pattern_count += 1
-                return
-            if length <= remaining_length - cutting_gap:
-                current_pattern.append(index)
-                generate_patterns(current_pattern, remaining_length - length - cutting_gap, index + 1)
-                current_pattern.pop()
-            generate_patterns(current_pattern, remaining_length, index + 1)
-
-        generate_patterns([], stock_length, 0)
-        if pattern_count >= max_patterns:
-            st.warning(f"Đạt giới hạn {max_patterns} mẫu cắt cho {profile_code}. Một số mẫu có thể bị bỏ sót. Hãy thử phương pháp 'Tối Ưu Linh Hoạt' hoặc chia nhỏ dữ liệu.")
-            break
+class OptimizationResult:
+    """Kết quả tối ưu hóa: ba bảng kết quả, phương án cắt dạng mảng và danh sách cảnh báo."""
 
-    # Kiểm tra nếu không có mẫu cắt nào được tạo
-    if not patterns:
-        st.error(f"Không tạo được mẫu cắt nào cho {profile_code}. Vui lòng kiểm tra dữ liệu hoặc tăng khổ thanh lớn nhất.")
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
-
-    # Tạo mô hình PuLP
-    prob = LpProblem(f"Cutting_Stock_{profile_code}", LpMinimize)
-    
-    # Biến quyết định: số lần sử dụng mỗi mẫu cắt
-    pattern_vars = LpVariable.dicts("Pattern", range(len(patterns)), lowBound=0, cat='Integer')
-    
-    # Hàm mục tiêu: tối thiểu hóa số thanh sử dụng
-    prob += lpSum(pattern_vars[i] for i in range(len(patterns)))
-    
-    # Ràng buộc: đáp ứng số lượng yêu cầu cho mỗi chiều dài
-    for j in range(len(lengths)):
-        prob += lpSum(
-            sum(1 for idx in patterns[i][0] if idx == j) * pattern_vars[i]
-            for i in range(len(patterns))
-        ) >= quantities[j], f"Demand_{j}"
-    
-    # Giải bài toán
-    prob.solve(PULP_CBC_CMD(msg=False, timeLimit=30))  # Giới hạn thời gian giải 30 giây
-    
-    # Xử lý kết quả
-    patterns_data = []
-    results = []
-    bar_number = 1
-    stock_lengths_used = []
-    remaining_lengths = []
-    
-    for i in range(len(patterns)):
-        if pattern_vars[i].varValue and pattern_vars[i].varValue > 0:
-            pattern_indices, stock_length = patterns[i]
-            used_length = sum(lengths[idx] for idx in pattern_indices)
-            remaining = stock_length - used_length - (len(pattern_indices) - 1) * cutting_gap
-            efficiency = used_length / stock_length if stock_length > 0 else 0
-            note = ''
-            if stock_length > max_stock_length:
-                note = f"Khổ thanh làm tròn lên {stock_length}mm do đoạn cắt vượt khổ lớn nhất ({max_stock_length}mm)"
-            
-            pattern_rounded = [round(lengths[idx], 1) if lengths[idx] % 1 != 0 else int(lengths[idx]) for idx in pattern_indices]
-            patterns_data.append({
-                'Mã Thanh': profile_code,
-                'Số Thanh': bar_number,
-                'Chiều Dài Thanh': stock_length,
-                'Chiều Dài Sử Dụng': used_length,
-                'Chiều Dài Còn Lại': remaining,
-                'Hiệu Suất': efficiency,
-                'Mẫu Cắt': '+'.join(map(str, pattern_rounded)),
-                'Số Đoạn Cắt': len(pattern_indices),
-                'Ghi Chú': note
-            })
-            stock_lengths_used.append(stock_length)
-            remaining_lengths.append(remaining)
-            
-            # Gán mảnh cắt
-            for idx in pattern_indices:
-                result_item = {
-                    'Mã Thanh': profile_code,
-                    'Item ID': item_ids[idx],
-                    'Chiều Dài': lengths[idx],
-                    'Số Thanh': bar_number
-                }
-                if has_door_code:
-                    result_item['Mã Cửa'] = profile_data.iloc[idx]['Mã Cửa']
-                results.append(result_item)
-            
-            bar_number += 1
-    
-    patterns_df = pd.DataFrame(patterns_data)
-    result_df = pd.DataFrame(results)
-    
-    # Tạo summary_df
-    total_bars = len(patterns_data)
-    total_length_needed = sum(lengths)
-    total_length_used = sum(p['Chiều Dài Thanh'] for p in patterns_data)
-    avg_efficiency = sum(p['Hiệu Suất'] for p in patterns_data) / len(patterns_data) if patterns_data else 0
-    overall_efficiency = (total_length_needed / total_length_used if total_length_used > 0 else 0) * 100
-    waste = total_length_used - total_length_needed - (len(lengths) - total_bars) * cutting_gap
-
-    summary_df = pd.DataFrame([{
+    def __init__(self, result_df, patterns_df, summary_df, plan, warnings, metrics=None, profile_outputs=None):
+        self.result_df = result_df
+        self.patterns_df = patterns_df
+        self.summary_df = summary_df
+        self.plan = plan
+        # Mỗi cảnh báo là dict {'level': 'warning'|'error', 'message': ..., 'profile_code': ... hoặc None}
+        self.warnings = warnings
+        # Chỉ số hiệu năng: {'phases': thời gian từng giai đoạn toàn bộ, 'profiles': list dict theo mã thanh}
+        self.metrics = metrics if metrics is not None else {'phases': {}, 'profiles': []}
+        # Kết quả từng mã thanh theo dấu vân tay (profile_fingerprint), dùng lại ở lần chạy sau
+        self.profile_outputs = profile_outputs if profile_outputs is not None else {}
+
+    def frames(self):
+        return self.result_df, self.patterns_df, self.summary_df
+
+    def used_remnant_ids(self):
+        """Mã các phần dư tồn kho đã dùng trong phương án."""
+        return [remnant_id for metrics in self.metrics['profiles'] for remnant_id in metrics.get('remnants_used') or []]
+
+    def offcuts(self, min_length):
+        """Phần dư mới [(mã thanh, chiều dài)] sau khi cắt: phần còn lại của mỗi thanh từ min_length (mm) trở lên."""
+        keep = self.plan.bar_remaining >= to_unit(min_length)
+        return list(zip(self.plan.bar_profile_codes[keep].tolist(), (self.plan.bar_remaining[keep] / LENGTH_SCALE).tolist()))
+
+def _report(messages, level, text, profile_code=None):
+    """Ghi cảnh báo dạng dict vào messages; không có danh sách nhận thì ghi log."""
+    message = {'level': level, 'message': text, 'profile_code': profile_code}
+    if messages is None:
+        logger.log(logging.ERROR if level == 'error' else logging.WARNING, text)
+    else:
+        messages.append(message)
+
+def build_demand(df):
+    """Gom nhu cầu theo nhóm (Mã Thanh, Chiều Dài, Mã Cửa, tệp/sheet nguồn nếu có) kèm số lượng, không mở rộng từng mảnh."""
+    group_columns = ['Mã Thanh', 'Chiều Dài']
+    if "Mã Cửa" in df.columns:
+        group_columns.append('Mã Cửa')
+    group_columns.extend(column for column in SOURCE_COLUMNS if column in df.columns)
+    demand = df[group_columns].copy()
+    demand['Số Lượng'] = df['Số Lượng'].astype(int)
+    demand = demand[demand['Số Lượng'] > 0]
+    demand = demand.groupby(group_columns, sort=False, dropna=False)['Số Lượng'].sum().reset_index()
+    return demand
+
+def expand_lengths(profile_demand):
+    """Trả về mảng chiều dài từng mảnh (phần mười mm, không tạo dict) theo số lượng của mỗi nhóm."""
+    return np.repeat(profile_demand['Chiều Dài'].to_numpy(dtype=np.int64), profile_demand['Số Lượng'].to_numpy(dtype=int))
+
+def expand_items(profile_demand):
+    """Mở rộng nhu cầu của một mã thanh thành từng mảnh có Item ID, chỉ gọi khi cần dựng result_df."""
+    profile_code = profile_demand['Mã Thanh'].iloc[0]
+    counts = profile_demand['Số Lượng'].to_numpy(dtype=int)
+    profile_data = profile_demand.loc[profile_demand.index.repeat(counts)].drop(columns=['Số Lượng'])
+    # Đánh số liên tục trong cả mã thanh để Item ID không bị trùng giữa các dòng nhập
+    profile_data['Item ID'] = [f"{profile_code}_{i + 1}" for i in range(len(profile_data))]
+    return profile_data.reset_index(drop=True)
+
+def build_length_queues(lengths):
+    """Tạo hàng đợi vị trí mảnh chưa gán theo từng chiều dài để gán mảnh vào thanh trong O(1)."""
+    queues = {}
+    for item_idx, length in enumerate(lengths):
+        queues.setdefault(length, deque()).append(item_idx)
+    return queues
+
+def build_profile_results(profile_code, profile_demand, patterns, remaining_lengths, stock_lengths_used, cutting_gap, max_stock_length):
+    """Dựng phương án cắt (CutPlan) và dòng tổng hợp cho một mã thanh từ danh sách thanh đã xếp.
+
+    Chiều dài đầu vào tính bằng phần mười mm; dòng tổng hợp quy đổi ra mm.
+    """
+    has_door_code = "Mã Cửa" in profile_demand.columns
+
+    # Chỉ mở rộng từng mảnh khi gán vào kết quả
+    profile_data = expand_items(profile_demand)
+    item_ids = profile_data['Item ID'].to_numpy()
+    door_codes = profile_data['Mã Cửa'].to_numpy() if has_door_code else None
+    unassigned = build_length_queues(profile_data['Chiều Dài'].tolist())
+    piece_items = []
+    for pattern in patterns:
+        for length in pattern:
+            queue = unassigned.get(length)
+            piece_items.append(queue.popleft() if queue else -1)
+
+    # Mảnh không gán được (không xảy ra khi mẫu cắt khớp nhu cầu) có mã mảnh None
+    piece_items = np.asarray(piece_items, dtype=np.int64)
+    assigned = piece_items >= 0
+    piece_item_ids = np.full(len(piece_items), None, dtype=object)
+    piece_item_ids[assigned] = item_ids[piece_items[assigned]]
+    piece_door_codes = None
+    if has_door_code:
+        piece_door_codes = np.full(len(piece_items), None, dtype=object)
+        piece_door_codes[assigned] = door_codes[piece_items[assigned]]
+
+    notes = [
+        f"Khổ thanh làm tròn lên {from_unit(stock_length)}mm do đoạn cắt vượt khổ lớn nhất ({from_unit(max_stock_length)}mm)" if stock_length > max_stock_length else ''
+        for stock_length in stock_lengths_used
+    ]
+    plan = CutPlan.from_bars(profile_code, patterns, remaining_lengths, stock_lengths_used, notes, piece_item_ids, piece_door_codes)
+
+    total_pieces = len(profile_data)
+    total_bars = plan.n_bars
+    length_needed = int(profile_data['Chiều Dài'].sum())
+    length_used = int(sum(stock_lengths_used))
+    avg_efficiency = sum(plan.bar_efficiency().tolist()) / total_bars if total_bars else 0
+    overall_efficiency = (length_needed / length_used if length_used > 0 else 0) * 100
+    overall_efficiency = max(0, min(100, overall_efficiency))
+    avg_efficiency = max(0, min(100, avg_efficiency))
+    # Tính trên số nguyên rồi mới quy đổi ra mm nên phế liệu không có sai số dấu phẩy động
+    waste = length_used - length_needed - (total_pieces - total_bars) * cutting_gap
+    total_length_needed = from_unit(length_needed)
+    total_length_used = from_unit(length_used)
+
+    summary = {
         'Mã Thanh': profile_code,
-        'Tổng Đoạn Cắt': len(lengths),
+        'Tổng Đoạn Cắt': total_pieces,
         'Số Thanh Sử Dụng': total_bars,
         'Tổng Chiều Dài Cần (mm)': total_length_needed,
         'Tổng Chiều Dài Nguyên Liệu (mm)': total_length_used,
-        'Phế Liệu (mm)': waste,
+        'Phế Liệu (mm)': from_unit(waste),
         'Hiệu Suất Tổng Thể': overall_efficiency,
         'Hiệu Suất Trung Bình': avg_efficiency
-    }])
-    
-    return result_df, patterns_df, summary_df
+    }
+    return plan, summary
+
+def _length_unit(values):
+    """Ước chung lớn nhất của các kích thước nguyên: chia cho nó để bảng quy hoạch động nhỏ nhất mà vẫn chính xác."""
+    return math.gcd(*(int(v) for v in values))
+
+def _price_patterns(sizes, demands, duals, capacities):
+    """Bài toán con knapsack bị chặn: tìm mẫu cắt có tổng giá trị đối ngẫu lớn nhất cho từng khổ thanh.
+
+    sizes là kích thước nguyên (đã cộng khoảng cách cắt), capacities là các khổ thanh nguyên.
+    Trả về dict {khổ thanh: (giá trị, số lượng mỗi chiều dài)} dùng chung một bảng quy hoạch động.
+    """
+    max_capacity = max(capacities)
+    best = np.zeros(max_capacity + 1)
+    # Tách số lượng tối đa thành các gói lũy thừa 2 để đưa về knapsack 0/1
+    chunks = []
+    for j, (size, demand, dual) in enumerate(zip(sizes, demands, duals)):
+        if dual <= 0 or size > max_capacity:
+            continue
+        multiplicity = min(int(demand), max_capacity // size)
+        k = 1
+        while multiplicity > 0:
+            take = min(k, multiplicity)
+            chunks.append((j, take))
+            multiplicity -= take
+            k *= 2
+    taken = np.zeros((len(chunks), max_capacity + 1), dtype=bool)
+    for c, (j, take) in enumerate(chunks):
+        weight = sizes[j] * take
+        candidate = best[:-weight] + duals[j] * take
+        improved = candidate > best[weight:] + 1e-12
+        taken[c, weight:] = improved
+        best[weight:] = np.where(improved, candidate, best[weight:])
+
+    priced = {}
+    for capacity in capacities:
+        counts = [0] * len(sizes)
+        remaining = capacity
+        for c in range(len(chunks) - 1, -1, -1):
+            if taken[c, remaining]:
+                j, take = chunks[c]
+                counts[j] += take
+                remaining -= sizes[j] * take
+        priced[capacity] = (best[capacity], counts)
+    return priced
+
+def _distinct_demand(profile_demand, cutting_gap, max_stock_length):
+    """Gom nhu cầu theo chiều dài phân biệt (giảm dần) và tách riêng các đoạn vượt khổ lớn nhất.
+
+    Trả về (chiều dài phân biệt, nhu cầu tương ứng, danh sách thanh cắt riêng cho đoạn vượt khổ).
+    """
+    grouped = profile_demand.groupby('Chiều Dài', sort=False)['Số Lượng'].sum()
+    grouped = grouped.sort_index(ascending=False)
+    distinct_lengths = grouped.index.to_numpy(dtype=np.int64)
+    demands = grouped.to_numpy(dtype=int)
+
+    # Đoạn cắt vượt khổ lớn nhất được cắt riêng trên thanh làm tròn lên, như các chế độ khác
+    oversized_bars = []
+    fits = distinct_lengths + cutting_gap <= max_stock_length
+    for length, demand in zip(distinct_lengths[~fits], demands[~fits]):
+        selected_stock_length = round_up_stock(length + cutting_gap)
+        oversized_bars.extend([([int(length)], selected_stock_length)] * int(demand))
+    return distinct_lengths[fits], demands[fits], oversized_bars
+
+def _expand_pattern_usage(columns, usage, distinct_lengths, demands, stock_lengths, cutting_gap):
+    """Mở rộng nghiệm (mẫu cắt, số lần dùng) thành từng thanh, bỏ các mảnh dư vượt nhu cầu."""
+    bars = []
+    remaining_demand = [int(d) for d in demands]
+    for (counts, stock_length), n in sorted(zip(columns, usage), key=lambda item: -item[0][1]):
+        for _ in range(int(n)):
+            pattern = []
+            for j, count in enumerate(counts):
+                take = min(count, remaining_demand[j])
+                remaining_demand[j] -= take
+                pattern.extend([int(distinct_lengths[j])] * take)
+            if not pattern:
+                continue
+            # Chọn khổ nhỏ nhất đủ chứa mẫu sau khi bỏ mảnh dư
+            required = sum(length + cutting_gap for length in pattern)
+            selected_stock_length = next((sl for sl in stock_lengths if sl >= required), stock_length)
+            bars.append((pattern, selected_stock_length))
+    return bars
+
+def _bars_to_plan(profile_code, profile_demand, bars, cutting_gap, max_stock_length, metrics=None):
+    """Chuyển danh sách (mẫu cắt, khổ thanh) thành CutPlan và dòng tổng hợp của một mã thanh."""
+    phase_start = time.perf_counter()
+    patterns = [pattern for pattern, _ in bars]
+    stock_lengths_used = [stock_length for _, stock_length in bars]
+    remaining_lengths = [stock_length - sum(length + cutting_gap for length in pattern) for pattern, stock_length in bars]
+    plan, summary = build_profile_results(
+        profile_code, profile_demand, patterns, remaining_lengths, stock_lengths_used, cutting_gap, max_stock_length
+    )
+    if metrics is not None:
+        metrics['assign_s'] = time.perf_counter() - phase_start
+    return plan, [summary]
+
+def _enumerate_maximal_patterns(sizes, limits, capacity, max_cuts, max_patterns, deadline=None):
+    """Liệt kê các mẫu cắt tối đại theo chiều dài phân biệt với số lượng bị chặn.
+
+    Mẫu là tối đại khi không thể thêm mảnh nào còn nhu cầu (đủ chỗ và chưa vượt số đoạn cắt tối đa).
+    Trả về (danh sách số lượng mỗi chiều dài, đã chạm giới hạn số mẫu hay chưa); quá deadline
+    (time.time()) thì dừng liệt kê và trả về các mẫu đã có.
+    """
+    n = len(sizes)
+    patterns = []
+    counts = [0] * n
+    # Kích thước nhỏ nhất của các chiều dài từ vị trí j trở đi, dùng để cắt tỉa nhánh
+    suffix_min = [float('inf')] * (n + 1)
+    for j in range(n - 1, -1, -1):
+        suffix_min[j] = min(sizes[j], suffix_min[j + 1])
+    truncated = False
+    visited = 0
+
+    def is_maximal(remaining, pieces):
+        if pieces >= max_cuts:
+            return True
+        return not any(counts[j] < limits[j] and sizes[j] <= remaining for j in range(n))
+
+    def search(j, remaining, pieces):
+        nonlocal truncated, visited
+        if truncated:
+            return
+        if len(patterns) >= max_patterns:
+            truncated = True
+            return
+        visited += 1
+        # Kiểm tra hạn chót thưa để không tốn thời gian gọi time.time() ở mỗi nút
+        if deadline is not None and visited % 1024 == 0 and time.time() > deadline:
+            truncated = True
+            return
+        if j == n or pieces >= max_cuts or suffix_min[j] > remaining:
+            if pieces > 0 and is_maximal(remaining, pieces):
+                patterns.append(counts[:])
+            return
+        most = min(limits[j], remaining // sizes[j], max_cuts - pieces)
+        for count in range(most, -1, -1):
+            counts[j] = count
+            search(j + 1, remaining - count * sizes[j], pieces + count)
+        counts[j] = 0
+
+    search(0, capacity, 0)
+    return patterns, truncated
+
+def optimize_with_pulp(profile_demand, cutting_gap, stock_length_options, messages=None, metrics=None, time_limit=None, deadline=None):
+    """Tối ưu hóa cắt nhôm bằng PuLP trên các chiều dài phân biệt.
+
+    Mẫu cắt được liệt kê theo chiều dài phân biệt với số lượng bị chặn bởi nhu cầu, chỉ giữ mẫu
+    tối đại; mô hình có một ràng buộc cho mỗi chiều dài phân biệt với nhu cầu thực của nó.
+    metrics (dict) nhận thời gian từng giai đoạn, số mẫu cắt và trạng thái CBC.
+    Mặc định CBC dừng theo số nút (PULP_MAX_NODES); time_limit (giây) chỉ áp dụng khi được truyền vào.
+    deadline (time.time()) chặn cả liệt kê mẫu lẫn CBC, nếu thời gian còn lại không đủ gọi CBC thì
+    trả về kết quả rỗng để nơi gọi giữ heuristic.
+    """
+    metrics = {} if metrics is None else metrics
+    profile_code = profile_demand['Mã Thanh'].iloc[0]
+    max_cuts_per_pattern = 8  # Số đoạn cắt tối đa mỗi mẫu
+    max_patterns = 20000
+    max_stock_length = max(stock_length_options)
+    stock_lengths = sorted(set(stock_length_options))
+
+    phase_start = time.perf_counter()
+    distinct_lengths, demands, bars = _distinct_demand(profile_demand, cutting_gap, max_stock_length)
+    metrics['expand_s'] = time.perf_counter() - phase_start
+
+    if len(distinct_lengths) > 0:
+        phase_start = time.perf_counter()
+        # Liệt kê trên kích thước đã chia ước chung; mẫu được xếp lại khổ nhỏ nhất sau khi giải
+        unit = _length_unit([length + cutting_gap for length in distinct_lengths] + stock_lengths)
+        sizes = [int(length + cutting_gap) // unit for length in distinct_lengths]
+        capacity = max_stock_length // unit
+        limits = [int(min(d, capacity // size)) for d, size in zip(demands, sizes)]
+        enumerated, truncated = _enumerate_maximal_patterns(sizes, limits, capacity, max_cuts_per_pattern, max_patterns, deadline)
+        if truncated and len(enumerated) >= max_patterns:
+            _report(messages, 'warning', f"Đạt giới hạn {max_patterns} mẫu cắt cho {profile_code}. Một số mẫu có thể bị bỏ sót. Hãy thử phương pháp 'Tối Ưu Sinh Cột' hoặc chia nhỏ dữ liệu.", profile_code)
+
+        # Luôn có mẫu đồng nhất cho từng chiều dài để mô hình khả thi khi liệt kê bị cắt bớt
+        columns = []
+        known = set()
+        homogeneous = []
+        for j, size in enumerate(sizes):
+            counts = [0] * len(sizes)
+            counts[j] = min(limits[j], max_cuts_per_pattern)
+            homogeneous.append(counts)
+        for counts in homogeneous + enumerated:
+            key = tuple(counts)
+            if key not in known:
+                known.add(key)
+                columns.append((counts, max_stock_length))
+        metrics['pattern_s'] = time.perf_counter() - phase_start
+        metrics['pattern_count'] = len(columns)
+
+        # Tạo mô hình PuLP
+        phase_start = time.perf_counter()
+        prob = LpProblem(f"Cutting_Stock_{profile_code}", LpMinimize)
+
+        # Biến quyết định: số lần sử dụng mỗi mẫu cắt
+        pattern_vars = [LpVariable(f"Pattern_{i}", lowBound=0, cat='Integer') for i in range(len(columns))]
+
+        # Hàm mục tiêu: tối thiểu hóa số thanh sử dụng
+        prob += lpSum(pattern_vars)
+
+        # Ràng buộc thưa: một dòng cho mỗi chiều dài phân biệt với nhu cầu thực
+        rows = [[] for _ in sizes]
+        for i, (counts, _) in enumerate(columns):
+            for j, count in enumerate(counts):
+                if count:
+                    rows[j].append((pattern_vars[i], count))
+        for j, row in enumerate(rows):
+            prob += LpAffineExpression(row) >= int(demands[j]), f"Demand_{j}"
+
+        metrics['build_s'] = time.perf_counter() - phase_start
+
+        if deadline is not None:
+            time_limit = min(time_limit or float('inf'), deadline - time.time())
+            if time_limit < MIN_IMPROVE_SECONDS:
+                metrics['hit_limit'] = True
+                return CutPlan.empty(), []
+
+        # Cắt probing và flow cover trên hàng chục nghìn mẫu tốn nhiều giây ở nút gốc mà hiếm khi cải thiện nghiệm;
+        # probing còn không kiểm tra giới hạn thời gian nên luôn được tắt
+        options = ['probing off', 'flow off']
+        if time_limit is None:
+            # Giới hạn số nút (không theo thời gian) để nghiệm không phụ thuộc tốc độ máy hay số tiến trình
+            solver = PULP_CBC_CMD(msg=False, maxNodes=PULP_MAX_NODES, options=options)
+        else:
+            solver = PULP_CBC_CMD(msg=False, timeLimit=time_limit, options=options)
+        phase_start = time.perf_counter()
+        prob.solve(solver)
+        metrics['solve_s'] = time.perf_counter() - phase_start
+        metrics['solver_calls'] = 1
+        metrics['solver_status'] = LpStatus[prob.status]
+        # Dừng ở giới hạn nút/thời gian khi mới có nghiệm nguyên khả thi, chưa chứng minh tối ưu
+        metrics['hit_limit'] = prob.sol_status == LpSolutionIntegerFeasible or (time_limit is not None and metrics['solve_s'] >= time_limit)
+
+        usage = [int(round(var.varValue or 0)) for var in pattern_vars]
+        covered = [sum(counts[j] * n for (counts, _), n in zip(columns, usage)) for j in range(len(sizes))]
+        if any(c < d for c, d in zip(covered, demands)):
+            _report(messages, 'error', f"Không tìm được nghiệm khả thi cho {profile_code} trong giới hạn thời gian.", profile_code)
+            return CutPlan.empty(), []
+        bars.extend(_expand_pattern_usage(columns, usage, distinct_lengths, demands, stock_lengths, cutting_gap))
+
+    # Kiểm tra nếu không có mẫu cắt nào được tạo
+    if not bars:
+        _report(messages, 'error', f"Không tạo được mẫu cắt nào cho {profile_code}. Vui lòng kiểm tra dữ liệu hoặc tăng khổ thanh lớn nhất.", profile_code)
+        return CutPlan.empty(), []
+
+    return _bars_to_plan(profile_code, profile_demand, bars, cutting_gap, max_stock_length, metrics)
+
+def _solve_master_lp(matrix, costs, demands, basis, max_pivots=None, tolerance=1e-6):
+    """Giải bài toán chủ LP min c·x, A x >= b, x >= 0 bằng đơn hình hiệu chỉnh ngay trong tiến trình.
+
+    Cột 0..m-1 là biến dư -e_i, cột m + i là mẫu cắt thứ i của matrix (m chiều dài × số mẫu).
+    basis là cơ sở khả thi của lần giải trước; thêm mẫu mới không làm mất tính khả thi nên
+    các vòng sinh cột khởi động nóng từ đó. Giới hạn số bước xoay (không theo thời gian) để
+    kết quả không phụ thuộc tốc độ máy. Trả về (nghiệm x của các mẫu, giá trị đối ngẫu, cơ sở).
+    """
+    rows = len(demands)
+    full = np.hstack([-np.eye(rows), matrix])
+    full_costs = np.concatenate([np.zeros(rows), costs])
+    demands = np.asarray(demands, dtype=float)
+    basis = list(basis)
+    max_pivots = max_pivots or 50 * full.shape[1]
+    degenerate = 0
+    for _ in range(max_pivots):
+        basis_matrix = full[:, basis]
+        x_basis = np.maximum(np.linalg.solve(basis_matrix, demands), 0.0)
+        duals = np.linalg.solve(basis_matrix.T, full_costs[basis])
+        reduced = full_costs - full.T @ duals
+        reduced[basis] = 0.0
+        candidates = np.flatnonzero(reduced < -tolerance)
+        if not len(candidates):
+            break
+        # Quy tắc Dantzig, chuyển sang quy tắc Bland khi xoay suy biến lâu để tránh lặp vòng
+        entering = candidates[0] if degenerate > rows else candidates[np.argmin(reduced[candidates])]
+        direction = np.linalg.solve(basis_matrix, full[:, entering])
+        positive = np.flatnonzero(direction > 1e-9)
+        if not len(positive):
+            break
+        ratios = x_basis[positive] / direction[positive]
+        step = ratios.min()
+        leaving = min(positive[ratios <= step + 1e-12], key=lambda r: basis[r])
+        degenerate = degenerate + 1 if step <= 1e-12 else 0
+        basis[leaving] = entering
+    basis_matrix = full[:, basis]
+    x_basis = np.maximum(np.linalg.solve(basis_matrix, demands), 0.0)
+    duals = np.linalg.solve(basis_matrix.T, full_costs[basis])
+    x = np.zeros(matrix.shape[1])
+    for row, column in enumerate(basis):
+        if column >= rows:
+            x[column - rows] = x_basis[row]
+    return x, duals, basis
+
+def _greedy_columns(sizes, limits, values, capacity, max_columns=None):
+    """Sinh nhanh các mẫu cắt tham lam (mỗi chiều dài làm điểm bắt đầu, rồi lấp theo thứ tự ưu tiên)."""
+    order = sorted(range(len(sizes)), key=lambda j: -values[j] / sizes[j])
+    columns = []
+    for first in order[:max_columns]:
+        if values[first] <= 0 or sizes[first] > capacity:
+            continue
+        counts = [0] * len(sizes)
+        remaining = capacity
+        for j in [first] + order:
+            if values[j] <= 0:
+                continue
+            take = min(int(limits[j]) - counts[j], remaining // sizes[j])
+            if take > 0:
+                counts[j] += take
+                remaining -= take * sizes[j]
+        columns.append(counts)
+    return columns
+
+def optimize_with_column_generation(profile_demand, cutting_gap, stock_length_options, max_iterations=200, time_limit=None, gap_tolerance=0.002, max_milp_bars=150, messages=None, metrics=None,
+                                    deadline=None):
+    """Tối ưu hóa cắt nhôm bằng sinh cột (Gilmore–Gomory).
+
+    Giải bài toán chủ LP trên tập mẫu cắt nhỏ, sinh mẫu mới bằng knapsack cho từng khổ thanh
+    (có tính khoảng cách cắt), rồi lấy nghiệm nguyên bằng cách làm tròn xuống và xếp phần dư,
+    hoặc bằng MILP nhỏ trên các mẫu đã sinh nếu cho kết quả tốt hơn.
+    Mục tiêu là tổng chiều dài nguyên liệu nên các khổ thanh ngắn hơn được ưu tiên khi đủ dùng.
+    Mặc định dừng theo hội tụ hoặc max_iterations; time_limit (giây) chỉ áp dụng khi được truyền vào.
+    metrics (dict) nhận thời gian định giá, dựng ma trận, giải LP chủ và MILP (cộng dồn qua các vòng) và trạng thái.
+    deadline (time.time()) dừng vòng sinh cột và bỏ MILP khi không còn đủ thời gian.
+    """
+    metrics = {} if metrics is None else metrics
+    profile_code = profile_demand['Mã Thanh'].iloc[0]
+    max_stock_length = max(stock_length_options)
+    stock_lengths = sorted(set(stock_length_options))
+
+    phase_start = time.perf_counter()
+    distinct_lengths, demands, bars = _distinct_demand(profile_demand, cutting_gap, max_stock_length)
+    metrics['expand_s'] = time.perf_counter() - phase_start
+    metrics.update(pattern_s=0.0, build_s=0.0, solve_s=0.0, solver_calls=0, hit_limit=False)
+
+    if len(distinct_lengths) > 0:
+        # Bảng knapsack định giá có kích thước khổ / ước chung của mọi kích thước
+        unit = _length_unit([length + cutting_gap for length in distinct_lengths] + stock_lengths)
+        sizes = [int(length + cutting_gap) // unit for length in distinct_lengths]
+        capacities = [stock_length // unit for stock_length in stock_lengths]
+
+        columns = []
+        column_index = {}
+        rows = [[] for _ in sizes]  # Ma trận ràng buộc thưa: mỗi dòng là (chỉ số mẫu, số mảnh)
+
+        def add_column(counts, stock_length):
+            key = (tuple(counts), stock_length)
+            if key in column_index or not any(counts):
+                return False
+            column_index[key] = len(columns)
+            for j, count in enumerate(counts):
+                if count:
+                    rows[j].append((len(columns), count))
+            columns.append((counts, stock_length))
+            return True
+
+        # Mẫu khởi tạo: xếp tham lam theo chiều dài giảm dần trên khổ lớn nhất
+        for counts in _greedy_columns(sizes, demands, sizes, capacities[-1]):
+            add_column(counts, stock_lengths[-1])
+        # Mẫu đồng nhất (một chiều dài) cho cơ sở khả thi ban đầu của bài toán chủ
+        basis = []
+        for j, size in enumerate(sizes):
+            counts = [0] * len(sizes)
+            counts[j] = min(int(demands[j]), capacities[-1] // size)
+            add_column(counts, stock_lengths[-1])
+            basis.append(len(sizes) + column_index[(tuple(counts), stock_lengths[-1])])
+
+        def solve_milp(solver_time_limit=None):
+            build_start = time.perf_counter()
+            prob = LpProblem(f"Cutting_Stock_CG_{profile_code}", LpMinimize)
+            usage = [LpVariable(f"Pattern_{i}", lowBound=0, cat='Integer') for i in range(len(columns))]
+            # Chi phí mẫu tính bằng mm, cùng thang đo với bài toán chủ (số thực) và giá trị đối ngẫu của nó
+            prob += LpAffineExpression([(usage[i], stock_length / LENGTH_SCALE) for i, (_, stock_length) in enumerate(columns)])
+            for j, row in enumerate(rows):
+                prob += LpAffineExpression([(usage[i], count) for i, count in row]) >= int(demands[j]), f"Demand_{j}"
+            # Giới hạn số nút khi không có giới hạn thời gian để nghiệm không phụ thuộc tốc độ máy
+            if solver_time_limit:
+                # Như optimize_with_pulp: cắt probing ở nút gốc không kiểm tra giới hạn thời gian nên được tắt
+                solver = PULP_CBC_CMD(msg=False, timeLimit=solver_time_limit, options=['probing off'])
+            else:
+                solver = PULP_CBC_CMD(msg=False, maxNodes=MILP_MAX_NODES)
+            solve_start = time.perf_counter()
+            metrics['build_s'] += solve_start - build_start
+            prob.solve(solver)
+            metrics['solve_s'] += time.perf_counter() - solve_start
+            metrics['solver_calls'] += 1
+            metrics['solver_status'] = LpStatus[prob.status]
+            if prob.sol_status == LpSolutionIntegerFeasible:
+                metrics['hit_limit'] = True
+            return prob, usage
+
+        start_time = time.time()
+        lp_lower_bound = 0.0  # Cận dưới hợp lệ của LP đầy đủ (cận Farley, mm), kể cả khi dừng sớm
+        for iteration in range(max_iterations):
+            build_start = time.perf_counter()
+            matrix = np.array([counts for counts, _ in columns], dtype=float).T
+            # Chi phí bằng mm: bài toán chủ là phép giải số thực duy nhất nên giữ thang đo như trước
+            costs = np.array([stock_length for _, stock_length in columns], dtype=float) / LENGTH_SCALE
+            solve_start = time.perf_counter()
+            metrics['build_s'] += solve_start - build_start
+            lp_usage, duals, basis = _solve_master_lp(matrix, costs, demands, basis)
+            metrics['solve_s'] += time.perf_counter() - solve_start
+            metrics['solver_calls'] += 1
+            pricing_start = time.perf_counter()
+            priced = _price_patterns(sizes, demands, duals, capacities)
+            metrics['pattern_s'] += time.perf_counter() - pricing_start
+            lp_value = float(costs @ lp_usage)
+            # Cận Farley: dừng sớm khi giá trị LP đã sát cận dưới (phần đuôi hội tụ chậm)
+            best_ratio = max(priced[capacity][0] / (stock_length / LENGTH_SCALE) for capacity, stock_length in zip(capacities, stock_lengths))
+            lp_lower_bound = max(lp_lower_bound, lp_value / max(best_ratio, 1.0))
+            if best_ratio <= 1 + 1e-9 or lp_value - lp_value / best_ratio <= gap_tolerance * lp_value:
+                break
+            if ((time_limit is not None and time.time() - start_time > time_limit) or iteration == max_iterations - 1
+                    or (deadline is not None and time.time() > deadline)):
+                metrics['hit_limit'] = True
+                break
+            pricing_start = time.perf_counter()
+            added = False
+            for capacity, stock_length in zip(capacities, stock_lengths):
+                value, counts = priced[capacity]
+                cost = stock_length / LENGTH_SCALE
+                # Chi phí rút gọn âm: mẫu mới giúp giảm tổng chiều dài nguyên liệu
+                if value <= cost + 1e-6:
+                    continue
+                added |= add_column(counts, stock_length)
+                # Thêm các mẫu tham lam có chi phí rút gọn âm để giảm số vòng lặp
+                for greedy_counts in _greedy_columns(sizes, demands, duals, capacity, max_columns=10):
+                    if sum(d * c for d, c in zip(duals, greedy_counts)) > cost + 1e-6:
+                        added |= add_column(greedy_counts, stock_length)
+            metrics['pattern_s'] += time.perf_counter() - pricing_start
+            if not added:
+                break
+        lp_usage = lp_usage.tolist()
+
+        # Làm tròn xuống nghiệm LP, phần nhu cầu còn thiếu được xếp bằng mẫu tham lam
+        rounded_usage = [math.floor(u + 1e-9) for u in lp_usage]
+        residual = [int(d) - sum(columns[i][0][j] * n for i, n in enumerate(rounded_usage) if n) for j, d in enumerate(demands)]
+        residual = [max(0, r) for r in residual]
+        while any(residual):
+            counts = _greedy_columns(sizes, residual, sizes, capacities[-1])[0]
+            add_column(counts, stock_lengths[-1])
+            index = column_index[(tuple(counts), stock_lengths[-1])]
+            rounded_usage.extend([0] * (len(columns) - len(rounded_usage)))
+            rounded_usage[index] += 1
+            residual = [r - c for r, c in zip(residual, counts)]
+        rounded_usage.extend([0] * (len(columns) - len(rounded_usage)))
+        best_usage = rounded_usage
+        best_cost = sum(columns[i][1] * n for i, n in enumerate(rounded_usage))
+
+        # Cận nguyên từ LP: tổng khổ nhỏ nhất ghép được từ các khổ thanh mà không nhỏ hơn cận LP
+        integer_bound = min_stock_total(stock_lengths, 0, math.ceil(lp_lower_bound * LENGTH_SCALE - 1e-6))
+        metrics['lp_bound'] = lp_lower_bound
+
+        # MILP nhỏ trên các mẫu đã sinh, chỉ dùng cho bài toán nhỏ (max_milp_bars) khi nghiệm làm tròn
+        # còn cách cận nguyên; làm tròn có thể hơn nghiệm tốt nhất cả một thanh nên không lấy một khổ làm ngưỡng
+        milp_time_limit = time_limit if deadline is None else min(time_limit or float('inf'), deadline - time.time())
+        if deadline is not None and milp_time_limit < MIN_IMPROVE_SECONDS:
+            metrics['hit_limit'] = True
+        elif sum(lp_usage) <= max_milp_bars and best_cost > integer_bound + 1e-6:
+            prob, usage = solve_milp(solver_time_limit=milp_time_limit)
+            int_usage = [int(round(u.varValue or 0)) for u in usage]
+            covered = [sum(columns[i][0][j] * n for i, n in enumerate(int_usage) if n) for j in range(len(sizes))]
+            int_cost = sum(columns[i][1] * n for i, n in enumerate(int_usage))
+            if all(c >= d for c, d in zip(covered, demands)) and int_cost < best_cost:
+                best_usage = int_usage
+
+        metrics['pattern_count'] = len(columns)
+        bars.extend(_expand_pattern_usage(columns, best_usage, distinct_lengths, demands, stock_lengths, cutting_gap))
+
+    if not bars:
+        _report(messages, 'error', f"Không tạo được mẫu cắt nào cho {profile_code}. Vui lòng kiểm tra dữ liệu hoặc tăng khổ thanh lớn nhất.", profile_code)
+        return CutPlan.empty(), []
+
+    return _bars_to_plan(profile_code, profile_demand, bars, cutting_gap, max_stock_length, metrics)
+
+def best_fit_flexible(lengths, cutting_gap, stock_length_options):
+    """Best-fit cho chế độ linh hoạt: mỗi đoạn vào thanh đang mở vừa khít nhất hoặc mở thanh mới khổ nhỏ nhất đủ dùng.
+
+    Phần còn lại của các thanh đang mở nằm trong SortedList theo (chiều dài còn lại, số thứ tự thanh),
+    nên tìm thanh vừa khít nhất chỉ cần một lần bisect O(log n). Thanh mới chỉ được mở khi phần
+    còn lại của nó nhỏ hơn hẳn thanh đang mở tốt nhất, và khi hòa thì ưu tiên thanh mở sớm hơn.
+    """
+    stock_lengths = sorted(stock_length_options)
+    patterns = []
+    remaining_lengths = []
+    stock_lengths_used = []
+    open_bars = SortedList()
+
+    for length in lengths:
+        required_length = length + cutting_gap
+
+        # Thanh đang mở vừa khít nhất: phần còn lại nhỏ nhất mà vẫn >= length + cutting_gap
+        position = open_bars.bisect_left((required_length, -1))
+        best_remaining = float('inf')
+        best_pattern_idx = -1
+        if position < len(open_bars):
+            remaining, best_pattern_idx = open_bars[position]
+            best_remaining = remaining - required_length
+
+        # Khổ nhỏ nhất đủ chứa đoạn cắt; nếu vượt khổ lớn nhất thì làm tròn lên chỉ cho đoạn cắt đơn lẻ
+        stock_index = bisect_left(stock_lengths, required_length)
+        if stock_index < len(stock_lengths):
+            new_stock_length = stock_lengths[stock_index]
+        else:
+            new_stock_length = round_up_stock(required_length)
+        new_remaining = new_stock_length - required_length
+
+        if best_pattern_idx >= 0 and best_remaining <= new_remaining:
+            open_bars.pop(position)
+            patterns[best_pattern_idx].append(length)
+            remaining_lengths[best_pattern_idx] = best_remaining
+            open_bars.add((best_remaining, best_pattern_idx))
+        else:
+            open_bars.add((new_remaining, len(patterns)))
+            patterns.append([length])
+            remaining_lengths.append(new_remaining)
+            stock_lengths_used.append(new_stock_length)
+
+    return patterns, remaining_lengths, stock_lengths_used
+
+class MaxSegmentTree:
+    """Cây phân đoạn lưu giá trị lớn nhất, dùng để tìm thanh đầu tiên còn đủ chỗ trong O(log n)."""
+
+    def __init__(self, capacity):
+        self.size = 1
+        while self.size < max(1, capacity):
+            self.size *= 2
+        self.tree = [float('-inf')] * (2 * self.size)
+
+    def update(self, index, value):
+        node = index + self.size
+        self.tree[node] = value
+        node //= 2
+        while node:
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+    def first_at_least(self, value):
+        """Chỉ số lá nhỏ nhất có giá trị >= value, hoặc -1 nếu không có."""
+        if self.tree[1] < value:
+            return -1
+        node = 1
+        while node < self.size:
+            node = 2 * node if self.tree[2 * node] >= value else 2 * node + 1
+        return node - self.size
+
+def first_fit_decreasing_all(lengths, cutting_gap, stock_length_options):
+    """First-fit cho từng khổ trong stock_length_options, chạy chung một lượt qua các đoạn đã sắp xếp.
+
+    Mỗi khổ có một MaxSegmentTree riêng lưu phần còn lại của các thanh, nên mỗi lần xếp là O(log số thanh).
+    Trả về danh sách (mẫu cắt, phần còn lại, khổ thực tế từng thanh) theo thứ tự stock_length_options.
+    """
+    max_stock_length = max(stock_length_options)
+    candidates = [([], [], []) for _ in stock_length_options]
+    trees = [MaxSegmentTree(len(lengths)) for _ in stock_length_options]
+
+    for length in lengths:
+        required_length = length + cutting_gap
+        # Khổ thay thế khi đoạn cắt không vừa khổ đang xét, tính một lần cho mọi khổ
+        if required_length > max_stock_length:
+            oversize_stock_length = round_up_stock(required_length)
+        else:
+            oversize_stock_length = max_stock_length
+
+        for current_stock_length, (patterns, remaining_lengths, stock_lengths_used), tree in zip(stock_length_options, candidates, trees):
+            bar_index = tree.first_at_least(required_length)
+            if bar_index >= 0:
+                patterns[bar_index].append(length)
+                remaining_lengths[bar_index] -= required_length
+                tree.update(bar_index, remaining_lengths[bar_index])
+            else:
+                selected_stock_length = current_stock_length if required_length <= current_stock_length else oversize_stock_length
+                tree.update(len(patterns), selected_stock_length - required_length)
+                patterns.append([length])
+                remaining_lengths.append(selected_stock_length - required_length)
+                stock_lengths_used.append(selected_stock_length)
+
+    return candidates
+
+def _heuristic_bars(lengths, cutting_gap, stock_length_options):
+    """Phương án heuristic ít nguyên liệu nhất (best-fit linh hoạt hoặc first-fit từng khổ), mỗi thanh thu về khổ nhỏ nhất đủ chứa.
+
+    Trả về danh sách (mẫu cắt, khổ thanh) như _expand_pattern_usage.
+    """
+    stock_lengths = sorted(set(stock_length_options))
+    candidates = [best_fit_flexible(lengths, cutting_gap, stock_length_options)]
+    candidates.extend(first_fit_decreasing_all(lengths, cutting_gap, stock_length_options))
+    best_bars = None
+    for patterns, _, stock_lengths_used in candidates:
+        bars = []
+        for pattern, stock_length in zip(patterns, stock_lengths_used):
+            required = sum(length + cutting_gap for length in pattern)
+            index = bisect_left(stock_lengths, required)
+            bars.append((pattern, stock_lengths[index] if index < len(stock_lengths) else stock_length))
+        key = (sum(stock_length for _, stock_length in bars), len(bars))
+        if best_bars is None or key < best_key:
+            best_bars, best_key = bars, key
+    return best_bars
+
+def fill_remnants(lengths, cutting_gap, remnants):
+    """Xếp best-fit các đoạn cắt (đã sắp giảm dần) vào phần dư tồn kho trước khi mở thanh mới.
+
+    remnants là danh sách (chiều dài, mã phần dư). Mỗi đoạn vào phần dư đang dùng dở hoặc phần dư
+    chưa dùng còn thừa ít nhất sau khi cắt; cả hai được tra bằng bisect trên SortedList nên mỗi
+    đoạn tốn O(log n) dù kho có hàng nghìn phần dư.
+    Trả về (danh sách [mẫu cắt, chiều dài phần dư, mã phần dư], các đoạn không xếp được).
+    """
+    pool = SortedList(remnants)
+    open_bars = SortedList()  # (chiều dài còn lại, vị trí trong bars)
+    bars = []
+    leftover = []
+    for length in lengths:
+        required = length + cutting_gap
+        open_pos = open_bars.bisect_left((required, -1))
+        open_waste = open_bars[open_pos][0] - required if open_pos < len(open_bars) else float('inf')
+        pool_pos = pool.bisect_left((required,))
+        pool_waste = pool[pool_pos][0] - required if pool_pos < len(pool) else float('inf')
+        if open_waste == float('inf') and pool_waste == float('inf'):
+            leftover.append(length)
+        elif open_waste <= pool_waste:
+            remaining, index = open_bars.pop(open_pos)
+            bars[index][0].append(length)
+            open_bars.add((remaining - required, index))
+        else:
+            remnant_length, remnant_id = pool.pop(pool_pos)
+            bars.append([[length], remnant_length, remnant_id])
+            open_bars.add((remnant_length - required, len(bars) - 1))
+    return bars, leftover
+
+def _add_bound_columns(summary, bound):
+    """Thêm cận dưới và chênh lệch (%) về số thanh và nguyên liệu vào dòng tổng hợp."""
+    summary['Cận Dưới Số Thanh'] = bound['bars']
+    summary['Chênh Lệch Số Thanh (%)'] = gap_percent(summary['Số Thanh Sử Dụng'], bound['bars'])
+    summary['Cận Dưới Nguyên Liệu (mm)'] = from_unit(bound['stock_length'])
+    summary['Chênh Lệch Nguyên Liệu (%)'] = gap_percent(summary['Tổng Chiều Dài Nguyên Liệu (mm)'], summary['Cận Dưới Nguyên Liệu (mm)'])
+
+def profile_fingerprint(profile_demand, cutting_gap, stock_length_options, optimization_method):
+    """Dấu vân tay nhu cầu của một mã thanh (các nhóm chiều dài, mã cửa, số lượng theo đúng thứ tự nhập,
+    vì Item ID đánh số theo thứ tự này) cùng khoảng cách cắt, khổ thanh và phương pháp."""
+    # Chuẩn hóa kiểu dữ liệu để sửa một dòng (ví dụ thêm số lẻ) không làm đổi dấu vân tay của mã thanh khác
+    rows = [
+        str(profile_demand['Mã Thanh'].iloc[0]),
+        profile_demand['Chiều Dài'].to_numpy(dtype=np.int64).tolist(),
+        profile_demand['Mã Cửa'].astype(str).tolist() if 'Mã Cửa' in profile_demand.columns else None,
+        profile_demand['Số Lượng'].to_numpy(dtype=np.int64).tolist()
+    ]
+    key = repr((rows, int(cutting_gap), sorted(set(int(s) for s in stock_length_options)), optimization_method))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _reused_output(output):
+    """Kết quả mã thanh lấy từ lần chạy trước, đánh dấu dùng lại trong chỉ số hiệu năng."""
+    result, messages, metrics = output
+    return result, messages, dict(metrics, reused=True)
+
+def new_profile_metrics(profile_code, method, profile_demand):
+    """Chỉ số hiệu năng rỗng của một mã thanh; các giai đoạn không áp dụng giữ giá trị None."""
+    return {
+        'profile_code': profile_code,
+        'method': method,
+        'pieces': int(profile_demand['Số Lượng'].sum()),
+        'distinct_lengths': int(profile_demand['Chiều Dài'].nunique()),
+        'expand_s': None,       # Mở rộng/gom chiều dài
+        'pattern_count': None,  # Số mẫu cắt (liệt kê, sinh cột) hoặc số thanh (heuristic)
+        'pattern_s': None,      # Liệt kê mẫu, định giá sinh cột hoặc chạy heuristic
+        'build_s': None,        # Dựng mô hình PuLP / ma trận bài toán chủ
+        'solve_s': None,        # Thời gian CBC và LP chủ của sinh cột
+        'solver_calls': None,   # Số lần giải (CBC hoặc LP chủ)
+        'solver_status': None,
+        'hit_limit': False,     # Dừng do giới hạn số nút/số vòng/thời gian
+        'lower_bound_bars': None,
+        'lower_bound_stock': None,
+        'lp_bound': None,       # Cận LP (Farley) của sinh cột, mm
+        'heuristic_s': None,    # Heuristic thử trước khi gọi CBC
+        'stage': None,          # Chế độ giới hạn thời gian: heuristic ban đầu đã được cải thiện hay chưa
+        'reused': False,        # Dùng lại phương án của lần chạy trước (tối ưu lại từng phần)
+        'cache_hit': False,     # Lấy từ bộ nhớ đệm nghiệm trên đĩa
+        'remnant_s': None,      # Xếp đoạn cắt vào phần dư tồn kho
+        'remnants_used': [],    # Mã các phần dư tồn kho đã dùng
+        'assign_s': None,       # Gán mã mảnh, dựng CutPlan
+        'total_s': None,
+    }
+
+def optimize_profile(profile_demand, cutting_gap, optimization_method, stock_length_options, messages=None, metrics=None,
+                     time_limit=None, heuristic_only=False, remnants=None):
+    """Tối ưu một mã thanh độc lập; trả về (CutPlan, dòng tổng hợp dạng list dict).
+
+    Hàm ở cấp module để có thể chạy trong tiến trình con của ProcessPoolExecutor.
+    metrics (dict, xem new_profile_metrics) nhận thời gian từng giai đoạn.
+    time_limit (giây) giới hạn thời gian của PuLP/sinh cột thay cho giới hạn mặc định của chúng;
+    heuristic_only=True chỉ trả về heuristic chạy thử của PuLP/sinh cột, không gọi CBC.
+    remnants (danh sách (chiều dài, mã phần dư)) được dùng trước khi mở thanh mới với mọi phương pháp.
+    """
+    started = time.perf_counter()
+    profile_code = profile_demand['Mã Thanh'].iloc[0]
+    if metrics is None:
+        metrics = new_profile_metrics(profile_code, optimization_method, profile_demand)
+    method = _effective_method(profile_demand, optimization_method, messages)
+    metrics['method'] = method
+
+    try:
+        bound = profile_lower_bound(profile_demand, cutting_gap, stock_length_options)
+        if remnants:
+            plan, summaries = _solve_with_remnants(
+                profile_demand, cutting_gap, method, stock_length_options, remnants, messages, metrics, time_limit, heuristic_only
+            )
+        else:
+            plan, summaries = _solve_profile(profile_demand, cutting_gap, method, stock_length_options, bound, messages, metrics, time_limit, heuristic_only)
+        _apply_bounds(bound, summaries, metrics, stock_length_options)
+        if metrics['remnants_used']:
+            # Phần dư ngắn hơn khổ thanh nên cận về số thanh vẫn đúng, còn cận nguyên liệu thì không
+            for summary in summaries:
+                summary['Cận Dưới Nguyên Liệu (mm)'] = None
+                summary['Chênh Lệch Nguyên Liệu (%)'] = None
+            metrics['lower_bound_stock'] = None
+        return plan, summaries
+    finally:
+        metrics['total_s'] = time.perf_counter() - started
+
+def _solve_with_remnants(profile_demand, cutting_gap, method, stock_length_options, remnants, messages, metrics, time_limit, heuristic_only):
+    """Xếp đoạn cắt vào phần dư tồn kho trước, phần còn lại giải bằng phương pháp đã chọn trên thanh mới.
+
+    Thanh phần dư đứng đầu phương án của mã thanh, ghi chú mã phần dư đã dùng.
+    """
+    profile_code = profile_demand['Mã Thanh'].iloc[0]
+    max_stock_length = max(stock_length_options)
+    phase_start = time.perf_counter()
+    lengths = sorted(expand_lengths(profile_demand).tolist(), reverse=True)
+    remnant_bars, leftover = fill_remnants(lengths, cutting_gap, remnants)
+    metrics['remnant_s'] = time.perf_counter() - phase_start
+    if not remnant_bars:
+        bound = profile_lower_bound(profile_demand, cutting_gap, stock_length_options)
+        return _solve_profile(profile_demand, cutting_gap, method, stock_length_options, bound, messages, metrics, time_limit, heuristic_only)
+
+    bars = [(pattern, remnant_length) for pattern, remnant_length, _ in remnant_bars]
+    if leftover:
+        # Nhu cầu còn lại chỉ cần tập chiều dài; mã mảnh được gán lại trên toàn bộ nhu cầu bên dưới
+        counts = pd.Series(leftover).value_counts(sort=False)
+        residual = pd.DataFrame({'Mã Thanh': profile_code, 'Chiều Dài': counts.index.to_numpy(dtype=np.int64), 'Số Lượng': counts.to_numpy()})
+        residual_bound = profile_lower_bound(residual, cutting_gap, stock_length_options)
+        residual_plan, residual_summaries = _solve_profile(
+            residual, cutting_gap, method, stock_length_options, residual_bound, messages, metrics, time_limit, heuristic_only
+        )
+        if not residual_summaries:
+            return residual_plan, residual_summaries
+        stock_lengths = residual_plan.bar_stock_lengths.tolist()
+        bars.extend((residual_plan.bar_pieces(i).tolist(), stock_lengths[i]) for i in range(residual_plan.n_bars))
+
+    plan, summaries = _bars_to_plan(profile_code, profile_demand, bars, cutting_gap, max_stock_length, metrics)
+    plan.bar_notes[:len(remnant_bars)] = [
+        f"Phần dư tồn kho #{remnant_id} ({from_unit(remnant_length)}mm)" for _, remnant_length, remnant_id in remnant_bars
+    ]
+    summaries[0]['Số Phần Dư Sử Dụng'] = len(remnant_bars)
+    metrics['remnants_used'] = [remnant_id for _, _, remnant_id in remnant_bars]
+    return plan, summaries
+
+def _effective_method(profile_demand, optimization_method, messages):
+    """Phương pháp thực dùng cho một mã thanh: PuLP chuyển sang Tối Ưu Sinh Cột khi có quá nhiều chiều dài phân biệt."""
+    distinct_count = profile_demand['Chiều Dài'].nunique()
+    if optimization_method == "Tối Ưu PuLP" and distinct_count > 20:
+        profile_code = profile_demand['Mã Thanh'].iloc[0]
+        _report(messages, 'warning', f"Dữ liệu cho {profile_code} có {distinct_count} chiều dài khác nhau, quá lớn cho PuLP. Đã chuyển sang phương pháp Tối Ưu Sinh Cột.", profile_code)
+        return "Tối Ưu Sinh Cột"
+    return optimization_method
+
+def _apply_bounds(bound, summaries, metrics, stock_length_options):
+    """Ghi cận dưới vào chỉ số và dòng tổng hợp; cận LP của sinh cột chặt hơn cận tổ hợp về nguyên liệu.
 
-def optimize_cutting(df, cutting_gap, optimization_method, stock_length_options, optimize_stock_length):
+    Sinh cột xếp đoạn vượt khổ riêng nên cận LP chỉ hợp lệ khi không đoạn nào lọt vào phần dư của thanh vượt khổ.
     """
-    Hàm tối ưu hóa cắt nhôm, hỗ trợ bốn chế độ tối ưu:
+    if metrics.get('lp_bound') and not bound['oversized_slack_usable']:
+        lp_stock = min_stock_total(stock_length_options, bound['fitting_bars'], metrics['lp_bound'] * LENGTH_SCALE) + bound['oversized_stock_length']
+        bound['stock_length'] = max(bound['stock_length'], lp_stock)
+    metrics['lower_bound_bars'] = bound['bars']
+    metrics['lower_bound_stock'] = from_unit(bound['stock_length'])
+    for summary in summaries:
+        _add_bound_columns(summary, bound)
+
+def _cached_profile_output(profile_demand, cutting_gap, optimization_method, stock_length_options, entry):
+    """Dựng kết quả một mã thanh từ nghiệm trong bộ nhớ đệm: chỉ gán mã mảnh, không giải lại."""
+    started = time.perf_counter()
+    profile_code = profile_demand['Mã Thanh'].iloc[0]
+    messages = []
+    metrics = new_profile_metrics(profile_code, optimization_method, profile_demand)
+    metrics['method'] = _effective_method(profile_demand, optimization_method, messages)
+    metrics.update(cache_hit=True, solver_status=entry['solver_status'], lp_bound=entry.get('lp_bound'), pattern_count=len(entry['bars']))
+    bound = profile_lower_bound(profile_demand, cutting_gap, stock_length_options)
+    bars = [(pattern, stock_length) for pattern, stock_length in entry['bars']]
+    output = _bars_to_plan(profile_code, profile_demand, bars, cutting_gap, max(stock_length_options), metrics)
+    _apply_bounds(bound, output[1], metrics, stock_length_options)
+    metrics['total_s'] = time.perf_counter() - started
+    return output, messages, metrics
+
+def _cacheable_bars(output):
+    """Danh sách (mẫu cắt, khổ thanh) của kết quả đáng lưu vào bộ nhớ đệm nghiệm, hoặc None.
+
+    Chỉ lưu nghiệm giải đầy đủ hoặc đã đạt cận dưới; nghiệm của chế độ giới hạn thời gian, hoặc bộ giải
+    dừng vì giới hạn số nút/số vòng/thời gian (hit_limit) có thể chưa tốt.
+    """
+    (plan, summaries), _, metrics = output
+    if not summaries or metrics.get('cache_hit') or metrics.get('reused') or metrics.get('hit_limit'):
+        return None
+    if _is_time_limited(metrics):
+        return None
+    stock_lengths = plan.bar_stock_lengths.tolist()
+    return [(plan.bar_pieces(i).tolist(), stock_lengths[i]) for i in range(plan.n_bars)]
+
+def _solve_profile(profile_demand, cutting_gap, method, stock_length_options, bound, messages, metrics, time_limit=None, heuristic_only=False):
+    """Chạy phương pháp đã chọn cho một mã thanh; PuLP/sinh cột được bỏ qua khi heuristic đã đạt cận dưới
+    và kết quả của chúng chỉ được dùng khi ít nguyên liệu hơn heuristic."""
+    profile_code = profile_demand['Mã Thanh'].iloc[0]
+    max_stock_length = max(stock_length_options)
+    deadline = None if time_limit is None else time.time() + time_limit
+
+    phase_start = time.perf_counter()
+    lengths = sorted(expand_lengths(profile_demand).tolist(), reverse=True)  # Sắp xếp giảm dần để tối ưu
+    metrics['expand_s'] = time.perf_counter() - phase_start
+
+    if method in ("Tối Ưu Sinh Cột", "Tối Ưu PuLP"):
+        # Heuristic nhanh trước: nếu tổng nguyên liệu đã bằng cận dưới thì nghiệm tối ưu, không cần CBC
+        phase_start = time.perf_counter()
+        bars = _heuristic_bars(lengths, cutting_gap, stock_length_options)
+        metrics['heuristic_s'] = time.perf_counter() - phase_start
+        reached_bound = bars and sum(stock_length for _, stock_length in bars) <= bound['stock_length']
+        # Không còn đủ thời gian gọi CBC: giữ heuristic để không vượt thời gian cho phép
+        out_of_time = deadline is not None and deadline - time.time() < MIN_IMPROVE_SECONDS
+        if reached_bound or heuristic_only or out_of_time:
+            if out_of_time and not reached_bound:
+                metrics['hit_limit'] = True
+            metrics['pattern_count'] = len(bars)
+            metrics['solver_status'] = "Đạt cận dưới" if reached_bound else "Heuristic"
+            return _bars_to_plan(profile_code, profile_demand, bars, cutting_gap, max_stock_length, metrics)
+
+        solver_messages = len(messages) if messages is not None else 0
+        if method == "Tối Ưu Sinh Cột":
+            # Sinh cột không cần liệt kê mẫu nên không giới hạn số mục; thời gian chia đều cho vòng sinh cột và MILP
+            limits = {} if time_limit is None else {'time_limit': max(0.5, min(5, time_limit / 2)), 'deadline': deadline}
+            plan, summaries = optimize_with_column_generation(profile_demand, cutting_gap, stock_length_options, messages=messages, metrics=metrics, **limits)
+        else:
+            # Sử dụng PuLP để tối ưu
+            limits = {} if time_limit is None else {'time_limit': min(30, time_limit), 'deadline': deadline}
+            plan, summaries = optimize_with_pulp(profile_demand, cutting_gap, stock_length_options, messages=messages, metrics=metrics, **limits)
+        # Bộ giải dừng vì giới hạn số nút/mẫu/thời gian, hoặc không ghép được đoạn nhỏ vào thanh vượt khổ, có thể kém
+        # heuristic: giữ phương án ít nguyên liệu hơn
+        if bars and (not summaries or sum(stock_length for _, stock_length in bars) < int(plan.bar_stock_lengths.sum())):
+            if not summaries and messages is not None:
+                # Bộ giải không ra nghiệm nhưng đã có phương án heuristic: bỏ báo lỗi của bộ giải
+                del messages[solver_messages:]
+            metrics['pattern_count'] = len(bars)
+            metrics['solver_status'] = "Heuristic tốt hơn" if summaries else "Heuristic"
+            return _bars_to_plan(profile_code, profile_demand, bars, cutting_gap, max_stock_length, metrics)
+        return plan, summaries
+
+    patterns = []
+    remaining_lengths = []
+    stock_lengths_used = []
+
+    phase_start = time.perf_counter()
+    if method == "Tối Ưu Linh Hoạt":
+        # Chế độ linh hoạt: Sử dụng nhiều kích thước thanh
+        patterns, remaining_lengths, stock_lengths_used = best_fit_flexible(lengths, cutting_gap, stock_length_options)
+
+    else:
+        # Chế độ cũ: Chọn một kích thước thanh tốt nhất, mọi khổ được đánh giá trong một lượt
+        best_efficiency = 0
+        best_bar_count = float('inf')
+        candidates = first_fit_decreasing_all(lengths, cutting_gap, stock_length_options)
+
+        for temp_patterns, temp_remaining_lengths, temp_stock_lengths in candidates:
+            total_used_length = sum(sum(pattern) for pattern in temp_patterns)
+            total_stock_length = sum(temp_stock_lengths)
+            current_efficiency = total_used_length / total_stock_length if total_stock_length > 0 else 0
+
+            if method == "Tối Ưu Hiệu Suất Cao Nhất":
+                better = current_efficiency > best_efficiency
+            else:  # Tối Ưu Số Lượng Thanh
+                better = len(temp_patterns) < best_bar_count or (len(temp_patterns) == best_bar_count and current_efficiency > best_efficiency)
+            if better:
+                patterns = temp_patterns
+                remaining_lengths = temp_remaining_lengths
+                stock_lengths_used = temp_stock_lengths
+                best_efficiency = current_efficiency
+                best_bar_count = len(temp_patterns)
+    metrics['pattern_s'] = time.perf_counter() - phase_start
+    metrics['pattern_count'] = len(patterns)
+
+    phase_start = time.perf_counter()
+    plan, summary = build_profile_results(
+        profile_code, profile_demand, patterns, remaining_lengths, stock_lengths_used, cutting_gap, max_stock_length
+    )
+    metrics['assign_s'] = time.perf_counter() - phase_start
+    return plan, [summary]
+
+def _optimize_profile_worker(profile_demand, cutting_gap, optimization_method, stock_length_options, deadline=None, heuristic_only=False,
+                            remnants=None):
+    """Chạy optimize_profile, gom cảnh báo và chỉ số hiệu năng để tiến trình chính ghép theo đúng thứ tự.
+
+    deadline (time.time()) giới hạn thời gian giải theo thời gian còn lại; trả về None nếu đã hết giờ.
+    """
+    time_limit = None
+    if deadline is not None:
+        time_limit = deadline - time.time()
+        if time_limit < MIN_IMPROVE_SECONDS:
+            return None
+    messages = []
+    metrics = new_profile_metrics(profile_demand['Mã Thanh'].iloc[0], optimization_method, profile_demand)
+    output = optimize_profile(
+        profile_demand, cutting_gap, optimization_method, stock_length_options, messages=messages, metrics=metrics,
+        time_limit=time_limit, heuristic_only=heuristic_only, remnants=remnants
+    )
+    return output, messages, metrics
+
+def _stock_gap(output):
+    """Phần nguyên liệu (mm) vượt cận dưới của một kết quả mã thanh; khi dùng phần dư tồn kho
+    (không có cận nguyên liệu) thì lấy phế liệu làm thước đo."""
+    summaries = output[0][1]
+    if not summaries:
+        return float('inf')
+    if summaries[0]['Cận Dưới Nguyên Liệu (mm)'] is None:
+        return summaries[0]['Phế Liệu (mm)']
+    return summaries[0]['Tổng Chiều Dài Nguyên Liệu (mm)'] - summaries[0]['Cận Dưới Nguyên Liệu (mm)']
+
+def _is_better(candidate, current):
+    """So sánh hai kết quả của cùng một mã thanh theo (tổng nguyên liệu, số thanh)."""
+    candidate_summaries, current_summaries = candidate[0][1], current[0][1]
+    if not candidate_summaries:
+        return False
+    if not current_summaries:
+        return True
+    key = lambda summary: (summary['Tổng Chiều Dài Nguyên Liệu (mm)'], summary['Số Thanh Sử Dụng'])
+    return key(candidate_summaries[0]) < key(current_summaries[0])
+
+def _is_time_limited(metrics):
+    """Kết quả của chế độ giới hạn thời gian chưa chắc tối ưu (trừ khi đã đạt cận dưới)."""
+    return metrics.get('stage') is not None and metrics.get('solver_status') != "Đạt cận dưới"
+
+def _shutdown_now(executor):
+    """Hủy các mã thanh chưa bắt đầu và dừng các tiến trình con còn đang giải, để hết giờ là trả về ngay
+    mà không để tiến trình chạy nền sau khi tối ưu đã xong.
+
+    ProcessPoolExecutor không có API công khai để dừng tiến trình đang chạy nên dùng _processes khi
+    có; nếu phiên bản Python không còn thuộc tính này thì chỉ hủy các mã chưa bắt đầu, mã đang giải
+    tự dừng theo giới hạn thời gian của CBC.
+    """
+    processes = getattr(executor, '_processes', None)
+    processes = list(processes.values()) if isinstance(processes, dict) else []
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        try:
+            if process.is_alive():
+                process.terminate()
+        except (AttributeError, OSError):
+            pass
+
+def _solve_anytime(profile_groups, profile_codes, cutting_gap, optimization_method, stock_length_options, max_workers,
+                   deadline, report_progress, check_cancelled, phases, remnants):
+    """Chế độ giới hạn thời gian: heuristic cho mọi mã thanh trước, sau đó dùng thời gian còn lại
+    giải PuLP/sinh cột cho các mã thanh chênh lệch cận dưới lớn nhất, giữ nghiệm tốt nhất."""
+    total_codes = len(profile_codes)
+    phase_start = time.perf_counter()
+    outputs = []
+    for index, profile_code in enumerate(profile_codes):
+        check_cancelled()
+        report_progress(index, total_codes, f"Heuristic {profile_code}")
+        output = _optimize_profile_worker(
+            profile_groups[profile_code], cutting_gap, optimization_method, stock_length_options, heuristic_only=True,
+            remnants=remnants.get(str(profile_code))
+        )
+        output[2]['stage'] = "Heuristic"
+        outputs.append(output)
+    phases['heuristic_s'] = time.perf_counter() - phase_start
+
+    # Mã thanh chênh lệch nguyên liệu lớn nhất được cải thiện trước; mã đã đạt cận dưới được bỏ qua
+    phase_start = time.perf_counter()
+    order = sorted((index for index in range(total_codes) if _stock_gap(outputs[index]) > 1e-6), key=lambda index: -_stock_gap(outputs[index]))
+    improved = []
+
+    def accept(index, candidate):
+        if candidate is None:
+            return
+        if _is_better(candidate, outputs[index]):
+            candidate[2]['stage'] = "Đã cải thiện"
+            outputs[index] = candidate
+            improved.append(index)
+        else:
+            outputs[index][2]['stage'] = "Không cải thiện"
+
+    if max_workers and max_workers > 1 and len(order) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(max_workers, len(order)))
+        try:
+            futures = {
+                executor.submit(
+                    _optimize_profile_worker, profile_groups[profile_codes[index]], cutting_gap, optimization_method, stock_length_options, deadline,
+                    remnants=remnants.get(str(profile_codes[index]))
+                ): index
+                for index in order
+            }
+            # Chờ tới hạn chót (cộng thêm chút thời gian cho CBC trả nghiệm), mã chưa xong giữ heuristic
+            for done, future in enumerate(as_completed(futures, timeout=max(0, deadline - time.time()) + DEADLINE_GRACE_SECONDS), 1):
+                check_cancelled()
+                index = futures[future]
+                accept(index, future.result())
+                report_progress(done, len(order), f"Cải thiện {profile_codes[index]}")
+        except FuturesTimeoutError:
+            pass
+        finally:
+            _shutdown_now(executor)
+    else:
+        for done, index in enumerate(order):
+            check_cancelled()
+            report_progress(done, len(order), f"Cải thiện {profile_codes[index]} ({optimization_method})")
+            candidate = _optimize_profile_worker(
+                profile_groups[profile_codes[index]], cutting_gap, optimization_method, stock_length_options, deadline,
+                remnants=remnants.get(str(profile_codes[index]))
+            )
+            if candidate is None:
+                break
+            accept(index, candidate)
+    phases['improve_s'] = time.perf_counter() - phase_start
+    phases['improved_codes'] = len(improved)
+    return outputs
+
+def _attach_source_columns(result_df, profile_groups, source_columns):
+    """Thêm tệp nguồn/sheet cho từng mảnh: Item ID đánh số theo thứ tự nhu cầu nên tra lại được từ nhu cầu gộp."""
+    items = pd.concat([expand_items(group)[['Item ID'] + source_columns] for group in profile_groups.values()], ignore_index=True)
+    return result_df.merge(items, on='Item ID', how='left')
+
+def run_optimization(df, cutting_gap, optimization_method, stock_length_options, max_workers=1,
+                     progress_callback=None, cancel_event=None, time_budget=None, previous=None,
+                     solution_cache_path=solution_cache.DEFAULT_CACHE_PATH, remnants=None):
+    """
+    Tối ưu hóa cắt nhôm cho toàn bộ đơn hàng, trả về OptimizationResult. Các chế độ tối ưu:
     - "Tối Ưu Hiệu Suất Cao Nhất": Chọn một kích thước thanh tốt nhất cho từng mã nhôm để tối ưu hiệu suất.
     - "Tối Ưu Số Lượng Thanh": Chọn một kích thước thanh tốt nhất để giảm số lượng thanh.
     - "Tối Ưu Linh Hoạt": Sử dụng nhiều kích thước thanh để giảm phế liệu.
     - "Tối Ưu PuLP": Sử dụng lập trình tuyến tính với PuLP để tối ưu chính xác.
+    - "Tối Ưu Sinh Cột": Sinh cột (Gilmore–Gomory) với PuLP, dùng được cho mã thanh có hàng nghìn đoạn cắt.
+
+    max_workers > 1 giải các mã thanh song song trên một nhóm tiến trình; kết quả được ghép
+    theo thứ tự mã thanh nên giống hệt khi chạy tuần tự.
+
+    Không phụ thuộc Streamlit, chạy được trong luồng nền hoặc từ dòng lệnh:
+    - progress_callback(số mã đã xong, tổng số mã, giai đoạn) được gọi sau mỗi bước.
+    - cancel_event (threading.Event) được kiểm tra giữa các mã thanh; khi được đặt sẽ ném OptimizationCancelled.
+    - Cảnh báo được trả về trong OptimizationResult.warnings.
+
+    time_budget (giây) bật chế độ giới hạn thời gian cho PuLP/sinh cột: mọi mã thanh có nghiệm heuristic
+    trước, thời gian còn lại dùng để cải thiện các mã chênh lệch cận dưới lớn nhất; hết giờ thì trả về
+    nghiệm tốt nhất đã có. Các phương pháp heuristic vốn đã nhanh nên không bị ảnh hưởng.
+
+    previous (OptimizationResult của lần chạy trước) bật chế độ tối ưu lại từng phần: chỉ các mã thanh
+    có nhu cầu, khoảng cách cắt, khổ thanh hoặc phương pháp thay đổi mới được giải lại.
+
+    solution_cache_path là tệp SQLite của bộ nhớ đệm nghiệm PuLP/sinh cột (None để tắt).
+
+    remnants ({mã thanh: danh sách (chiều dài, mã phần dư)}, xem remnant_store.load_inventory) bật việc
+    dùng phần dư tồn kho trước khi mở thanh mới. Mã thanh có phần dư luôn được giải lại, không dùng
+    kết quả lần trước hay bộ nhớ đệm nghiệm vì phương án phụ thuộc kho lúc chạy. Phần dư đã dùng nằm
+    trong OptimizationResult.used_remnant_ids(), phần dư mới trong OptimizationResult.offcuts().
     """
+    messages = []
     # Kiểm tra danh sách kích thước thanh
     if stock_length_options is None or not stock_length_options:
         raise ValueError("Vui lòng cung cấp ít nhất một kích thước thanh.")
+    started = time.perf_counter()
+    deadline = time.time() + time_budget if time_budget is not None else None
+
+    def report_progress(done, total, phase):
+        if progress_callback is not None:
+            progress_callback(done, total, phase)
 
-    # Kiểm tra xem cột "Mã Cửa" có tồn tại trong df không
-    has_door_code = "Mã Cửa" in df.columns
+    def check_cancelled():
+        if cancel_event is not None and cancel_event.is_set():
+            raise OptimizationCancelled("Đã hủy tối ưu hóa.")
 
-    # Mở rộng dữ liệu theo số lượng
-    expanded_data = []
-    oversized_warnings = []
+    # Gom nhu cầu theo nhóm thay vì mở rộng từng mảnh
+    report_progress(0, 0, "Gom nhu cầu")
+    demand = build_demand(df)
     max_stock_length = max(stock_length_options)
-    for idx, row in df.iterrows():
-        length = row['Chiều Dài']
-        if length > max_stock_length:
-            rounded_length = math.ceil((length + cutting_gap) / 100) * 100
-            oversized_warnings.append(f"Đoạn cắt {length}mm cho {row['Mã Thanh']} vượt khổ lớn nhất ({max_stock_length}mm). Đã làm tròn lên {rounded_length}mm.")
-        for i in range(int(row['Số Lượng'])):
-            item = {
-                'Mã Thanh': row['Mã Thanh'],
-                'Chiều Dài': length,
-                'Item ID': f"{row['Mã Thanh']}_{i+1}"
-            }
-            if has_door_code:
-                item['Mã Cửa'] = row['Mã Cửa']
-            expanded_data.append(item)
-    if oversized_warnings:
-        st.warning(" ".join(oversized_warnings))
+    oversized = demand[demand['Chiều Dài'] > max_stock_length]
+    if not oversized.empty:
+        oversized_warnings = [
+            f"Đoạn cắt {length}mm cho {code} vượt khổ lớn nhất ({max_stock_length}mm). Đã làm tròn lên {math.ceil((length + cutting_gap) / 100) * 100}mm."
+            for code, length in zip(oversized['Mã Thanh'], oversized['Chiều Dài'])
+        ]
+        _report(messages, 'warning', " ".join(oversized_warnings))
 
-    expanded_df = pd.DataFrame(expanded_data)
+    # Mọi phương pháp tính trên số nguyên phần mười mm; chỉ bảng kết quả được quy đổi lại ra mm
+    length_units = to_units(demand['Chiều Dài'])
+    if (np.abs(demand['Chiều Dài'].to_numpy(dtype=float) * LENGTH_SCALE - length_units) > 1e-6).any():
+        _report(messages, 'warning', "Có chiều dài lẻ hơn 0,1mm, đã làm tròn tới 0,1mm.")
+    demand['Chiều Dài'] = length_units
+    cutting_gap = to_unit(cutting_gap)
+    stock_length_options = [to_unit(stock_length) for stock_length in stock_length_options]
+    # Kho phần dư lưu mã thanh dạng chuỗi, còn mã thanh đọc từ Excel có thể là số
+    remnants = {
+        str(profile_code): [(to_unit(length), remnant_id) for length, remnant_id in items]
+        for profile_code, items in (remnants or {}).items()
+    }
 
-    profile_codes = expanded_df['Mã Thanh'].unique()
-    all_patterns = []
+    profile_groups = dict(tuple(demand.groupby('Mã Thanh', sort=False)))
+    profile_codes = list(profile_groups)
+    plans = []
     all_summaries = []
-    all_results = []
-
-    # Chia nhỏ mã thanh thành nhóm nếu dữ liệu lớn
-    max_codes_per_batch = 5
-    for i in range(0, len(profile_codes), max_codes_per_batch):
-        batch_codes = profile_codes[i:i + max_codes_per_batch]
-        for profile_code in batch_codes:
-            profile_data = expanded_df[expanded_df['Mã Thanh'] == profile_code].copy()
-            lengths = profile_data['Chiều Dài'].values
-            lengths = sorted(lengths, reverse=True)  # Sắp xếp giảm dần để tối ưu
-
-            # Tự động chuyển sang Tối Ưu Linh Hoạt nếu số mục > 100
-            if optimization_method == "Tối Ưu PuLP" and len(lengths) > 100:
-                st.warning(f"Dữ liệu cho {profile_code} có {len(lengths)} mục, quá lớn cho PuLP. Đã chuyển sang phương pháp Tối Ưu Linh Hoạt.")
-                optimization_method = "Tối Ưu Linh Hoạt"
-
-            if optimization_method == "Tối Ưu PuLP":
-                # Sử dụng PuLP để tối ưu
-                result_df, patterns_df, summary_df = optimize_with_pulp(profile_data, cutting_gap, stock_length_options)
-                if not result_df.empty:
-                    all_results.extend(result_df.to_dict('records'))
-                    all_patterns.extend(patterns_df.to_dict('records'))
-                    all_summaries.extend(summary_df.to_dict('records'))
+    profile_metrics = []
+
+    # Chế độ tối ưu lại từng phần: mã thanh có dấu vân tay trùng lần chạy trước được dùng lại nguyên phương án
+    fingerprints = {
+        profile_code: profile_fingerprint(profile_groups[profile_code], cutting_gap, stock_length_options, optimization_method)
+        for profile_code in profile_codes
+    }
+    remnant_codes = {profile_code for profile_code in profile_codes if remnants.get(str(profile_code))}
+    previous_outputs = previous.profile_outputs if previous is not None else {}
+    reused = {
+        profile_code: _reused_output(previous_outputs[fingerprint])
+        for profile_code, fingerprint in fingerprints.items() if fingerprint in previous_outputs and profile_code not in remnant_codes
+    }
+    solve_codes = [profile_code for profile_code in profile_codes if profile_code not in reused]
+
+    # Bộ nhớ đệm nghiệm trên đĩa cho PuLP/sinh cột: cùng tập chiều dài đã giải ở dự án khác thì không giải lại
+    cache_keys = {}
+    cache_hits = 0
+    if solution_cache_path and optimization_method in ANYTIME_METHODS:
+        for profile_code in solve_codes:
+            if profile_code in remnant_codes:
                 continue
+            cache_keys[profile_code] = solution_cache.demand_key(profile_groups[profile_code], cutting_gap, stock_length_options, optimization_method)
+            entry = solution_cache.lookup(cache_keys[profile_code], solution_cache_path)
+            if entry is not None:
+                reused[profile_code] = _cached_profile_output(profile_groups[profile_code], cutting_gap, optimization_method, stock_length_options, entry)
+                cache_hits += 1
+        solve_codes = [profile_code for profile_code in solve_codes if profile_code not in reused]
 
-            patterns = []
-            remaining_lengths = []
-            stock_lengths_used = []
-            patterns_data = []  # Khởi tạo patterns_data
-            bar_number = 1  # Khởi tạo bar_number
-
-            if optimization_method == "Tối Ưu Linh Hoạt":
-                # Chế độ linh hoạt: Sử dụng nhiều kích thước thanh
-                for length in lengths:
-                    best_fit = None
-                    best_remaining = float('inf')
-                    best_pattern_idx = -1
-                    best_stock_length = None
-
-                    # Thử gán vào các thanh hiện có
-                    for i, (pattern, remaining) in enumerate(zip(patterns, remaining_lengths)):
-                        if length <= remaining - cutting_gap:
-                            temp_remaining = remaining - (length + cutting_gap)
-                            if temp_remaining >= 0 and temp_remaining < best_remaining:
-                                best_remaining = temp_remaining
-                                best_pattern_idx = i
-
-                    # Thử tạo thanh mới
-                    for stock_length in sorted(stock_length_options):  # Sắp xếp để thử khổ nhỏ trước
-                        temp_remaining = stock_length - length - cutting_gap
-                        if temp_remaining >= 0 and temp_remaining < best_remaining:
-                            best_remaining = temp_remaining
-                            best_fit = [length]
-                            best_stock_length = stock_length
-                            best_pattern_idx = -1
-                        # Nếu vượt khổ, làm tròn lên chỉ cho đoạn cắt đơn lẻ
-                        elif temp_remaining < 0:
-                            required_length = length + cutting_gap
-                            if required_length > max_stock_length:
-                                selected_stock_length = math.ceil(required_length / 100) * 100
-                            else:
-                                selected_stock_length = max([sl for sl in stock_length_options if sl >= required_length], default=max_stock_length)
-                            temp_remaining = selected_stock_length - length - cutting_gap
-                            if temp_remaining >= 0 and temp_remaining < best_remaining:
-                                best_remaining = temp_remaining
-                                best_fit = [length]
-                                best_stock_length = selected_stock_length
-                                best_pattern_idx = -1
-
-                    if best_pattern_idx >= 0:
-                        patterns[best_pattern_idx].append(length)
-                        remaining_lengths[best_pattern_idx] = best_remaining
-                    else:
-                        if best_fit:
-                            patterns.append(best_fit)
-                            remaining_lengths.append(best_remaining)
-                            stock_lengths_used.append(best_stock_length)
+    total_codes = len(solve_codes)
+    phases = {
+        'demand_s': time.perf_counter() - started, 'workers': max(1, min(max_workers or 1, total_codes)),
+        'reused_codes': len(reused) - cache_hits, 'cache_hits': cache_hits, 'remnant_codes': len(remnant_codes)
+    }
+    phase_start = time.perf_counter()
 
-            else:
-                # Chế độ cũ: Chọn một kích thước thanh tốt nhất
-                best_patterns = []
-                best_remaining_lengths = []
-                best_stock_length = stock_length_options[0]
-                best_efficiency = 0
-                best_bar_count = float('inf')
-
-                for current_stock_length in stock_length_options:
-                    temp_patterns = []
-                    temp_remaining_lengths = []
-                    temp_stock_lengths = []
-
-                    for length in lengths:
-                        added = False
-                        for i, remaining in enumerate(temp_remaining_lengths):
-                            if length <= remaining - cutting_gap:
-                                temp_patterns[i].append(length)
-                                temp_remaining_lengths[i] -= (length + cutting_gap)
-                                if temp_remaining_lengths[i] >= 0:
-                                    added = True
-                                    break
-                        if not added:
-                            # Kiểm tra nếu vượt khổ
-                            required_length = length + cutting_gap
-                            selected_stock_length = current_stock_length
-                            if required_length > current_stock_length:
-                                if required_length > max_stock_length:
-                                    selected_stock_length = math.ceil(required_length / 100) * 100
-                                else:
-                                    selected_stock_length = max([sl for sl in stock_length_options if sl >= required_length], default=max_stock_length)
-                            temp_patterns.append([length])
-                            temp_remaining_lengths.append(selected_stock_length - length - cutting_gap)
-                            temp_stock_lengths.append(selected_stock_length)
-
-                    total_used_length = sum(sum(pattern) for pattern in temp_patterns)
-                    total_stock_length = sum(sl for sl in temp_stock_lengths)
-                    current_efficiency = total_used_length / total_stock_length if total_stock_length > 0 else 0
-
-                    if optimization_method == "Tối Ưu Hiệu Suất Cao Nhất":
-                        if current_efficiency > best_efficiency:
-                            best_patterns = temp_patterns
-                            best_remaining_lengths = temp_remaining_lengths
-                            best_stock_length = current_stock_length
-                            best_efficiency = current_efficiency
-                            best_bar_count = len(temp_patterns)
-                    else:  # Tối Ưu Số Lượng Thanh
-                        if len(temp_patterns) < best_bar_count or (len(temp_patterns) == best_bar_count and current_efficiency > best_efficiency):
-                            best_patterns = temp_patterns
-                            best_remaining_lengths = temp_remaining_lengths
-                            best_stock_length = current_stock_length
-                            best_efficiency = current_efficiency
-                            best_bar_count = len(temp_patterns)
-
-                patterns = best_patterns
-                remaining_lengths = best_remaining_lengths
-                stock_lengths_used = [best_stock_length] * len(patterns)
-
-            # Tạo dữ liệu mẫu cắt
-            for pattern, remaining, stock_length in zip(patterns, remaining_lengths, stock_lengths_used):
-                used_length = sum(pattern)
-                efficiency = used_length / stock_length if stock_length > 0 else 0
-                efficiency = max(0, min(100, efficiency * 100))
-                pattern_rounded = [round(x, 1) if x % 1 != 0 else int(x) for x in pattern]
-                note = ''
-                if stock_length > max_stock_length:
-                    note = f"Khổ thanh làm tròn lên {stock_length}mm do đoạn cắt vượt khổ lớn nhất ({max_stock_length}mm)"
-                patterns_data.append({
-                    'Mã Thanh': profile_code,
-                    'Số Thanh': bar_number,
-                    'Chiều Dài Thanh': stock_length,
-                    'Chiều Dài Sử Dụng': used_length,
-                    'Chiều Dài Còn Lại': remaining,
-                    'Hiệu Suất': efficiency,
-                    'Mẫu Cắt': '+'.join(map(str, pattern_rounded)),
-                    'Số Đoạn Cắt': len(pattern),
-                    'Ghi Chú': note
-                })
-
-                for length in pattern:
-                    unassigned_items = profile_data[(profile_data['Chiều Dài'] == length) &
-                                                   (~profile_data['Item ID'].isin([r.get('Item ID') for r in all_results]))]
-                    if not unassigned_items.empty:
-                        item_idx = unassigned_items.index[0]
-                        result_item = {
-                            'Mã Thanh': profile_code,
-                            'Item ID': profile_data.loc[item_idx, 'Item ID'],
-                            'Chiều Dài': length,
-                            'Số Thanh': bar_number
-                        }
-                        if has_door_code:
-                            result_item['Mã Cửa'] = profile_data.loc[item_idx, 'Mã Cửa']
-                        all_results.append(result_item)
-                        profile_data = profile_data.drop(item_idx)
-
-                bar_number += 1
-
-            all_patterns.extend(patterns_data)
-
-            total_bars = len(patterns_data)
-            total_length_needed = sum(lengths)
-            total_length_used = sum(pattern['Chiều Dài Thanh'] for pattern in patterns_data)
-            avg_efficiency = sum(p['Hiệu Suất'] for p in patterns_data) / len(patterns_data) if patterns_data else 0
-            overall_efficiency = (total_length_needed / total_length_used if total_length_used > 0 else 0) * 100
-            overall_efficiency = max(0, min(100, overall_efficiency))
-            avg_efficiency = max(0, min(100, avg_efficiency))
-            waste = total_length_used - total_length_needed - (len(lengths) - total_bars) * cutting_gap
-
-            all_summaries.append({
-                'Mã Thanh': profile_code,
-                'Tổng Đoạn Cắt': len(lengths),
-                'Số Thanh Sử Dụng': total_bars,
-                'Tổng Chiều Dài Cần (mm)': total_length_needed,
-                'Tổng Chiều Dài Nguyên Liệu (mm)': total_length_used,
-                'Phế Liệu (mm)': waste,
-                'Hiệu Suất Tổng Thể': overall_efficiency,
-                'Hiệu Suất Trung Bình': avg_efficiency
-            })
-
-    patterns_df = pd.DataFrame(all_patterns)
-    summary_df = pd.DataFrame(all_summaries)
-    result_df = pd.DataFrame(all_results)
+    # Mỗi mã thanh độc lập nên có thể giải song song trên nhiều tiến trình
+    outputs = [None] * total_codes
+    if deadline is not None and optimization_method in ANYTIME_METHODS:
+        phases['time_budget'] = time_budget
+        outputs = _solve_anytime(
+            profile_groups, solve_codes, cutting_gap, optimization_method, stock_length_options, max_workers,
+            deadline, report_progress, check_cancelled, phases, remnants
+        )
+        report_progress(total_codes, total_codes, "Ghép kết quả")
+    elif max_workers and max_workers > 1 and total_codes > 1:
+        executor = ProcessPoolExecutor(max_workers=min(max_workers, total_codes))
+        try:
+            futures = {
+                executor.submit(
+                    _optimize_profile_worker, profile_groups[profile_code], cutting_gap, optimization_method, stock_length_options,
+                    remnants=remnants.get(str(profile_code))
+                ): index
+                for index, profile_code in enumerate(solve_codes)
+            }
+            report_progress(0, total_codes, f"Đang giải {total_codes} mã thanh song song")
+            for done, future in enumerate(as_completed(futures), 1):
+                check_cancelled()
+                index = futures[future]
+                # Ghép kết quả theo thứ tự mã thanh để đầu ra không phụ thuộc thứ tự hoàn thành
+                outputs[index] = future.result()
+                report_progress(done, total_codes, f"Xong {solve_codes[index]}")
+        finally:
+            executor.shutdown(wait=cancel_event is None or not cancel_event.is_set(), cancel_futures=True)
+    else:
+        for index, profile_code in enumerate(solve_codes):
+            check_cancelled()
+            report_progress(index, total_codes, f"Đang giải {profile_code} ({optimization_method})")
+            outputs[index] = _optimize_profile_worker(
+                profile_groups[profile_code], cutting_gap, optimization_method, stock_length_options, remnants=remnants.get(str(profile_code))
+            )
+        report_progress(total_codes, total_codes, "Ghép kết quả")
+    solved = dict(zip(solve_codes, outputs))
+    for profile_code, output in solved.items():
+        bars = _cacheable_bars(output) if profile_code in cache_keys else None
+        if bars is not None:
+            solution_cache.store(cache_keys[profile_code], bars, output[2]['solver_status'], output[2]['lp_bound'], db_path=solution_cache_path)
+    outputs = [reused[profile_code] if profile_code in reused else solved[profile_code] for profile_code in profile_codes]
 
-    if not patterns_df.empty:
-        patterns_df = patterns_df.sort_values(['Mã Thanh', 'Số Thanh']).reset_index(drop=True)
-        patterns_df['Chiều Dài Sử Dụng'] = patterns_df['Chiều Dài Sử Dụng'].apply(lambda x: round(x, 1) if x % 1 != 0 else int(x))
-        patterns_df['Chiều Dài Còn Lại'] = patterns_df['Chiều Dài Còn Lại'].apply(lambda x: round(x, 1) if x % 1 != 0 else int(x))
+    phases['solve_s'] = time.perf_counter() - phase_start
+    phase_start = time.perf_counter()
+    for (plan, summaries), profile_messages, metrics in outputs:
+        messages.extend(profile_messages)
+        plans.append(plan)
+        all_summaries.extend(summaries)
+        profile_metrics.append(metrics)
+
+    # Bảng kết quả và mẫu cắt được dựng theo cột từ phương án đã sắp theo (mã thanh, số thanh)
+    plan = CutPlan.concat(plans).sorted()
+    patterns_df = plan.to_patterns_df()
+    result_df = plan.to_result_df()
+    source_columns = [column for column in SOURCE_COLUMNS if column in demand.columns]
+    if source_columns and not result_df.empty:
+        result_df = _attach_source_columns(result_df, profile_groups, source_columns)
+    summary_df = pd.DataFrame(all_summaries)
 
     if not summary_df.empty:
         summary_df = summary_df.sort_values('Mã Thanh').reset_index(drop=True)
-        summary_df['Phế Liệu (mm)'] = summary_df['Phế Liệu (mm)'].apply(lambda x: round(x, 1) if x % 1 != 0 else int(x))
+        # Chiều dài đã là bội 0,1mm; quy đổi lại để cột là số nguyên khi mọi giá trị là mm nguyên
+        for column in ['Tổng Chiều Dài Cần (mm)', 'Phế Liệu (mm)']:
+            summary_df[column] = from_units(to_units(summary_df[column]))
+        if remnant_codes:
+            summary_df['Số Phần Dư Sử Dụng'] = summary_df['Số Phần Dư Sử Dụng'].fillna(0).astype(int)
+            stock_bound_columns = ['Cận Dưới Nguyên Liệu (mm)', 'Chênh Lệch Nguyên Liệu (%)']
+            summary_df[stock_bound_columns] = summary_df[stock_bound_columns].astype(float)
+    phases['merge_s'] = time.perf_counter() - phase_start
+    phases['total_s'] = time.perf_counter() - started
+
+    # Nghiệm vội của chế độ giới hạn thời gian không được dùng lại: dấu vân tay không chứa time_budget
+    # nên lần chạy sau (có thể không giới hạn) sẽ nhận nhầm nghiệm chưa tốt. Kết quả có dùng phần dư
+    # phụ thuộc kho lúc chạy nên cũng không được dùng lại
+    profile_outputs = {
+        fingerprints[profile_code]: output for profile_code, output in zip(profile_codes, outputs)
+        if profile_code not in remnant_codes and not _is_time_limited(output[2])
+    }
+    return OptimizationResult(result_df, patterns_df, summary_df, plan, messages, {'phases': phases, 'profiles': profile_metrics}, profile_outputs)
 
-    if not result_df.empty:
-        result_df = result_df.sort_values(['Mã Thanh', 'Số Thanh']).reset_index(drop=True)
+def optimize_cutting(df, cutting_gap, optimization_method, stock_length_options, optimize_stock_length, max_workers=1,
+                     progress_callback=None, cancel_event=None, messages=None, metrics=None, time_budget=None,
+                     solution_cache_path=None):
+    """Giao diện cũ của run_optimization: trả về (result_df, patterns_df, summary_df).
 
-    return result_df, patterns_df, summary_df
+    Giao diện cũ không dùng bộ nhớ đệm nghiệm trừ khi truyền solution_cache_path, để nơi gọi cũ
+    không đọc/ghi tệp ngoài ý muốn.
+
+    messages (list) nhận các cảnh báo dạng dict; nếu không truyền, cảnh báo được ghi log.
+    metrics (dict) nhận chỉ số hiệu năng của lần chạy (xem OptimizationResult.metrics).
+    """
+    result = run_optimization(
+        df, cutting_gap, optimization_method, stock_length_options, max_workers=max_workers,
+        progress_callback=progress_callback, cancel_event=cancel_event, time_budget=time_budget,
+        solution_cache_path=solution_cache_path
+    )
+    for message in result.warnings:
+        if messages is None:
+            _report(None, message['level'], message['message'])
+        else:
+            messages.append(message)
+    if metrics is not None:
+        metrics.update(result.metrics)
+    return result.frames()
@@ -0,0 +1,237 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import uuid
+import zlib
+from datetime import datetime
+
+import pandas as pd
+
+# Lịch sử tối ưu hóa lưu trong SQLite: bảng metadata nhỏ để liệt kê/tìm kiếm,
+# bảng riêng chứa dữ liệu kết quả (nén zlib, dạng cột) chỉ đọc khi cần.
+DEFAULT_DB_PATH = "history.db"
+LEGACY_JSON_PATH = "history.json"
+
+FRAME_KEYS = ('result_df', 'patterns_df', 'summary_df')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    optimization_method TEXT,
+    stock_length_options TEXT NOT NULL,
+    cutting_gap REAL,
+    profile_codes TEXT NOT NULL,
+    metrics TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_name ON runs(name);
+CREATE INDEX IF NOT EXISTS idx_runs_timestamp ON runs(timestamp);
+CREATE TABLE IF NOT EXISTS run_profiles (
+    run_id TEXT NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    profile_code TEXT NOT NULL,
+    PRIMARY KEY (run_id, profile_code)
+);
+CREATE INDEX IF NOT EXISTS idx_run_profiles_code ON run_profiles(profile_code);
+CREATE TABLE IF NOT EXISTS run_payloads (
+    run_id TEXT PRIMARY KEY REFERENCES runs(id) ON DELETE CASCADE,
+    payload BLOB NOT NULL
+);
+"""
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+def _connect(db_path):
+    """Mở kết nối mới (mỗi lần gọi một kết nối, an toàn giữa các luồng/phiên)."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA foreign_keys = ON")
+    # Đường dẫn tương đối trỏ tới tệp khác khi thư mục làm việc đổi, nên ghi nhận theo đường dẫn tuyệt đối
+    path = os.path.abspath(db_path)
+    with _init_lock:
+        if path not in _initialized:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(_SCHEMA)
+            # Cơ sở dữ liệu tạo trước khi có cột metrics
+            if 'metrics' not in [row[1] for row in conn.execute("PRAGMA table_info(runs)")]:
+                conn.execute("ALTER TABLE runs ADD COLUMN metrics TEXT")
+            _migrate_legacy_json(conn, os.path.join(os.path.dirname(path), LEGACY_JSON_PATH))
+            _initialized.add(path)
+    return conn
+
+def _clean(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+def encode_frame(df):
+    """DataFrame -> dict dạng cột (tên cột + danh sách giá trị), NaN thành None."""
+    return {
+        'columns': [str(col) for col in df.columns],
+        'data': [[_clean(v) for v in df[col].tolist()] for col in df.columns]
+    }
+
+def decode_frame(encoded):
+    columns = encoded['columns']
+    return pd.DataFrame(dict(zip(columns, encoded['data'])), columns=columns)
+
+def _encode_payload(frames):
+    payload = {key: encode_frame(df) for key, df in frames.items()}
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 6)
+
+def _decode_payload(blob):
+    payload = json.loads(zlib.decompress(blob).decode('utf-8'))
+    return {key: decode_frame(encoded) for key, encoded in payload.items()}
+
+def _insert_run(conn, run_id, name, timestamp, optimization_method, stock_length_options, cutting_gap, profile_codes, frames, metrics=None):
+    conn.execute(
+        "INSERT OR IGNORE INTO runs (id, name, timestamp, optimization_method, stock_length_options, cutting_gap, profile_codes, metrics) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (run_id, name, timestamp, optimization_method, json.dumps(list(stock_length_options)), cutting_gap,
+         json.dumps(profile_codes, ensure_ascii=False),
+         None if metrics is None else json.dumps(metrics, ensure_ascii=False))
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO run_profiles (run_id, profile_code) VALUES (?, ?)",
+        [(run_id, code) for code in profile_codes]
+    )
+    conn.execute(
+        "INSERT OR IGNORE INTO run_payloads (run_id, payload) VALUES (?, ?)",
+        (run_id, _encode_payload(frames))
+    )
+
+def _migrate_legacy_json(conn, json_path):
+    """Chuyển một lần history.json cũ sang SQLite rồi đổi tên tệp cũ thành .bak."""
+    if not os.path.exists(json_path):
+        return
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            history_data = json.load(f)
+    except (OSError, ValueError):
+        return
+    with conn:
+        for entry in history_data:
+            frames = {key: pd.DataFrame(entry.get(key, {})) for key in FRAME_KEYS}
+            _insert_run(
+                conn, entry['id'], entry.get('name', entry['timestamp']), entry['timestamp'],
+                entry.get('optimization_method'), entry.get('stock_length_options', []), entry.get('cutting_gap'),
+                [str(code) for code in entry.get('profile_codes', [])], frames
+            )
+    os.replace(json_path, json_path + ".bak")
+
+def _row_to_meta(row):
+    return {
+        'id': row[0],
+        'name': row[1],
+        'timestamp': row[2],
+        'optimization_method': row[3],
+        'stock_length_options': json.loads(row[4]),
+        'cutting_gap': row[5],
+        'profile_codes': json.loads(row[6])
+    }
+
+_META_COLUMNS = "id, name, timestamp, optimization_method, stock_length_options, cutting_gap, profile_codes"
+
+def save_run(result_df, patterns_df, summary_df, stock_length_options, cutting_gap, optimization_method, name=None, metrics=None, db_path=DEFAULT_DB_PATH):
+    """Thêm một lần chạy (metadata + dữ liệu + chỉ số hiệu năng) trong một giao dịch, trả về mã lần chạy."""
+    run_id = str(uuid.uuid4())
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    profile_codes = [str(code) for code in summary_df['Mã Thanh'].unique().tolist()]
+    frames = {'result_df': result_df, 'patterns_df': patterns_df, 'summary_df': summary_df}
+    conn = _connect(db_path)
+    try:
+        with conn:
+            _insert_run(conn, run_id, name or timestamp, timestamp, optimization_method, stock_length_options, cutting_gap, profile_codes, frames, metrics)
+    finally:
+        conn.close()
+    return run_id
+
+def _like_pattern(text):
+    """Mẫu LIKE tìm text nguyên văn: thoát \\, % và _ (dùng kèm ESCAPE '\\')."""
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escaped}%"
+
+def _where_clause(search, profile_code):
+    clauses, params = [], []
+    if search:
+        clauses.append(
+            "(name LIKE ? ESCAPE '\\' OR timestamp LIKE ? ESCAPE '\\' OR optimization_method LIKE ? ESCAPE '\\' "
+            "OR id IN (SELECT run_id FROM run_profiles WHERE profile_code LIKE ? ESCAPE '\\'))"
+        )
+        params.extend([_like_pattern(search)] * 4)
+    if profile_code:
+        clauses.append("id IN (SELECT run_id FROM run_profiles WHERE profile_code = ?)")
+        params.append(profile_code)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+def list_runs(search=None, profile_code=None, limit=None, offset=0, db_path=DEFAULT_DB_PATH):
+    """Danh sách metadata (mới nhất trước), không đọc dữ liệu kết quả."""
+    where, params = _where_clause(search, profile_code)
+    query = f"SELECT {_META_COLUMNS} FROM runs{where} ORDER BY timestamp DESC, rowid DESC"
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+    conn = _connect(db_path)
+    try:
+        return [_row_to_meta(row) for row in conn.execute(query, params)]
+    finally:
+        conn.close()
+
+def count_runs(search=None, profile_code=None, db_path=DEFAULT_DB_PATH):
+    where, params = _where_clause(search, profile_code)
+    conn = _connect(db_path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM runs{where}", params).fetchone()[0]
+    finally:
+        conn.close()
+
+def get_run(run_id, with_frames=True, db_path=DEFAULT_DB_PATH):
+    """Một lần chạy theo mã; with_frames=True thì giải nén kèm các DataFrame kết quả."""
+    conn = _connect(db_path)
+    try:
+        row = conn.execute(f"SELECT {_META_COLUMNS} FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        entry = _row_to_meta(row)
+        metrics = conn.execute("SELECT metrics FROM runs WHERE id = ?", (run_id,)).fetchone()[0]
+        entry['metrics'] = json.loads(metrics) if metrics else None
+        if with_frames:
+            blob = conn.execute("SELECT payload FROM run_payloads WHERE run_id = ?", (run_id,)).fetchone()
+            entry.update(_decode_payload(blob[0]) if blob else {key: pd.DataFrame() for key in FRAME_KEYS})
+        return entry
+    finally:
+        conn.close()
+
+def record_export_time(run_id, seconds, db_path=DEFAULT_DB_PATH):
+    """Ghi thời gian tạo file Excel vào chỉ số hiệu năng của lần chạy."""
+    conn = _connect(db_path)
+    try:
+        with conn:
+            # Khóa ghi ngay từ đầu để đọc-sửa-ghi không chồng lên phiên khác
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT metrics FROM runs WHERE id = ?", (run_id,)).fetchone()
+            if row is None:
+                return
+            metrics = json.loads(row[0]) if row[0] else {'phases': {}, 'profiles': []}
+            metrics['export_s'] = seconds
+            conn.execute("UPDATE runs SET metrics = ? WHERE id = ?", (json.dumps(metrics, ensure_ascii=False), run_id))
+    finally:
+        conn.close()
+
+def rename_run(run_id, name, db_path=DEFAULT_DB_PATH):
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute("UPDATE runs SET name = ? WHERE id = ?", (name, run_id))
+    finally:
+        conn.close()
+
+def delete_run(run_id, db_path=DEFAULT_DB_PATH):
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM runs WHERE id = ?", (run_id,))
+    finally:
+        conn.close()
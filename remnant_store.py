@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import pandas as pd
+from sortedcontainers import SortedList
+
+# Kho phần dư (đoạn thanh còn lại sau khi cắt) theo mã thanh, lưu trong SQLite với chỉ mục
+# (mã thanh, chiều dài). Khi tối ưu, kho được nạp thành SortedList (chiều dài, mã phần dư) cho
+# từng mã thanh để tìm phần dư vừa khít nhất bằng một lần bisect.
+DEFAULT_DB_PATH = "remnants.db"
+DEFAULT_MIN_REMNANT_LENGTH = 500  # Phần dư ngắn hơn (mm) coi là phế liệu, không lưu kho
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS remnants (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    profile_code TEXT NOT NULL,
+    length REAL NOT NULL,
+    source TEXT,
+    created TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_remnants_code_length ON remnants(profile_code, length);
+"""
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    path = os.path.abspath(db_path)
+    with _init_lock:
+        if path not in _initialized:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(_SCHEMA)
+            _initialized.add(path)
+    return conn
+
+def load_inventory(profile_codes=None, db_path=DEFAULT_DB_PATH):
+    """Kho phần dư dạng {mã thanh: SortedList[(chiều dài, mã phần dư)]}, chỉ nạp các mã thanh cần dùng."""
+    conn = _connect(db_path)
+    try:
+        if profile_codes is None:
+            rows = conn.execute("SELECT profile_code, length, id FROM remnants ORDER BY profile_code, length")
+        else:
+            codes = [str(code) for code in profile_codes]
+            placeholders = ", ".join("?" * len(codes))
+            rows = conn.execute(
+                f"SELECT profile_code, length, id FROM remnants WHERE profile_code IN ({placeholders}) ORDER BY profile_code, length",
+                codes
+            ) if codes else []
+        inventory = {}
+        for profile_code, length, remnant_id in rows:
+            inventory.setdefault(profile_code, []).append((length, remnant_id))
+        # Các dòng đã sắp theo chiều dài nên dựng SortedList chỉ tốn O(n)
+        return {profile_code: SortedList(items) for profile_code, items in inventory.items()}
+    finally:
+        conn.close()
+
+def _insert(conn, remnants, source):
+    created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.executemany(
+        "INSERT INTO remnants (profile_code, length, source, created) VALUES (?, ?, ?, ?)",
+        [(str(profile_code), float(length), source, created) for profile_code, length in remnants]
+    )
+
+def add_remnants(remnants, source=None, db_path=DEFAULT_DB_PATH):
+    """Thêm phần dư [(mã thanh, chiều dài)] vào kho, trả về số phần dư đã thêm."""
+    remnants = list(remnants)
+    conn = _connect(db_path)
+    try:
+        with conn:
+            _insert(conn, remnants, source)
+    finally:
+        conn.close()
+    return len(remnants)
+
+def apply_run(used_ids, offcuts, source=None, db_path=DEFAULT_DB_PATH):
+    """Ghi kết quả một lần tối ưu vào kho trong một giao dịch: xóa phần dư đã dùng, thêm phần dư mới.
+
+    Trả về (số phần dư đã lấy ra, số phần dư mới); số lấy ra nhỏ hơn len(used_ids) nghĩa là
+    có phần dư đã bị lần chạy khác dùng trước.
+    """
+    used_ids = [int(remnant_id) for remnant_id in used_ids]
+    offcuts = list(offcuts)
+    conn = _connect(db_path)
+    try:
+        with conn:
+            consumed = 0
+            for start in range(0, len(used_ids), 500):
+                chunk = used_ids[start:start + 500]
+                consumed += conn.execute(f"DELETE FROM remnants WHERE id IN ({', '.join('?' * len(chunk))})", chunk).rowcount
+            _insert(conn, offcuts, source)
+    finally:
+        conn.close()
+    return consumed, len(offcuts)
+
+def inventory_summary(db_path=DEFAULT_DB_PATH):
+    """Bảng tổng hợp kho theo mã thanh: số phần dư, tổng, ngắn nhất, dài nhất."""
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT profile_code, COUNT(*), SUM(length), MIN(length), MAX(length) FROM remnants GROUP BY profile_code ORDER BY profile_code"
+        ).fetchall()
+    finally:
+        conn.close()
+    return pd.DataFrame(rows, columns=['Mã Thanh', 'Số Phần Dư', 'Tổng Chiều Dài (mm)', 'Ngắn Nhất (mm)', 'Dài Nhất (mm)'])
+
+def clear_profile(profile_code, db_path=DEFAULT_DB_PATH):
+    """Xóa mọi phần dư của một mã thanh."""
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM remnants WHERE profile_code = ?", (str(profile_code),))
+    finally:
+        conn.close()
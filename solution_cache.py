@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from cut_plan import LENGTH_SCALE
+
+# Bộ nhớ đệm nghiệm trên đĩa (SQLite) dùng chung giữa các lần khởi động và các tiến trình:
+# khóa là tập (chiều dài, số lượng) đã sắp xếp của một mã thanh cùng khổ thanh, khoảng cách cắt
+# và phương pháp; giá trị là danh sách thanh (mẫu cắt, khổ thanh) đã giải.
+DEFAULT_CACHE_PATH = "solution_cache.db"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS solutions (
+    key TEXT PRIMARY KEY,
+    payload BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_solutions_last_used ON solutions(last_used);
+"""
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    # Ghi nhận theo đường dẫn tuyệt đối như history_store: đường dẫn tương đối đổi nghĩa khi đổi thư mục làm việc
+    path = os.path.abspath(db_path)
+    with _init_lock:
+        if path not in _initialized:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.executescript(_SCHEMA)
+            _initialized.add(path)
+    return conn
+
+def demand_key(profile_demand, cutting_gap, stock_length_options, optimization_method):
+    """Khóa chuẩn của nhu cầu một mã thanh: không phụ thuộc mã thanh, mã cửa hay thứ tự dòng nhập."""
+    grouped = profile_demand.groupby('Chiều Dài')['Số Lượng'].sum().sort_index()
+    multiset = list(zip(grouped.index.to_numpy(dtype=np.int64).tolist(), grouped.to_numpy(dtype=np.int64).tolist()))
+    # Mọi chiều dài tính bằng số nguyên theo LENGTH_SCALE; đưa hệ số vào khóa để nghiệm lưu theo đơn vị khác không bị dùng nhầm
+    key = repr((LENGTH_SCALE, multiset, int(cutting_gap), sorted(set(int(s) for s in stock_length_options)), optimization_method))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def lookup(key, db_path=DEFAULT_CACHE_PATH):
+    """Nghiệm đã lưu theo khóa (dict 'bars', 'solver_status', 'lp_bound') hoặc None; lỗi đọc coi như không có."""
+    try:
+        conn = _connect(db_path)
+        try:
+            row = conn.execute("SELECT payload FROM solutions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with conn:
+                conn.execute("UPDATE solutions SET last_used = ? WHERE key = ?", (time.time(), key))
+            return json.loads(zlib.decompress(row[0]).decode('utf-8'))
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError, ValueError, zlib.error) as e:
+        logger.warning("Không đọc được bộ nhớ đệm nghiệm: %s", e)
+        return None
+
+def store(key, bars, solver_status, lp_bound=None, db_path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+    """Lưu nghiệm (danh sách (mẫu cắt, khổ thanh)) rồi xóa các mục lâu không dùng khi vượt max_bytes."""
+    payload = {
+        'bars': [[list(pattern), stock_length] for pattern, stock_length in bars],
+        'solver_status': solver_status,
+        'lp_bound': lp_bound
+    }
+    blob = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 6)
+    now = time.time()
+    try:
+        conn = _connect(db_path)
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO solutions (key, payload, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, blob, len(blob), now, now)
+                )
+                _evict(conn, max_bytes)
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("Không ghi được bộ nhớ đệm nghiệm: %s", e)
+
+def _evict(conn, max_bytes):
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM solutions").fetchone()[0]
+    if total <= max_bytes:
+        return
+    # Xóa theo thứ tự dùng lâu nhất cho tới khi còn 90% giới hạn để không phải dọn sau mỗi lần ghi
+    excess = total - int(max_bytes * 0.9)
+    stale = []
+    for key, size in conn.execute("SELECT key, size FROM solutions ORDER BY last_used ASC"):
+        if excess <= 0:
+            break
+        stale.append((key,))
+        excess -= size
+    conn.executemany("DELETE FROM solutions WHERE key = ?", stale)
+
+def clear(db_path=DEFAULT_CACHE_PATH):
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM solutions")
+    finally:
+        conn.close()
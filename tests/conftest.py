@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+
+# Các module nằm phẳng ở thư mục gốc của repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(autouse=True)
+def isolated_cwd(tmp_path, monkeypatch):
+    """Chạy mỗi test trong thư mục tạm để các tệp SQLite mặc định (bộ nhớ đệm nghiệm) không rơi vào repo."""
+    monkeypatch.chdir(tmp_path)
@@ -0,0 +1,39 @@
+import importlib
+
+import pandas as pd
+import pytest
+
+from cut_plan import CutPlan
+from cutting_optimizer import optimize_cutting
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    # app.py là script Streamlit: nhập ở chế độ bare trong thư mục tạm để không tạo tệp lịch sử trong repo
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.chdir(tmp_path_factory.mktemp('app'))
+        yield importlib.import_module('app')
+
+def order_plan():
+    df = pd.DataFrame([
+        {'Mã Thanh': 'A', 'Chiều Dài': 2900, 'Số Lượng': 50},
+        {'Mã Thanh': 'B', 'Chiều Dài': 1500.5, 'Số Lượng': 3},
+    ])
+    result_df, patterns_df, _ = optimize_cutting(df, 10, "Tối Ưu Linh Hoạt", [6000], True)
+    return CutPlan.from_frames(result_df, patterns_df)
+
+def test_bars_figure_draws_one_page_with_a_trace_per_piece_position(app):
+    plan = order_plan()
+    fig = app.build_bars_figure('run-1', 'A', 1, 20, 10, plan)
+    # 25 thanh hai mảnh: trang 2 có 5 thanh, hai trace vị trí mảnh và một trace phần còn lại
+    assert len(fig.data) == 3
+    first, second, remaining = fig.data
+    assert len(set(first.y)) == 5
+    assert list(first.x) == [2900] * 5 and list(first.base) == [0] * 5
+    assert list(second.base) == [2910] * 5
+    assert list(remaining.x) == [6000 - 2 * 2910] * 5
+    assert app.build_bars_figure('run-1', 'A', 1, 20, 10, plan) is fig
+
+def test_bars_figure_keeps_fractional_lengths(app):
+    fig = app.build_bars_figure('run-2', 'B', 0, 20, 10, order_plan())
+    assert list(fig.data[0].text) == ['1500.5']
+    assert list(fig.data[1].base) == [1510.5]
@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+
+import openpyxl
+import pandas as pd
+
+import batch_cli
+
+def write_order(path, rows):
+    pd.DataFrame(rows).to_excel(path, index=False)
+
+def test_batch_cli_optimizes_every_order_file(tmp_path, capsys):
+    write_order(tmp_path / "don_1.xlsx", [{'Mã Thanh': 'A', 'Chiều Dài': 1200, 'Số Lượng': 5}])
+    write_order(tmp_path / "don_2.xlsx", [{'Mã Thanh': 'B', 'Chiều Dài': 2500, 'Số Lượng': 3}])
+    write_order(tmp_path / "~$don_1.xlsx", [{'Mã Thanh': 'A', 'Chiều Dài': 1200, 'Số Lượng': 5}])
+    output_dir = tmp_path / "out"
+    exit_code = batch_cli.main([str(tmp_path), "-o", str(output_dir), "-s", "5800,6000", "-m", "Tối Ưu Linh Hoạt"])
+    assert exit_code == 0
+    assert sorted(os.listdir(output_dir)) == ["ket_qua_don_1.xlsx", "ket_qua_don_2.xlsx"]
+    assert "Hoàn tất 2/2 tệp." in capsys.readouterr().out
+    workbook = openpyxl.load_workbook(output_dir / "ket_qua_don_2.xlsx")
+    assert workbook["Chi Tiết Mảnh"].max_row == 4
+
+def test_batch_cli_reports_invalid_files(tmp_path, capsys):
+    write_order(tmp_path / "hong.xlsx", [{'Mã Thanh': 'A', 'Số Lượng': 5}])
+    assert batch_cli.main([str(tmp_path)]) == 1
+    assert "hong.xlsx" in capsys.readouterr().err
+
+def test_optimizer_core_does_not_import_streamlit():
+    code = "import sys, batch_cli, cutting_optimizer; print('streamlit' in sys.modules)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "False"
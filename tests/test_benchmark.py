@@ -0,0 +1,48 @@
+import pandas as pd
+
+import benchmark
+
+def test_generate_order_is_seeded():
+    first = benchmark.generate_order(10, seed=3)
+    pd.testing.assert_frame_equal(first, benchmark.generate_order(10, seed=3))
+    assert not first.equals(benchmark.generate_order(10, seed=4))
+    assert set(first.columns) == {'Mã Thanh', 'Chiều Dài', 'Số Lượng', 'Mã Cửa'}
+    assert first['Mã Cửa'].nunique() == 10
+
+def test_lower_bounds_sum_profile_bounds():
+    df = pd.DataFrame({
+        'Mã Thanh': ['A', 'A', 'B'],
+        'Chiều Dài': [2990, 7000, 1490],
+        'Số Lượng': [4, 1, 3],
+    })
+    # A: 4 x 3000mm -> 2 thanh 6000mm, cộng 1 đoạn vượt khổ (7010 -> 7100mm); B: 3 x 1500mm -> 1 thanh 5800mm
+    assert benchmark.lower_bounds(df, 10, [5800, 6000]) == (4, 12000 + 7100 + 5800)
+
+def test_run_case_reports_metrics_above_lower_bound():
+    df = benchmark.generate_order(3, seed=1)
+    metrics = benchmark.run_case(df, "Tối Ưu Linh Hoạt", 10, benchmark.DEFAULT_STOCK_LENGTHS, 1, measure_memory=True)
+    assert metrics['pieces'] == int(df['Số Lượng'].sum())
+    assert metrics['bars'] >= metrics['lower_bound_bars'] > 0
+    assert metrics['stock_length_mm'] >= metrics['lower_bound_stock_mm'] > 0
+    assert metrics['peak_memory_mb'] is not None
+    assert metrics['waste_mm'] >= 0
+
+def test_compare_reports_flags_slower_runs_and_extra_bars():
+    baseline = {'results': [
+        {'tier': 'small', 'seed': 1, 'method': 'M', 'wall_time_s': 1.0, 'bars': 10},
+        {'tier': 'small', 'seed': 1, 'method': 'N', 'wall_time_s': 1.0, 'bars': 10},
+    ]}
+    report = {'results': [
+        {'tier': 'small', 'seed': 1, 'method': 'M', 'wall_time_s': 1.5, 'bars': 11},
+        {'tier': 'small', 'seed': 1, 'method': 'N', 'wall_time_s': 1.1, 'bars': 10},
+        {'tier': 'large', 'seed': 1, 'method': 'M', 'wall_time_s': 9.0, 'bars': 99},
+    ]}
+    regressions = benchmark.compare_reports(report, baseline, time_tolerance=0.25)
+    assert len(regressions) == 2
+    assert all(line.startswith("small/M") for line in regressions)
+
+def test_main_writes_report(tmp_path):
+    output = tmp_path / "bao_cao.json"
+    args = ["--tiers", "small", "--methods", "Tối Ưu Linh Hoạt", "--no-memory", "--output", str(output)]
+    assert benchmark.main(args) == 0
+    assert benchmark.main(args + ["--compare", str(output), "--time-tolerance", "100"]) == 0
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from bounds import bar_lower_bounds, gap_percent, min_stock_total, profile_lower_bound
+from cutting_optimizer import optimize_cutting
+
+def demand(rows):
+    return pd.DataFrame([{'Mã Thanh': 'A', 'Chiều Dài': length, 'Số Lượng': count} for length, count in rows])
+
+def test_l1_is_total_size_over_capacity():
+    assert bar_lower_bounds([3000, 2000], [3, 1], 6000) == (2, 2)
+    assert bar_lower_bounds([], [], 6000) == (0, 0)
+
+def test_l2_counts_pieces_longer_than_half_a_bar():
+    # 3 đoạn 3100mm không đoạn nào ghép đôi được: L1 = 2 nhưng L2 = 3
+    assert bar_lower_bounds([3100], [3], 6000) == (2, 3)
+    # Đoạn 2600mm không ghép được với đoạn 3500mm, chỉ ghép đôi với nhau
+    assert bar_lower_bounds([3500, 2600], [3, 3], 6000) == (4, 5)
+
+def test_min_stock_total_combines_stock_lengths():
+    assert min_stock_total([5800, 6000, 6500], 2, 11700) == 11800
+    assert min_stock_total([5800, 6000, 6500], 3, 0) == 17400
+    assert min_stock_total([6000], 0, 6001) == 12000
+    assert min_stock_total([5800, 6000], 0, 0) == 0
+    # Bảng quy hoạch động quá lớn: trả về cận đơn giản
+    assert min_stock_total([5801, 6007], 2, 11000, max_units=100) == 11602
+
+def test_profile_bound_adds_oversized_bars():
+    # Cận làm việc trên số nguyên phần mười mm
+    bound = profile_lower_bound(demand([(31000, 3), (70000, 1)]), 100, [58000, 60000])
+    assert bound['bars'] == 4 and bound['l1'] == 3
+    assert bound['stock_length'] == 3 * 58000 + 71000
+
+def test_profile_bound_counts_slack_of_oversized_bars():
+    # Đoạn 6050mm cắt trên thanh 6100mm, còn dư 40mm vừa đúng cho đoạn 30mm: 1 thanh, 6100mm
+    bound = profile_lower_bound(demand([(60500, 1), (300, 1)]), 100, [60000])
+    assert bound['bars'] == 1 and bound['stock_length'] == 61000
+    assert bound['oversized_slack_usable']
+    order = demand([(6050, 1), (30, 1)])
+    _, patterns_df, summary_df = optimize_cutting(order, 10, "Tối Ưu Linh Hoạt", [6000], True)
+    assert len(patterns_df) == 1
+    assert summary_df['Tổng Chiều Dài Nguyên Liệu (mm)'].iloc[0] == 6100
+
+@pytest.mark.parametrize("method", ["Tối Ưu PuLP", "Tối Ưu Sinh Cột"])
+def test_solvers_keep_the_plan_using_oversized_slack(method):
+    order = demand([(6050, 1), (30, 1)])
+    _, patterns_df, summary_df = optimize_cutting(order, 10, method, [6000], True)
+    assert len(patterns_df) == 1
+    assert summary_df['Cận Dưới Nguyên Liệu (mm)'].iloc[0] == 6100
+    assert summary_df['Chênh Lệch Nguyên Liệu (%)'].iloc[0] == 0
+
+@pytest.mark.parametrize("method", ["Tối Ưu Linh Hoạt", "Tối Ưu PuLP", "Tối Ưu Sinh Cột"])
+def test_plans_never_beat_the_bound(method):
+    order = demand([(1210, 7), (2450, 5), (3300, 3), (870, 9), (6400, 2)])
+    _, patterns_df, summary_df = optimize_cutting(order, 10, method, [5800, 6000, 6500], True)
+    row = summary_df.iloc[0]
+    assert row['Số Thanh Sử Dụng'] >= row['Cận Dưới Số Thanh']
+    assert row['Tổng Chiều Dài Nguyên Liệu (mm)'] >= row['Cận Dưới Nguyên Liệu (mm)']
+
+def test_gap_percent():
+    assert gap_percent(11, 10) == pytest.approx(10.0)
+    assert gap_percent(5, 0) == 0.0
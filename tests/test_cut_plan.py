@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from cut_plan import CutPlan, from_units, length_texts
+
+def sample_plan(profile_code='A', door_codes=True):
+    # Chiều dài trong phương án là số nguyên phần mười mm
+    patterns = [[25000, 12000, 12000], [8505, 8505], [62000]]
+    remaining = [60000 - 25100 - 12100 * 2, 60000 - 8605 * 2, 63000 - 62100]
+    stock_lengths = [60000, 60000, 63000]
+    notes = ['', '', "Khổ thanh làm tròn lên 6300mm do đoạn cắt vượt khổ lớn nhất (6000mm)"]
+    item_ids = [f"{profile_code}_{i}" for i in range(1, 7)]
+    doors = ['D1', 'D1', 'D2', 'D2', 'D2', 'D3'] if door_codes else None
+    return CutPlan.from_bars(profile_code, patterns, remaining, stock_lengths, notes, item_ids, doors)
+
+def test_from_bars_builds_frames():
+    plan = sample_plan()
+    assert (plan.n_bars, plan.n_pieces) == (3, 6)
+    patterns_df = plan.to_patterns_df()
+    assert patterns_df['Số Thanh'].tolist() == [1, 2, 3]
+    assert patterns_df['Mẫu Cắt'].tolist() == ['2500+1200+1200', '850.5+850.5', '6200']
+    assert patterns_df['Số Đoạn Cắt'].tolist() == [3, 2, 1]
+    assert patterns_df['Chiều Dài Sử Dụng'].tolist() == [4900, 1701, 6200]
+    assert patterns_df['Chiều Dài Còn Lại'].tolist() == [1070, 4279, 90]
+    result_df = plan.to_result_df()
+    assert result_df['Item ID'].tolist() == [f"A_{i}" for i in range(1, 7)]
+    assert result_df['Số Thanh'].tolist() == [1, 1, 1, 2, 2, 3]
+    assert result_df['Chiều Dài'].tolist() == [2500, 1200, 1200, 850.5, 850.5, 6200]
+    assert result_df['Mã Cửa'].tolist() == ['D1', 'D1', 'D2', 'D2', 'D2', 'D3']
+
+def test_result_lengths_stay_integer_when_whole():
+    plan = CutPlan.from_bars('B', [[12000, 8000]], [39800], [60000], [''], ['B_1', 'B_2'])
+    result_df = plan.to_result_df()
+    assert result_df['Chiều Dài'].dtype.kind == 'i'
+    assert 'Mã Cửa' not in result_df.columns
+
+def test_from_frames_round_trips():
+    plan = sample_plan()
+    rebuilt = CutPlan.from_frames(plan.to_result_df(), plan.to_patterns_df())
+    pd.testing.assert_frame_equal(rebuilt.to_patterns_df(), plan.to_patterns_df())
+    pd.testing.assert_frame_equal(rebuilt.to_result_df(), plan.to_result_df())
+
+def test_concat_sorts_and_selects_profiles():
+    plan = CutPlan.concat([sample_plan('B', door_codes=False), CutPlan.empty(), sample_plan('A')]).sorted()
+    assert plan.bar_profile_codes.tolist() == ['A'] * 3 + ['B'] * 3
+    # Mã thanh không có mã cửa nhận None sau khi ghép
+    assert plan.to_result_df()['Mã Cửa'].iloc[6:].isna().all()
+    selected = plan.select_profile('B')
+    assert selected.n_pieces == 6
+    assert selected.to_patterns_df()['Mẫu Cắt'].tolist() == sample_plan('B').to_patterns_df()['Mẫu Cắt'].tolist()
+
+def test_unassigned_pieces_are_left_out_of_result():
+    plan = CutPlan.from_bars('C', [[10000, 5000]], [44900], [60000], [''], ['C_1', None])
+    assert plan.to_result_df()['Item ID'].tolist() == ['C_1']
+    assert plan.to_patterns_df()['Số Đoạn Cắt'].tolist() == [2]
+
+def test_length_helpers():
+    assert from_units(np.array([10, 20])).dtype.kind == 'i'
+    assert from_units(np.array([12, 20])).tolist() == [1.2, 2.0]
+    assert length_texts(np.array([31700, 31705])) == ['3170', '3170.5']
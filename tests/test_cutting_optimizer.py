@@ -0,0 +1,373 @@
+import math
+import multiprocessing
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import generate_order
+from cut_plan import round_up_stock, to_unit, to_units
+from cutting_optimizer import (
+    DEADLINE_GRACE_SECONDS, MaxSegmentTree, OptimizationCancelled, first_fit_decreasing_all,
+    best_fit_flexible, build_demand, build_length_queues, expand_items, expand_lengths, new_profile_metrics, optimize_cutting,
+    optimize_profile, optimize_with_column_generation, optimize_with_pulp, profile_fingerprint, run_optimization, _enumerate_maximal_patterns, _shutdown_now, _solve_master_lp,
+)
+
+STOCK_LENGTHS = [5800, 6000, 6500]
+# Các hàm tối ưu từng mã thanh làm việc trên số nguyên phần mười mm
+GAP_UNITS = to_unit(10)
+STOCK_UNITS = [to_unit(stock_length) for stock_length in STOCK_LENGTHS]
+
+def in_units(demand):
+    return demand.assign(**{'Chiều Dài': to_units(demand['Chiều Dài'])})
+
+def small_order():
+    """Đơn hàng nhỏ có dòng trùng (Mã Thanh, Chiều Dài, Mã Cửa) để kiểm tra việc gom nhóm."""
+    return pd.DataFrame([
+        {'Mã Thanh': 'A', 'Chiều Dài': 1200, 'Số Lượng': 3, 'Mã Cửa': 'D1'},
+        {'Mã Thanh': 'A', 'Chiều Dài': 1200, 'Số Lượng': 2, 'Mã Cửa': 'D1'},
+        {'Mã Thanh': 'A', 'Chiều Dài': 800, 'Số Lượng': 4, 'Mã Cửa': 'D2'},
+        {'Mã Thanh': 'B', 'Chiều Dài': 2500, 'Số Lượng': 3, 'Mã Cửa': 'D1'},
+        {'Mã Thanh': 'B', 'Chiều Dài': 700, 'Số Lượng': 0, 'Mã Cửa': 'D1'},
+    ])
+
+def test_build_demand_groups_rows_and_drops_zero_quantities():
+    demand = build_demand(small_order())
+    assert len(demand) == 3
+    counts = demand.set_index(['Mã Thanh', 'Chiều Dài'])['Số Lượng']
+    assert counts[('A', 1200)] == 5
+    assert counts[('A', 800)] == 4
+    assert counts[('B', 2500)] == 3
+
+def test_expand_items_numbers_pieces_across_the_profile_code():
+    demand = build_demand(small_order())
+    profile_demand = demand[demand['Mã Thanh'] == 'A']
+    items = expand_items(profile_demand)
+    assert len(items) == len(expand_lengths(profile_demand)) == 9
+    assert items['Item ID'].tolist() == [f"A_{i}" for i in range(1, 10)]
+    assert 'Số Lượng' not in items.columns
+
+@pytest.mark.parametrize("method", ["Tối Ưu Hiệu Suất Cao Nhất", "Tối Ưu Số Lượng Thanh", "Tối Ưu Linh Hoạt", "Tối Ưu PuLP", "Tối Ưu Sinh Cột"])
+def test_optimize_cutting_cuts_every_piece(method):
+    result_df, patterns_df, summary_df = optimize_cutting(small_order(), 10, method, STOCK_LENGTHS, True)
+    cuts = summary_df.set_index('Mã Thanh')['Tổng Đoạn Cắt'].to_dict()
+    assert cuts == {'A': 9, 'B': 3}
+    assert patterns_df['Số Đoạn Cắt'].sum() >= 12
+
+def test_build_length_queues_keeps_piece_order_per_length():
+    queues = build_length_queues([1200, 800, 1200, 800, 1200])
+    assert list(queues[1200]) == [0, 2, 4]
+    assert list(queues[800]) == [1, 3]
+
+@pytest.mark.parametrize("method", ["Tối Ưu Hiệu Suất Cao Nhất", "Tối Ưu Số Lượng Thanh", "Tối Ưu Linh Hoạt"])
+def test_heuristic_result_assigns_each_piece_once(method):
+    result_df, patterns_df, _ = optimize_cutting(small_order(), 10, method, STOCK_LENGTHS, True)
+    assert len(result_df) == 12
+    assert result_df['Item ID'].is_unique
+    assert result_df.groupby('Mã Thanh').size().to_dict() == {'A': 9, 'B': 3}
+    assert result_df['Số Thanh'].max() <= patterns_df['Số Thanh'].max()
+
+def test_master_lp_pivots_from_homogeneous_basis_to_optimum():
+    # Mẫu giữa cắt được cả hai chiều dài nên một thanh là đủ
+    matrix = np.array([[3.0, 3.0, 0.0], [0.0, 2.0, 2.0]])
+    costs = np.array([1.0, 1.0, 1.0])
+    x, duals, basis = _solve_master_lp(matrix, costs, [3, 2], basis=[2, 4])
+    assert costs @ x == pytest.approx(1.0)
+    assert np.all(matrix @ x >= np.array([3, 2]) - 1e-9)
+    assert duals @ np.array([3, 2]) == pytest.approx(1.0)
+
+def mixed_order(seed=5, profile_codes=('K',), rows=25):
+    rng = np.random.default_rng(seed)
+    return pd.concat([
+        pd.DataFrame({
+            'Mã Thanh': code,
+            'Chiều Dài': rng.integers(300, 2800, size=rows),
+            'Số Lượng': rng.integers(1, 12, size=rows),
+        })
+        for code in profile_codes
+    ], ignore_index=True)
+
+def test_column_generation_plan_is_feasible():
+    demand = build_demand(mixed_order())
+    plan, summaries = optimize_with_column_generation(in_units(demand), GAP_UNITS, STOCK_UNITS)
+    result_df, patterns_df, summary_df = plan.to_result_df(), plan.to_patterns_df(), pd.DataFrame(summaries)
+    # Mỗi mảnh được gán đúng một lần, đúng chiều dài yêu cầu
+    assert len(result_df) == demand['Số Lượng'].sum()
+    assert result_df['Item ID'].is_unique
+    assert sorted(result_df['Chiều Dài']) == sorted(expand_lengths(demand))
+    # Mỗi thanh chứa vừa các đoạn cắt kèm khoảng cách cắt
+    for _, bar in patterns_df.iterrows():
+        assert bar['Chiều Dài Thanh'] in STOCK_LENGTHS
+        assert bar['Chiều Dài Còn Lại'] >= 0
+    assert summary_df['Tổng Chiều Dài Nguyên Liệu (mm)'].iat[0] == patterns_df['Chiều Dài Thanh'].sum()
+
+def test_enumerated_patterns_are_feasible_and_maximal():
+    sizes, limits, capacity, max_cuts = [2510, 1810, 1210, 710], [2, 3, 4, 5], 6000, 4
+    patterns, truncated = _enumerate_maximal_patterns(sizes, limits, capacity, max_cuts, max_patterns=1000)
+    assert not truncated
+    assert len({tuple(counts) for counts in patterns}) == len(patterns)
+    for counts in patterns:
+        used = sum(size * count for size, count in zip(sizes, counts))
+        assert used <= capacity
+        assert sum(counts) <= max_cuts
+        assert all(count <= limit for count, limit in zip(counts, limits))
+        # Không thêm được mảnh nào nữa
+        assert sum(counts) == max_cuts or all(
+            count == limit or size > capacity - used for size, count, limit in zip(sizes, counts, limits)
+        )
+
+def test_enumeration_reports_truncation():
+    patterns, truncated = _enumerate_maximal_patterns([510, 410, 310, 210], [9, 9, 9, 9], 6000, 8, max_patterns=5)
+    assert truncated
+    assert len(patterns) == 5
+
+def test_pulp_plan_covers_demand_exactly():
+    demand = build_demand(small_order())
+    plan, summaries = optimize_with_pulp(in_units(demand[demand['Mã Thanh'] == 'A']), GAP_UNITS, STOCK_UNITS)
+    result_df, patterns_df = plan.to_result_df(), plan.to_patterns_df()
+    assert sorted(result_df['Chiều Dài']) == sorted(expand_lengths(demand[demand['Mã Thanh'] == 'A']))
+    assert patterns_df['Số Đoạn Cắt'].sum() == 9
+    assert summaries[0]['Số Thanh Sử Dụng'] == 2
+
+@pytest.mark.parametrize("method", ["Tối Ưu PuLP", "Tối Ưu Sinh Cột", "Tối Ưu Linh Hoạt"])
+def test_parallel_run_matches_serial_run(method):
+    # Không có giới hạn thời gian: nghiệm từng mã thanh không phụ thuộc số tiến trình hay tốc độ máy
+    df = mixed_order(seed=11, profile_codes=('K1', 'K2', 'K3'), rows=12)
+    serial = optimize_cutting(df, 10, method, STOCK_LENGTHS, True, max_workers=1)
+    parallel = optimize_cutting(df, 10, method, STOCK_LENGTHS, True, max_workers=3)
+    for serial_df, parallel_df in zip(serial, parallel):
+        pd.testing.assert_frame_equal(serial_df, parallel_df)
+
+def scan_best_fit(lengths, cutting_gap, stock_length_options):
+    """Best-fit quét toàn bộ thanh đang mở, dùng làm đối chiếu cho best_fit_flexible."""
+    patterns, remaining_lengths, stock_lengths_used = [], [], []
+    for length in lengths:
+        required = length + cutting_gap
+        fits = [(remaining - required, i) for i, remaining in enumerate(remaining_lengths) if remaining >= required]
+        best_remaining, best_index = min(fits, default=(math.inf, -1))
+        new_stock = min((sl for sl in stock_length_options if sl >= required), default=round_up_stock(required))
+        if best_index >= 0 and best_remaining <= new_stock - required:
+            patterns[best_index].append(length)
+            remaining_lengths[best_index] = best_remaining
+        else:
+            patterns.append([length])
+            remaining_lengths.append(new_stock - required)
+            stock_lengths_used.append(new_stock)
+    return patterns, remaining_lengths, stock_lengths_used
+
+@pytest.mark.parametrize("seed", range(5))
+def test_best_fit_flexible_matches_linear_scan(seed):
+    rng = random.Random(seed)
+    lengths = sorted((rng.randint(2000, 30000) for _ in range(300)), reverse=True) + [70000]
+    assert best_fit_flexible(lengths, GAP_UNITS, STOCK_UNITS) == scan_best_fit(lengths, GAP_UNITS, STOCK_UNITS)
+
+def test_best_fit_flexible_tie_breaking():
+    # Thanh đang mở và thanh 1990 mới đều còn 490: ưu tiên thanh đang mở
+    patterns, remaining, used = best_fit_flexible([4000, 1490], 10, [1990, 6000])
+    assert patterns == [[4000, 1490]]
+    assert remaining == [490]
+    # Hai thanh đang mở còn như nhau: ưu tiên thanh mở sớm hơn
+    patterns, _, _ = best_fit_flexible([4000, 4000, 1490], 10, [6000])
+    assert patterns == [[4000, 1490], [4000]]
+
+def test_max_segment_tree_finds_first_leaf_with_room():
+    tree = MaxSegmentTree(5)
+    for index, value in enumerate([300, 800, 500, 900, 100]):
+        tree.update(index, value)
+    assert tree.first_at_least(400) == 1
+    assert tree.first_at_least(850) == 3
+    assert tree.first_at_least(1000) == -1
+    tree.update(1, 200)
+    assert tree.first_at_least(400) == 2
+
+def scan_first_fit(lengths, cutting_gap, stock_length):
+    """First-fit quét tuyến tính cho một khổ, dùng làm đối chiếu."""
+    patterns, remaining_lengths = [], []
+    for length in lengths:
+        required = length + cutting_gap
+        index = next((i for i, remaining in enumerate(remaining_lengths) if remaining >= required), -1)
+        if index >= 0:
+            patterns[index].append(length)
+            remaining_lengths[index] -= required
+        else:
+            patterns.append([length])
+            remaining_lengths.append(stock_length - required)
+    return patterns, remaining_lengths
+
+@pytest.mark.parametrize("seed", range(3))
+def test_first_fit_decreasing_all_matches_scan_for_every_stock(seed):
+    rng = random.Random(seed)
+    lengths = sorted((rng.randint(200, 3000) for _ in range(400)), reverse=True)
+    candidates = first_fit_decreasing_all(lengths, 10, STOCK_LENGTHS)
+    assert len(candidates) == len(STOCK_LENGTHS)
+    for stock_length, (patterns, remaining_lengths, stock_lengths_used) in zip(STOCK_LENGTHS, candidates):
+        assert (patterns, remaining_lengths) == scan_first_fit(lengths, 10, stock_length)
+        assert stock_lengths_used == [stock_length] * len(patterns)
+
+def test_first_fit_decreasing_all_rounds_up_oversized_pieces():
+    candidates = first_fit_decreasing_all([62000, 10000], GAP_UNITS, [58000, 60000])
+    for patterns, remaining_lengths, stock_lengths_used in candidates:
+        assert patterns[0] == [62000]
+        assert stock_lengths_used[0] == 63000
+
+def test_progress_is_reported_per_profile_code():
+    calls = []
+    optimize_cutting(small_order(), 10, "Tối Ưu Linh Hoạt", STOCK_LENGTHS, True,
+                     progress_callback=lambda done, total, phase: calls.append((done, total)))
+    assert calls[-1] == (2, 2)
+    done_counts = [done for done, total in calls if total == 2]
+    assert done_counts == sorted(done_counts)
+
+def test_cancelled_run_raises():
+    cancel_event = threading.Event()
+    cancel_event.set()
+    with pytest.raises(OptimizationCancelled):
+        optimize_cutting(small_order(), 10, "Tối Ưu Linh Hoạt", STOCK_LENGTHS, True, cancel_event=cancel_event)
+
+def test_warnings_are_collected_in_messages():
+    messages = []
+    df = pd.DataFrame([{'Mã Thanh': 'L', 'Chiều Dài': 7000, 'Số Lượng': 1}])
+    optimize_cutting(df, 10, "Tối Ưu Linh Hoạt", STOCK_LENGTHS, True, messages=messages)
+    assert [message['level'] for message in messages] == ['warning']
+    assert "7000mm" in messages[0]['message']
+
+def test_run_optimization_records_phase_metrics():
+    result = run_optimization(mixed_order(5, ['A', 'B'], 6), 10, "Tối Ưu Linh Hoạt", STOCK_LENGTHS)
+    assert set(result.metrics['phases']) >= {'demand_s', 'solve_s', 'merge_s', 'total_s'}
+    profiles = result.metrics['profiles']
+    assert [m['profile_code'] for m in profiles] == ['A', 'B']
+    for m in profiles:
+        assert m['method'] == "Tối Ưu Linh Hoạt"
+        assert m['pattern_count'] == int((result.patterns_df['Mã Thanh'] == m['profile_code']).sum())
+        assert m['total_s'] >= m['assign_s'] >= 0
+
+@pytest.mark.parametrize("solve", [optimize_with_pulp, optimize_with_column_generation])
+def test_solver_metrics_are_reported(solve):
+    demand = build_demand(small_order())
+    metrics = {}
+    solve(in_units(demand[demand['Mã Thanh'] == 'A']), GAP_UNITS, STOCK_UNITS, metrics=metrics)
+    assert metrics['solver_calls'] >= 1
+    assert metrics['pattern_count'] > 0
+    assert metrics['solve_s'] >= 0 and metrics['build_s'] >= 0
+    assert metrics['hit_limit'] is False
+
+def test_solver_is_skipped_when_heuristic_reaches_bound():
+    demand = build_demand(small_order())
+    profile_demand = in_units(demand[demand['Mã Thanh'] == 'A'])
+    metrics = new_profile_metrics('A', "Tối Ưu PuLP", profile_demand)
+    plan, summaries = optimize_profile(profile_demand, GAP_UNITS, "Tối Ưu PuLP", STOCK_UNITS, metrics=metrics)
+    assert metrics['solver_status'] == "Đạt cận dưới"
+    assert metrics['solver_calls'] is None
+    assert int(plan.bar_stock_lengths.sum()) // 10 == metrics['lower_bound_stock'] == summaries[0]['Cận Dưới Nguyên Liệu (mm)']
+
+def short_lengths_order(profile_count=4, seed=3):
+    """Đơn hàng có 20 chiều dài ngắn phân biệt mỗi mã thanh: PuLP phải liệt kê tới giới hạn mẫu và CBC giải lâu."""
+    rng = random.Random(seed)
+    rows = [
+        {'Mã Thanh': f"X{code}", 'Chiều Dài': rng.randint(150, 700), 'Số Lượng': rng.randint(5, 20)}
+        for code in range(profile_count) for _ in range(20)
+    ]
+    return pd.DataFrame(rows)
+
+@pytest.mark.parametrize("method", ["Tối Ưu PuLP", "Tối Ưu Sinh Cột"])
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_time_budget_bounds_wall_time(method, max_workers):
+    budget = 2
+    started = time.time()
+    result = run_optimization(short_lengths_order(), 10, method, STOCK_LENGTHS, max_workers=max_workers, time_budget=budget)
+    elapsed = time.time() - started
+    assert elapsed < budget + DEADLINE_GRACE_SECONDS + 1.0
+    assert len(result.summary_df) == 4
+    assert result.summary_df['Số Thanh Sử Dụng'].sum() == len(result.patterns_df)
+    # Không để tiến trình con chạy nền sau khi đã trả kết quả
+    time.sleep(0.2)
+    assert not multiprocessing.active_children()
+
+def test_time_budget_never_uses_more_stock_than_heuristic():
+    order = mixed_order(11, ['A', 'B'], 12)
+    budgeted = run_optimization(order, 10, "Tối Ưu PuLP", STOCK_LENGTHS, time_budget=5)
+    heuristic = run_optimization(order, 10, "Tối Ưu Linh Hoạt", STOCK_LENGTHS)
+    column = 'Tổng Chiều Dài Nguyên Liệu (mm)'
+    assert budgeted.summary_df[column].sum() <= heuristic.summary_df[column].sum()
+
+class _ExecutorWithoutProcesses:
+    def __init__(self):
+        self.calls = []
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.calls.append((wait, cancel_futures))
+
+def test_shutdown_now_falls_back_without_private_processes():
+    executor = _ExecutorWithoutProcesses()
+    _shutdown_now(executor)
+    assert executor.calls == [(False, True)]
+
+def total_stock(result):
+    return result.summary_df['Tổng Chiều Dài Nguyên Liệu (mm)'].sum()
+
+def test_profile_fingerprint_tracks_demand_and_parameters():
+    demand = build_demand(small_order())
+    profile_demand = demand[demand['Mã Thanh'] == 'A']
+    key = profile_fingerprint(profile_demand, 10, STOCK_LENGTHS, "Tối Ưu PuLP")
+    assert key == profile_fingerprint(profile_demand.copy(), 10, list(reversed(STOCK_LENGTHS)), "Tối Ưu PuLP")
+    # Kiểu số khác (int/float) không làm đổi dấu vân tay
+    assert key == profile_fingerprint(profile_demand.astype({'Chiều Dài': float}), 10, STOCK_LENGTHS, "Tối Ưu PuLP")
+    changed = profile_demand.copy()
+    changed.loc[changed.index[0], 'Số Lượng'] += 1
+    assert key != profile_fingerprint(changed, 10, STOCK_LENGTHS, "Tối Ưu PuLP")
+    assert key != profile_fingerprint(profile_demand, 5, STOCK_LENGTHS, "Tối Ưu PuLP")
+    assert key != profile_fingerprint(profile_demand, 10, STOCK_LENGTHS, "Tối Ưu Sinh Cột")
+
+def test_previous_result_reuses_unchanged_codes():
+    order = mixed_order(2, ['A', 'B', 'C'], 8)
+    first = run_optimization(order, 10, "Tối Ưu PuLP", STOCK_LENGTHS)
+    changed = order.copy()
+    changed.loc[changed['Mã Thanh'] == 'B', 'Số Lượng'] += 1
+    rerun = run_optimization(changed, 10, "Tối Ưu PuLP", STOCK_LENGTHS, previous=first)
+    fresh = run_optimization(changed, 10, "Tối Ưu PuLP", STOCK_LENGTHS)
+    assert rerun.metrics['phases']['reused_codes'] == 2
+    assert [m['reused'] for m in rerun.metrics['profiles']] == [True, False, True]
+    for rerun_df, fresh_df in zip(rerun.frames(), fresh.frames()):
+        pd.testing.assert_frame_equal(rerun_df, fresh_df)
+
+def test_budgeted_plans_are_not_reused_by_unbudgeted_run():
+    order = generate_order(10, 1)
+    method = "Tối Ưu Sinh Cột"
+    rushed = run_optimization(order, 10, method, STOCK_LENGTHS, time_budget=0.01)
+    rerun = run_optimization(order, 10, method, STOCK_LENGTHS, previous=rushed)
+    fresh = run_optimization(order, 10, method, STOCK_LENGTHS)
+
+    # Chỉ mã thanh đã đạt cận dưới trong lần chạy vội mới được dùng lại
+    at_bound = sum(profile['solver_status'] == "Đạt cận dưới" for profile in rushed.metrics['profiles'])
+    assert len(rushed.profile_outputs) == at_bound
+    assert rerun.metrics['phases']['reused_codes'] == at_bound
+    assert total_stock(rushed) > total_stock(fresh)
+    assert total_stock(rerun) == total_stock(fresh)
+
+@pytest.mark.parametrize("method", ["Tối Ưu Linh Hoạt", "Tối Ưu PuLP", "Tối Ưu Sinh Cột"])
+def test_fractional_lengths_are_exact_in_tenths_of_a_millimetre(method):
+    df = pd.DataFrame([
+        {'Mã Thanh': 'F', 'Chiều Dài': 1450.5, 'Số Lượng': 3},
+        {'Mã Thanh': 'F', 'Chiều Dài': 2899.5, 'Số Lượng': 1},
+        {'Mã Thanh': 'W', 'Chiều Dài': 1200, 'Số Lượng': 4},
+    ])
+    result_df, patterns_df, summary_df = optimize_cutting(df, 10, method, [6000], True)
+    assert sorted(result_df.loc[result_df['Mã Thanh'] == 'F', 'Chiều Dài']) == [1450.5, 1450.5, 1450.5, 2899.5]
+    # 3 x 1460.5 + 2909.5 = 7291mm: hai thanh 6000mm, phế liệu đúng tới 0,1mm
+    row = summary_df.set_index('Mã Thanh').loc['F']
+    assert row['Tổng Chiều Dài Cần (mm)'] == 7251
+    assert row['Phế Liệu (mm)'] == 12000 - 7251 - 2 * 10
+    assert summary_df['Tổng Chiều Dài Cần (mm)'].dtype.kind == 'i'
+    assert summary_df['Phế Liệu (mm)'].dtype.kind == 'i'
+    assert patterns_df['Chiều Dài Thanh'].dtype.kind == 'i'
+
+def test_lengths_finer_than_a_tenth_are_rounded_with_a_warning():
+    messages = []
+    df = pd.DataFrame([{'Mã Thanh': 'F', 'Chiều Dài': 1000.04, 'Số Lượng': 1}, {'Mã Thanh': 'F', 'Chiều Dài': 999.25, 'Số Lượng': 1}])
+    result_df, _, summary_df = optimize_cutting(df, 10, "Tối Ưu Linh Hoạt", [6000], True, messages=messages)
+    assert sorted(result_df['Chiều Dài']) == [999.2, 1000.0]
+    assert summary_df['Tổng Chiều Dài Cần (mm)'].iloc[0] == pytest.approx(1999.2)
+    assert any("0,1mm" in message['message'] for message in messages)
@@ -0,0 +1,103 @@
+import json
+import os
+import sqlite3
+
+import pandas as pd
+
+import history_store
+
+def frames(code='A'):
+    result_df = pd.DataFrame({'Mã Thanh': [code, code], 'Item ID': [f"{code}_1", f"{code}_2"], 'Chiều Dài': [1200, 850.5], 'Số Thanh': [1, 1]})
+    patterns_df = pd.DataFrame({'Mã Thanh': [code], 'Số Thanh': [1], 'Chiều Dài Thanh': [6000], 'Ghi Chú': [None]})
+    summary_df = pd.DataFrame({'Mã Thanh': [code], 'Số Thanh Sử Dụng': [1], 'Hiệu Suất Tổng Thể': [34.2]})
+    return result_df, patterns_df, summary_df
+
+def save(db_path, name, code='A', method="Tối Ưu PuLP"):
+    return history_store.save_run(*frames(code), [5800, 6000], 10, method, name=name, db_path=db_path)
+
+def test_saved_run_round_trips_frames(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    run_id = save(db_path, "đơn 1")
+    entry = history_store.get_run(run_id, db_path=db_path)
+    assert entry['name'] == "đơn 1"
+    assert entry['stock_length_options'] == [5800, 6000]
+    assert entry['profile_codes'] == ['A']
+    for key, expected in zip(history_store.FRAME_KEYS, frames()):
+        pd.testing.assert_frame_equal(entry[key], expected, check_dtype=False)
+    assert 'result_df' not in history_store.get_run(run_id, with_frames=False, db_path=db_path)
+
+def test_relative_path_is_initialized_per_directory(tmp_path, monkeypatch):
+    for directory in ('first', 'second'):
+        (tmp_path / directory).mkdir()
+        monkeypatch.chdir(tmp_path / directory)
+        run_id = save("history.db", directory)
+        assert history_store.get_run(run_id, db_path="history.db")['name'] == directory
+
+def test_list_runs_paginates_newest_first(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    ids = [save(db_path, f"run {i}") for i in range(5)]
+    assert history_store.count_runs(db_path=db_path) == 5
+    pages = [history_store.list_runs(limit=2, offset=offset, db_path=db_path) for offset in (0, 2, 4)]
+    assert [[entry['id'] for entry in page] for page in pages] == [ids[4:2:-1], ids[2:0:-1], ids[0:1]]
+
+def test_search_and_profile_filter(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    save(db_path, "cửa 100% nhôm", code='A')
+    save(db_path, "cua_so", code='B')
+    save(db_path, "cuaXso", code='B', method="Tối Ưu Sinh Cột")
+    # % và _ được tìm nguyên văn, không phải ký tự đại diện của LIKE
+    assert [entry['name'] for entry in history_store.list_runs(search="100%", db_path=db_path)] == ["cửa 100% nhôm"]
+    assert [entry['name'] for entry in history_store.list_runs(search="cua_", db_path=db_path)] == ["cua_so"]
+    assert history_store.count_runs(search="%", db_path=db_path) == 1
+    assert history_store.count_runs(search="Sinh Cột", db_path=db_path) == 1
+    assert history_store.count_runs(profile_code='B', db_path=db_path) == 2
+    # Tìm kiếm cũng khớp theo mã thanh của lần chạy
+    assert history_store.count_runs(search="B", db_path=db_path) == 2
+    assert history_store.count_runs(search="cua", profile_code='A', db_path=db_path) == 0
+
+def test_rename_and_delete(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    run_id = save(db_path, "cũ")
+    history_store.rename_run(run_id, "mới", db_path=db_path)
+    assert history_store.get_run(run_id, with_frames=False, db_path=db_path)['name'] == "mới"
+    history_store.delete_run(run_id, db_path=db_path)
+    assert history_store.get_run(run_id, db_path=db_path) is None
+    assert history_store.count_runs(profile_code='A', db_path=db_path) == 0
+
+def test_legacy_json_is_migrated_once(tmp_path):
+    result_df, patterns_df, summary_df = frames()
+    legacy = [{
+        'id': 'legacy-1', 'name': 'cũ', 'timestamp': '2024-01-02 03:04:05', 'optimization_method': "Tối Ưu Linh Hoạt",
+        'stock_length_options': [6000], 'cutting_gap': 10, 'profile_codes': ['A'],
+        'result_df': result_df.to_dict(), 'patterns_df': patterns_df.to_dict(), 'summary_df': summary_df.to_dict(),
+    }]
+    with open(tmp_path / "history.json", 'w', encoding='utf-8') as f:
+        json.dump(legacy, f, ensure_ascii=False)
+    db_path = str(tmp_path / "history.db")
+    entries = history_store.list_runs(db_path=db_path)
+    assert [entry['id'] for entry in entries] == ['legacy-1']
+    assert not os.path.exists(tmp_path / "history.json")
+    assert os.path.exists(tmp_path / "history.json.bak")
+    migrated = history_store.get_run('legacy-1', db_path=db_path)
+    assert migrated['result_df']['Item ID'].tolist() == ['A_1', 'A_2']
+
+def test_metrics_are_stored_and_export_time_recorded(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    metrics = {'phases': {'total_s': 1.5}, 'profiles': [{'profile_code': 'A', 'solve_s': 0.2}]}
+    run_id = history_store.save_run(*frames(), [6000], 10, "Tối Ưu PuLP", metrics=metrics, db_path=db_path)
+    history_store.record_export_time(run_id, 0.75, db_path=db_path)
+    stored = history_store.get_run(run_id, with_frames=False, db_path=db_path)['metrics']
+    assert stored == dict(metrics, export_s=0.75)
+    # Lần chạy không có chỉ số vẫn ghi được thời gian xuất file
+    bare_id = save(db_path, "không chỉ số")
+    assert history_store.get_run(bare_id, with_frames=False, db_path=db_path)['metrics'] is None
+    history_store.record_export_time(bare_id, 0.5, db_path=db_path)
+    assert history_store.get_run(bare_id, with_frames=False, db_path=db_path)['metrics']['export_s'] == 0.5
+
+def test_database_without_metrics_column_is_upgraded(tmp_path):
+    db_path = str(tmp_path / "history.db")
+    conn = sqlite3.connect(db_path)
+    conn.executescript(history_store._SCHEMA.replace(",\n    metrics TEXT", ""))
+    conn.close()
+    run_id = history_store.save_run(*frames(), [6000], 10, "Tối Ưu PuLP", metrics={'phases': {}}, db_path=db_path)
+    assert history_store.get_run(run_id, with_frames=False, db_path=db_path)['metrics'] == {'phases': {}}
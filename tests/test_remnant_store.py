@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+import remnant_store
+from cutting_optimizer import fill_remnants, run_optimization
+
+STOCK_LENGTHS = [5800, 6000, 6500]
+
+def test_load_inventory_groups_sorted_remnants_by_code(tmp_path):
+    db_path = str(tmp_path / "remnants.db")
+    assert remnant_store.add_remnants([('A', 1500), ('A', 900), (1001, 2000), ('B', 700)], db_path=db_path) == 4
+    inventory = remnant_store.load_inventory(db_path=db_path)
+    assert sorted(inventory) == ['1001', 'A', 'B']
+    assert [length for length, _ in inventory['A']] == [900, 1500]
+    # Mã thanh dạng số được tra như chuỗi
+    assert list(remnant_store.load_inventory([1001], db_path=db_path)) == ['1001']
+    assert remnant_store.load_inventory([], db_path=db_path) == {}
+
+def test_apply_run_consumes_used_remnants_and_stores_offcuts(tmp_path):
+    db_path = str(tmp_path / "remnants.db")
+    remnant_store.add_remnants([('A', 1500), ('A', 900), ('B', 700)], db_path=db_path)
+    used_ids = [remnant_id for _, remnant_id in remnant_store.load_inventory(['A'], db_path=db_path)['A']]
+    assert remnant_store.apply_run(used_ids, [('A', 620.5), (7, 800)], source="đơn 1", db_path=db_path) == (2, 2)
+    # Phần dư đã bị lần chạy khác lấy ra không được đếm lại
+    assert remnant_store.apply_run(used_ids, [], db_path=db_path) == (0, 0)
+    summary = remnant_store.inventory_summary(db_path=db_path).set_index('Mã Thanh')
+    assert summary.loc['A', 'Số Phần Dư'] == 1 and summary.loc['A', 'Tổng Chiều Dài (mm)'] == 620.5
+    assert summary.loc['7', 'Số Phần Dư'] == 1
+    remnant_store.clear_profile(7, db_path=db_path)
+    assert '7' not in remnant_store.inventory_summary(db_path=db_path)['Mã Thanh'].tolist()
+
+def test_relative_inventory_path_works_after_changing_directory(tmp_path, monkeypatch):
+    for directory in ('first', 'second'):
+        (tmp_path / directory).mkdir()
+        monkeypatch.chdir(tmp_path / directory)
+        remnant_store.add_remnants([(directory, 1500)], db_path="remnants.db")
+        assert list(remnant_store.load_inventory(db_path="remnants.db")) == [directory]
+
+def test_fill_remnants_best_fit():
+    bars, leftover = fill_remnants([1200, 800, 500, 7000], 10, [(1300, 1), (830, 2), (2000, 3)])
+    # 1200 vào phần dư 1300 (thừa ít nhất), 800 vào 830, 500 vào phần dư 2000; 7000 không vừa phần dư nào
+    assert bars == [[[1200], 1300, 1], [[800], 830, 2], [[500], 2000, 3]]
+    assert leftover == [7000]
+
+@pytest.mark.parametrize("method", ["Tối Ưu Linh Hoạt", "Tối Ưu PuLP", "Tối Ưu Sinh Cột"])
+def test_numeric_profile_codes_use_their_remnants(tmp_path, method):
+    db_path = str(tmp_path / "remnants.db")
+    remnant_store.add_remnants([(1001, 2500), (1001, 1300)], db_path=db_path)
+    order = pd.DataFrame({'Mã Thanh': [1001, 1001, 2002], 'Chiều Dài': [1200, 2400, 1500], 'Số Lượng': [1, 1, 2]})
+    inventory = remnant_store.load_inventory(order['Mã Thanh'].unique(), db_path=db_path)
+    result = run_optimization(order, 10, method, STOCK_LENGTHS, remnants=inventory, solution_cache_path=None)
+    assert len(result.used_remnant_ids()) == 2
+    assert result.metrics['phases']['remnant_codes'] == 1
+    summary = result.summary_df.set_index('Mã Thanh')
+    assert summary.loc[1001, 'Số Phần Dư Sử Dụng'] == 2
+    assert summary.loc[2002, 'Số Phần Dư Sử Dụng'] == 0
+    # Mã thanh dùng phần dư không được giữ để tối ưu lại từng phần
+    assert len(result.profile_outputs) == 1
+
+    consumed, added = remnant_store.apply_run(result.used_remnant_ids(), result.offcuts(500), db_path=db_path)
+    assert consumed == 2
+    assert added == len(result.offcuts(500))
+    assert all(remaining >= 500 for _, remaining in result.offcuts(500))
@@ -0,0 +1,93 @@
+import functools
+import os
+import sqlite3
+
+import pandas as pd
+
+import cutting_optimizer
+import solution_cache
+from cutting_optimizer import optimize_cutting, run_optimization
+
+STOCK_LENGTHS = [5800, 6000, 6500]
+
+def demand(code, rows):
+    return pd.DataFrame([{'Mã Thanh': code, 'Chiều Dài': length, 'Số Lượng': count, 'Mã Cửa': door} for length, count, door in rows])
+
+def test_demand_key_ignores_names_doors_and_row_order():
+    key = solution_cache.demand_key(demand('A', [(1200, 2, 'D1'), (800, 3, 'D2'), (1200, 1, 'D3')]), 10, STOCK_LENGTHS, "Tối Ưu PuLP")
+    same = demand('B', [(800.0, 3, 'X'), (1200, 3, 'Y')])
+    assert key == solution_cache.demand_key(same, 10, list(reversed(STOCK_LENGTHS)), "Tối Ưu PuLP")
+    assert key != solution_cache.demand_key(same, 5, STOCK_LENGTHS, "Tối Ưu PuLP")
+    assert key != solution_cache.demand_key(same, 10, STOCK_LENGTHS, "Tối Ưu Sinh Cột")
+    assert key != solution_cache.demand_key(demand('B', [(800, 3, 'X'), (1200, 4, 'Y')]), 10, STOCK_LENGTHS, "Tối Ưu PuLP")
+
+def test_store_and_lookup_round_trip(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    assert solution_cache.lookup("k", db_path) is None
+    solution_cache.store("k", [([1200.5, 800], 5800)], "Optimal", 5700.0, db_path=db_path)
+    assert solution_cache.lookup("k", db_path) == {'bars': [[[1200.5, 800], 5800]], 'solver_status': "Optimal", 'lp_bound': 5700.0}
+    solution_cache.clear(db_path)
+    assert solution_cache.lookup("k", db_path) is None
+
+def test_relative_cache_path_works_after_changing_directory(tmp_path, monkeypatch):
+    for directory in ('first', 'second'):
+        (tmp_path / directory).mkdir()
+        monkeypatch.chdir(tmp_path / directory)
+        solution_cache.store(directory, [([1200, 800], 5800)], "Optimal", None, db_path="cache.db")
+        assert solution_cache.lookup(directory, "cache.db")['solver_status'] == "Optimal"
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    bars = [([float(i) for i in range(200)], 6000)]
+    for key in ["a", "b", "c"]:
+        solution_cache.store(key, bars, "Optimal", db_path=db_path)
+    solution_cache.lookup("a", db_path)  # "a" vừa dùng nên "b" là mục cũ nhất
+    conn = sqlite3.connect(db_path)
+    entry_size = conn.execute("SELECT MAX(size) FROM solutions").fetchone()[0]
+    conn.close()
+    # Vượt giới hạn một chút: chỉ mục dùng lâu nhất bị xóa
+    solution_cache.store("d", bars, "Optimal", db_path=db_path, max_bytes=4 * entry_size - 1)
+    assert solution_cache.lookup("b", db_path) is None
+    assert all(solution_cache.lookup(key, db_path) is not None for key in ["a", "c", "d"])
+
+def test_unreadable_cache_is_ignored(tmp_path):
+    db_path = str(tmp_path / "hong.db")
+    with open(db_path, 'wb') as f:
+        f.write(b"khong phai sqlite" * 100)
+    assert solution_cache.lookup("k", db_path) is None
+    solution_cache.store("k", [([1000], 6000)], "Optimal", db_path=db_path)
+
+def mixed_demand():
+    return pd.DataFrame([
+        {'Mã Thanh': code, 'Chiều Dài': length, 'Số Lượng': count, 'Mã Cửa': f"D{i}"}
+        for code in ['A', 'B'] for i, (length, count) in enumerate([(1210, 7), (2450, 5), (3300, 3), (870, 9), (1745.5, 4)])
+    ])
+
+def test_cache_hit_matches_fresh_solve(tmp_path):
+    cache_path = str(tmp_path / "solution_cache.db")
+    first = run_optimization(mixed_demand(), 10, "Tối Ưu Sinh Cột", STOCK_LENGTHS, solution_cache_path=cache_path)
+    assert first.metrics['phases']['cache_hits'] == 0
+    second = run_optimization(mixed_demand(), 10, "Tối Ưu Sinh Cột", STOCK_LENGTHS, solution_cache_path=cache_path)
+    assert second.metrics['phases']['cache_hits'] == 2
+    assert all(m['cache_hit'] for m in second.metrics['profiles'])
+    for cached_df, fresh_df in zip(second.frames(), first.frames()):
+        pd.testing.assert_frame_equal(cached_df, fresh_df)
+
+def test_optimize_cutting_does_not_touch_the_cache_by_default():
+    optimize_cutting(mixed_demand(), 10, "Tối Ưu PuLP", STOCK_LENGTHS, True)
+    assert not os.path.exists(solution_cache.DEFAULT_CACHE_PATH)
+
+def test_solver_stopped_by_limit_is_not_cached(tmp_path, monkeypatch):
+    cache_path = str(tmp_path / "solution_cache.db")
+    df = pd.DataFrame([{'Mã Thanh': 'X', 'Chiều Dài': 150 + 27 * i, 'Số Lượng': 5 + i % 7} for i in range(20)])
+    method = "Tối Ưu Sinh Cột"
+    # Một vòng sinh cột: bộ giải dừng vì giới hạn số vòng (hit_limit) chứ không hội tụ
+    monkeypatch.setattr(
+        cutting_optimizer, 'optimize_with_column_generation',
+        functools.partial(cutting_optimizer.optimize_with_column_generation, max_iterations=1)
+    )
+    first = run_optimization(df, 10, method, STOCK_LENGTHS, solution_cache_path=cache_path)
+    assert first.metrics['profiles'][0]['hit_limit']
+
+    second = run_optimization(df, 10, method, STOCK_LENGTHS, solution_cache_path=cache_path)
+    assert second.metrics['phases']['cache_hits'] == 0
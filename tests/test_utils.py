@@ -0,0 +1,107 @@
+import io
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from cutting_optimizer import optimize_cutting, run_optimization
+
+from utils import (
+    LRUCache, create_output_excel, file_digest, list_optimization_history, load_optimization_history_entry,
+    optimization_cache_key, read_order_files, save_optimization_history,
+)
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # 'a' vừa được dùng, 'b' thành cũ nhất
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.get('b', 'missing') == 'missing'
+
+def test_file_digest_depends_only_on_content():
+    assert file_digest(b"abc") == file_digest(b"abc")
+    assert file_digest(b"abc") != file_digest(b"abd")
+
+def test_optimization_cache_key_normalises_parameters():
+    key = optimization_cache_key("h", 10, [6000, 5800, 6000], "Tối Ưu PuLP")
+    assert key == optimization_cache_key("h", 10.0, [5800, 6000], "Tối Ưu PuLP")
+    assert key != optimization_cache_key("h", 10, [5800, 6000], "Tối Ưu Sinh Cột")
+
+def test_save_history_returns_entry_id(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    summary_df = pd.DataFrame([{'Mã Thanh': 'A', 'Số Thanh Sử Dụng': 1}])
+    entry_id = save_optimization_history(pd.DataFrame(), pd.DataFrame(), summary_df, [6000], 10, "Tối Ưu PuLP", name="run")
+    assert [entry['id'] for entry in list_optimization_history()] == [entry_id]
+    assert load_optimization_history_entry(entry_id)['summary_df']['Mã Thanh'].tolist() == ['A']
+
+def test_streamed_export_writes_every_sheet_and_row():
+    df = pd.DataFrame([
+        {'Mã Thanh': 'A', 'Chiều Dài': 1200, 'Số Lượng': 5},
+        {'Mã Thanh': 'B', 'Chiều Dài': 2500, 'Số Lượng': 3},
+    ])
+    result_df, patterns_df, summary_df = optimize_cutting(df, 10, "Tối Ưu Linh Hoạt", [5800, 6000], True)
+    stream = io.BytesIO()
+    create_output_excel(stream, result_df, patterns_df, summary_df, [5800, 6000], 10)
+    stream.seek(0)
+    workbook = openpyxl.load_workbook(stream)
+    assert workbook.sheetnames == ["Tổng Hợp", "Mẫu Cắt", "Chi Tiết Mảnh", "Mô Phỏng Cắt Từng Thanh", "Tham Số"]
+    assert workbook["Chi Tiết Mảnh"].max_row == len(result_df) + 1
+    assert workbook["Mẫu Cắt"].max_row == len(patterns_df) + 1
+    summary = workbook["Tổng Hợp"]
+    header = [cell.value for cell in summary[1]]
+    efficiency = summary.cell(row=2, column=header.index('Hiệu Suất Tổng Thể') + 1)
+    # Cột phần trăm giữ giá trị 0–100 nên định dạng không nhân thêm 100
+    assert efficiency.value == pytest.approx(summary_df['Hiệu Suất Tổng Thể'].iat[0])
+    assert '%' in efficiency.number_format and not efficiency.number_format.endswith('0%')
+
+def workbook_bytes(sheets):
+    """Tệp .xlsx trong bộ nhớ từ {tên sheet: các dòng (dòng đầu là tiêu đề)}."""
+    workbook = openpyxl.Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        worksheet = workbook.create_sheet(title)
+        for row in rows:
+            worksheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+def test_read_order_files_merges_files_and_sheets():
+    header = ["Mã Thanh", "Chiều Dài", "Số Lượng", "Mã Cửa"]
+    first = workbook_bytes({
+        "Tầng 1": [header, ["A", 1200, 2, "D1"], ["A", 1200, 3, "D1"], [None, None, None, None], ["B", "850.5", 1, "D2"]],
+        "Phụ kiện": [["Mã phụ kiện", "Số lượng"], ["PK1", 4]],
+        "Tầng 2": [header, ["A", 1200, 1, "D1"]],
+    })
+    second = workbook_bytes({"Sheet1": [["Số Lượng", "Mã Thanh", "Chiều Dài"], [5, 1001, 600]]})
+    df, valid, message = read_order_files([("don_1.xlsx", first), ("don_2.xlsx", second)])
+    assert valid, message
+    assert message == "Đã gộp 2 tệp, 3 sheet"
+    rows = df.astype(object).where(df.notna(), None).values.tolist()
+    assert rows == [
+        ["A", 1200, 5, "D1", "don_1.xlsx", "Tầng 1"],
+        ["B", 850.5, 1, "D2", "don_1.xlsx", "Tầng 1"],
+        ["A", 1200, 1, "D1", "don_1.xlsx", "Tầng 2"],
+        [1001, 600, 5, None, "don_2.xlsx", "Sheet1"],
+    ]
+
+def test_read_order_files_reports_the_failing_row():
+    header = ["Mã Thanh", "Chiều Dài", "Số Lượng"]
+    bad = workbook_bytes({"Tầng 1": [header, ["A", 1200, 2], ["A", "abc", 1]]})
+    df, valid, message = read_order_files([("don.xlsx", bad)])
+    assert df is None and not valid
+    assert message == "don.xlsx / Tầng 1 dòng 3: Chiều Dài và Số Lượng phải là số"
+    empty = workbook_bytes({"Phụ kiện": [["Mã phụ kiện", "Số lượng"]]})
+    assert not read_order_files([("pk.xlsx", empty)])[1]
+
+def test_merged_order_keeps_source_of_every_piece():
+    header = ["Mã Thanh", "Chiều Dài", "Số Lượng"]
+    order = workbook_bytes({"S1": [header, ["A", 2000, 2]], "S2": [header, ["A", 2000, 1], ["A", 1500, 2]]})
+    df, _, _ = read_order_files([("don.xlsx", order)])
+    result = run_optimization(df, 10, "Tối Ưu Linh Hoạt", [6000])
+    sources = result.result_df.groupby(['Sheet', 'Chiều Dài']).size().to_dict()
+    assert sources == {('S1', 2000): 2, ('S2', 1500): 2, ('S2', 2000): 1}
+    assert (result.result_df['Tệp Nguồn'] == "don.xlsx").all()
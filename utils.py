@@ -1,12 +1,49 @@
 import pandas as pd
-import streamlit as st
 import io
+import numpy as np
 import openpyxl
-from openpyxl.styles import PatternFill
-import json
-import os
-import uuid
-from datetime import datetime
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, NamedStyle, Font, Border, Side, Alignment
+import hashlib
+import threading
+from collections import OrderedDict
+import history_store
+from cut_plan import CutPlan, LENGTH_SCALE
+from cutting_optimizer import SOURCE_COLUMNS
+
+class LRUCache:
+    """Bộ nhớ đệm LRU có giới hạn số mục, an toàn khi nhiều phiên/luồng dùng chung."""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+def file_digest(file_bytes):
+    """Băm nội dung tệp (SHA-256) để làm khóa bộ nhớ đệm theo nội dung."""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def optimization_cache_key(file_hash, cutting_gap, stock_length_options, optimization_method, time_budget=None):
+    """Khóa bộ nhớ đệm kết quả: nội dung tệp cùng các tham số ảnh hưởng tới kết quả tối ưu."""
+    return (file_hash, float(cutting_gap), tuple(sorted(set(stock_length_options))), optimization_method, time_budget)
 
 def validate_input_excel(df):
     required_columns = ["Mã Thanh", "Chiều Dài", "Số Lượng"]
@@ -34,6 +71,85 @@ def validate_input_excel(df):
 
     return True, "Tệp hợp lệ"
 
+def files_digest(files):
+    """Khóa nội dung của một nhóm tệp [(tên tệp, bytes)]: tên tệp nằm trong kết quả nên cũng được băm."""
+    return file_digest("\n".join(f"{name}:{file_digest(data)}" for name, data in files).encode('utf-8'))
+
+def _iter_sheet_rows(file_name, file_bytes):
+    """(tên sheet, các dòng dạng tuple) của mọi sheet; .xlsx được đọc theo luồng bằng openpyxl chế độ chỉ-đọc."""
+    if file_name.lower().endswith('.xls'):
+        # openpyxl không đọc được .xls, đọc cả tệp bằng pandas như trước
+        for sheet_name, sheet_df in pd.read_excel(io.BytesIO(file_bytes), sheet_name=None, header=None).items():
+            yield sheet_name, sheet_df.astype(object).where(sheet_df.notna(), None).itertuples(index=False, name=None)
+        return
+    workbook = openpyxl.load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            yield worksheet.title, worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def _order_number(value):
+    """Giá trị số của một ô Chiều Dài/Số Lượng, None nếu không phải số."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if value != value else value
+    try:
+        return float(str(value).strip())
+    except ValueError:
+        return None
+
+def read_order_files(files):
+    """Đọc nhiều tệp đơn hàng (mọi sheet có đủ cột bắt buộc) theo luồng và gộp thành một bảng nhu cầu.
+
+    files là danh sách (tên tệp, bytes). Mỗi dòng được cộng dồn ngay vào nhóm (Mã Thanh, Chiều Dài, Mã Cửa,
+    Tệp Nguồn, Sheet) nên bộ nhớ tỉ lệ với số nhóm chứ không với số dòng, và mỗi mảnh vẫn truy được về tệp,
+    sheet và mã cửa. Sheet thiếu cột bắt buộc (ví dụ sheet phụ kiện) được bỏ qua.
+    Trả về (df, hợp lệ, thông báo) như validate_input_excel.
+    """
+    required_columns = ["Mã Thanh", "Chiều Dài", "Số Lượng"]
+    demand = {}
+    has_door_code = False
+    for file_name, file_bytes in files:
+        for sheet_name, rows in _iter_sheet_rows(file_name, file_bytes):
+            header = next(rows, None)
+            if header is None:
+                continue
+            positions = {value: index for index, value in enumerate(header) if value is not None}
+            if any(column not in positions for column in required_columns):
+                continue
+            code_pos, length_pos, quantity_pos = (positions[column] for column in required_columns)
+            door_pos = positions.get("Mã Cửa")
+            has_door_code = has_door_code or door_pos is not None
+            for row_number, row in enumerate(rows, 2):
+                if all(value is None or value == '' for value in row):
+                    continue
+                cell = lambda pos: row[pos] if pos is not None and pos < len(row) else None
+                place = f"{file_name} / {sheet_name} dòng {row_number}"
+                profile_code = cell(code_pos)
+                length, quantity = _order_number(cell(length_pos)), _order_number(cell(quantity_pos))
+                if length is None or quantity is None:
+                    return None, False, f"{place}: Chiều Dài và Số Lượng phải là số"
+                if length <= 0:
+                    return None, False, f"{place}: Chiều Dài phải > 0"
+                if quantity <= 0:
+                    return None, False, f"{place}: Số Lượng phải > 0"
+                if profile_code is None or profile_code == '':
+                    return None, False, f"{place}: Mã Thanh không được để trống"
+                key = (profile_code, length, cell(door_pos), file_name, sheet_name)
+                demand[key] = demand.get(key, 0) + quantity
+
+    if not demand:
+        return None, False, f"Không có sheet nào có dữ liệu với đủ các cột bắt buộc: {', '.join(required_columns)}"
+    df = pd.DataFrame(
+        [key[:2] + (quantity,) + key[2:] for key, quantity in demand.items()],
+        columns=["Mã Thanh", "Chiều Dài", "Số Lượng", "Mã Cửa"] + SOURCE_COLUMNS
+    )
+    if not has_door_code:
+        df = df.drop(columns=["Mã Cửa"])
+    return df, True, f"Đã gộp {len(files)} tệp, {df[SOURCE_COLUMNS].drop_duplicates().shape[0]} sheet"
+
 def create_accessory_summary(input_df, output_stream):
     required_cols = ['Mã phụ kiện', 'Tên phụ phiện', 'Đơn vị tính', 'Số lượng']
     missing = [col for col in required_cols if col not in input_df.columns]
@@ -50,167 +166,179 @@ def create_accessory_summary(input_df, output_stream):
 
     return grouped
 
-def create_output_excel(output_stream, result_df, patterns_df, summary_df, stock_length_options, cutting_gap):
-    with pd.ExcelWriter(output_stream, engine='openpyxl') as writer:
-        # Ghi các sheet hiện có
-        summary_df.to_excel(writer, sheet_name="Tổng Hợp", index=False)
-        patterns_df.to_excel(writer, sheet_name="Mẫu Cắt", index=False)
-        result_df.to_excel(writer, sheet_name="Chi Tiết Mảnh", index=False)
-
-        # Lấy workbook và các sheet để định dạng
-        workbook = writer.book
-        summary_sheet = workbook["Tổng Hợp"]
-        patterns_sheet = workbook["Mẫu Cắt"]
-
-        # Định dạng các cột hiệu suất thành phần trăm
-        for row in summary_sheet.iter_rows(min_row=2, max_row=summary_sheet.max_row):
-            for cell in row:
-                if cell.column_letter in ['G', 'H']:  # Cột Hiệu Suất Tổng Thể và Hiệu Suất Trung Bình
-                    cell.number_format = '0.0%'
-
-        for row in patterns_sheet.iter_rows(min_row=2, max_row=patterns_sheet.max_row):
-            for cell in row:
-                if cell.column_letter == 'F':  # Cột Hiệu Suất
-                    cell.number_format = '0.0%'
-
-        # Tạo sheet "Mô Phỏng Cắt Từng Thanh"
-        try:
-            ws = writer.book.create_sheet("Mô Phỏng Cắt Từng Thanh")
-
-            # Kiểm tra nếu patterns_df không rỗng
-            if not patterns_df.empty:
-                # Sắp xếp patterns_df theo cột 'Mã Thanh'
-                patterns_df = patterns_df.sort_values('Mã Thanh')
-
-                # Xác định số đoạn cắt tối đa trong bất kỳ mẫu cắt nào
-                if 'Mẫu Cắt' in patterns_df.columns:
-                    max_pieces = patterns_df['Mẫu Cắt'].apply(lambda x: len(x.split('+'))).max()
-                else:
-                    max_pieces = 0
-
-                # Danh sách màu HEX cho các đoạn cắt
-                piece_colors = ["FF9999", "99FF99", "9999FF", "FFFF99", "FF99FF", "99FFFF"]
-
-                # Các cột gốc (loại bỏ 'Mẫu Cắt' nếu có)
-                original_columns = [col for col in patterns_df.columns if col != 'Mẫu Cắt']
-
-                # Các cột cho từng đoạn cắt
-                piece_columns = [f"Piece {i+1}" for i in range(max_pieces)] if max_pieces > 0 else []
-
-                # Ghi tiêu đề cho sheet "Mô Phỏng Cắt Từng Thanh"
-                headers = original_columns + piece_columns
-                for col_num, header in enumerate(headers, 1):
-                    ws.cell(row=1, column=col_num, value=header)
-
-                # Chỉ số cột trong patterns_df
-                column_indices = {col: i for i, col in enumerate(patterns_df.columns)}
-
-                # Ghi dữ liệu vào sheet
-                for row_num, row in enumerate(patterns_df.itertuples(index=False), 2):
-                    # Ghi các cột gốc
-                    for col_num, col in enumerate(original_columns, 1):
-                        value = row[column_indices[col]]
-                        if isinstance(value, float):
-                            # Nếu là số thập phân, làm tròn đến 1 chữ số thập phân
-                            if col in ['Hiệu Suất']:
-                                ws.cell(row=row_num, column=col_num, value=value).number_format = '0.0%'
-                            elif value % 1 != 0:  # Các cột khác
-                                value = round(value, 1)
-                                ws.cell(row=row_num, column=col_num, value=value).number_format = '0.0'
-                            else:
-                                # Nếu là số nguyên, giữ nguyên
-                                ws.cell(row=row_num, column=col_num, value=int(value)).number_format = '0'
-                        else:
-                            ws.cell(row=row_num, column=col_num, value=value)
-
-                    # Tách mẫu cắt và ghi từng đoạn nếu có cột Mẫu Cắt
-                    if 'Mẫu Cắt' in patterns_df.columns:
-                        pieces = row[column_indices['Mẫu Cắt']].split('+')
-                        for piece_num, piece in enumerate(pieces):
-                            col_num = len(original_columns) + piece_num + 1
-                            value = float(piece)
-                            # Nếu là số thập phân, làm tròn đến 1 chữ số thập phân
-                            if value % 1 != 0:  # Kiểm tra nếu không phải số nguyên
-                                value = round(value, 1)
-                                cell = ws.cell(row=row_num, column=col_num, value=value)
-                                cell.number_format = '0.0'
-                            else:
-                                # Nếu là số nguyên, giữ nguyên
-                                cell = ws.cell(row=row_num, column=col_num, value=int(value))
-                                cell.number_format = '0'
-                            # Áp dụng màu nền
-                            color = piece_colors[piece_num % len(piece_colors)]
-                            fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
-                            cell.fill = fill
+# Danh sách màu HEX cho các đoạn cắt trong sheet mô phỏng
+PIECE_COLORS = ["FF9999", "99FF99", "9999FF", "FFFF99", "FF99FF", "99FFFF"]
+
+# Các cột hiệu suất (đơn vị %, giá trị 0–100)
+PERCENT_COLUMNS = ['Hiệu Suất', 'Hiệu Suất Tổng Thể', 'Hiệu Suất Trung Bình', 'Chênh Lệch Số Thanh (%)', 'Chênh Lệch Nguyên Liệu (%)']
+
+def _register_export_styles(workbook):
+    """Đăng ký một lần các kiểu dùng chung cho file xuất, trả về tên kiểu."""
+    thin = Side(style='thin')
+    header = NamedStyle(name='export_header')
+    header.font = Font(bold=True)
+    header.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    header.alignment = Alignment(horizontal='center', vertical='top')
+    percent = NamedStyle(name='export_percent', number_format='0.0"%"')
+    decimal = NamedStyle(name='export_decimal', number_format='0.0')
+    integer = NamedStyle(name='export_integer', number_format='0')
+    for style in (header, percent, decimal, integer):
+        workbook.add_named_style(style)
+
+    piece_styles = []
+    for color in PIECE_COLORS:
+        fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+        pair = []
+        for number_format, suffix in (('0', 'integer'), ('0.0', 'decimal')):
+            style = NamedStyle(name=f'export_piece_{color}_{suffix}', number_format=number_format)
+            style.fill = fill
+            workbook.add_named_style(style)
+            pair.append(style.name)
+        piece_styles.append(tuple(pair))
+    return piece_styles
+
+def _styled_cell(ws, value, style):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+def _column_values(series):
+    """Giá trị một cột dưới dạng list Python, ô trống (NaN) thành None."""
+    values = series.to_numpy(dtype=object)
+    missing = pd.isna(series).to_numpy()
+    if missing.any():
+        values[missing] = None
+    return values.tolist()
+
+def _write_frame_sheet(workbook, title, df, column_styles=None):
+    """Ghi một DataFrame thành sheet chỉ-ghi: tiêu đề có kiểu, mỗi cột một định dạng."""
+    ws = workbook.create_sheet(title)
+    column_styles = column_styles or {}
+    ws.append([_styled_cell(ws, str(col), 'export_header') for col in df.columns])
+    columns = []
+    for col in df.columns:
+        values = _column_values(df[col])
+        style = column_styles.get(col)
+        if style:
+            values = [_styled_cell(ws, v, style) if v is not None else None for v in values]
+        columns.append(values)
+    for row in zip(*columns):
+        ws.append(row)
+    return ws
+
+def _rounded_number_cells(ws, values, decimal_style, integer_style):
+    """Số nguyên giữ nguyên (định dạng '0'), số lẻ làm tròn 1 chữ số (định dạng '0.0')."""
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, 1)
+    whole = values % 1 == 0
+    return [
+        _styled_cell(ws, int(v), integer_style) if w else _styled_cell(ws, float(r), decimal_style)
+        for v, r, w in zip(values.tolist(), rounded.tolist(), whole.tolist())
+    ]
+
+def _write_simulation_sheet(workbook, plan, patterns_df, piece_styles):
+    """Sheet "Mô Phỏng Cắt Từng Thanh": các cột mẫu cắt cùng từng đoạn cắt tô màu, lấy từ mảng của CutPlan."""
+    ws = workbook.create_sheet("Mô Phỏng Cắt Từng Thanh")
+    if patterns_df.empty:
+        ws.append(["Không có dữ liệu để mô phỏng cắt."])
+        return
+
+    original_columns = [col for col in patterns_df.columns if col != 'Mẫu Cắt']
+    counts = plan.bar_piece_counts()
+    max_pieces = int(counts.max()) if len(counts) else 0
+
+    headers = original_columns + [f"Piece {i+1}" for i in range(max_pieces)]
+    ws.append([_styled_cell(ws, header, 'export_header') for header in headers])
+
+    columns = []
+    for col in original_columns:
+        series = patterns_df[col]
+        if series.dtype.kind == 'f':
+            if col in PERCENT_COLUMNS:
+                columns.append([_styled_cell(ws, v, 'export_percent') for v in series.tolist()])
             else:
-                # Nếu patterns_df rỗng, ghi một thông báo vào sheet
-                ws.cell(row=1, column=1, value="Không có dữ liệu để mô phỏng cắt.")
-        except Exception as e:
-            # Nếu có lỗi, ghi thông báo lỗi vào sheet
-            ws = writer.book.create_sheet("Mô Phỏng Cắt Từng Thanh")
-            ws.cell(row=1, column=1, value=f"Lỗi khi tạo sheet: {str(e)}")
-
-        # Sheet Tham Số
-        params_df = pd.DataFrame({
-            'Tham Số': ['Kích Thước Thanh Có Sẵn', 'Khoảng Cách Cắt'],
-            'Giá Trị': [', '.join(map(str, stock_length_options)), cutting_gap]
-        })
-        params_df.to_excel(writer, sheet_name="Tham Số", index=False)
-
-def save_optimization_history(result_df, patterns_df, summary_df, stock_length_options, cutting_gap, optimization_method, name=None):
-    """Lưu kết quả tối ưu hóa vào file JSON."""
-    history_file = "history.json"
-    history_data = []
-
-    # Đọc dữ liệu hiện có nếu file tồn tại
-    if os.path.exists(history_file):
-        try:
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history_data = json.load(f)
-        except:
-            history_data = []
-
-    # Chuẩn bị dữ liệu để lưu
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    history_entry = {
-        'id': str(uuid.uuid4()),
-        'name': name or timestamp,
-        'timestamp': timestamp,
-        'optimization_method': optimization_method,
-        'stock_length_options': stock_length_options,
-        'cutting_gap': cutting_gap,
-        'profile_codes': summary_df['Mã Thanh'].unique().tolist(),
-        'result_df': result_df.to_dict(),
-        'patterns_df': patterns_df.to_dict(),
-        'summary_df': summary_df.to_dict()
-    }
-
-    # Thêm vào danh sách và lưu lại
-    history_data.append(history_entry)
-    with open(history_file, 'w', encoding='utf-8') as f:
-        json.dump(history_data, f, ensure_ascii=False, indent=2)
-
-def load_optimization_history():
-    """Đọc lịch sử tối ưu hóa từ file JSON."""
-    history_file = "history.json"
-    if os.path.exists(history_file):
-        try:
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history_data = json.load(f)
-            return history_data
-        except:
-            return []
-    return []
+                columns.append(_rounded_number_cells(ws, series.to_numpy(), 'export_decimal', 'export_integer'))
+        else:
+            columns.append(_column_values(series))
+
+    # Ô cho mọi mảnh được dựng một lượt theo cột; màu theo vị trí mảnh trong thanh
+    # Chiều dài mảnh là số nguyên phần mười mm: mm nguyên ghi số nguyên, còn lại ghi một chữ số lẻ
+    units = plan.piece_lengths
+    whole = (units % LENGTH_SCALE == 0).tolist()
+    millimetres = (units // LENGTH_SCALE).tolist()
+    decimals = (units / LENGTH_SCALE).tolist()
+    positions = (np.arange(plan.n_pieces) - np.repeat(plan.piece_offsets[:-1], counts)) % len(piece_styles)
+    piece_cells = [
+        _styled_cell(ws, mm, piece_styles[pos][0]) if w else _styled_cell(ws, d, piece_styles[pos][1])
+        for mm, d, w, pos in zip(millimetres, decimals, whole, positions.tolist())
+    ]
+
+    offsets = plan.piece_offsets.tolist()
+    for base, start, end in zip(zip(*columns), offsets[:-1], offsets[1:]):
+        ws.append(list(base) + piece_cells[start:end])
+
+def create_output_excel(output_stream, result_df, patterns_df, summary_df, stock_length_options, cutting_gap):
+    """Xuất kết quả ra Excel ở chế độ chỉ-ghi: ghi dòng theo luồng, kiểu dùng chung, bộ nhớ không tăng theo số ô."""
+    workbook = openpyxl.Workbook(write_only=True)
+    piece_styles = _register_export_styles(workbook)
+    percent_styles = {col: 'export_percent' for col in PERCENT_COLUMNS}
+
+    _write_frame_sheet(workbook, "Tổng Hợp", summary_df, percent_styles)
+    _write_frame_sheet(workbook, "Mẫu Cắt", patterns_df, percent_styles)
+    _write_frame_sheet(workbook, "Chi Tiết Mảnh", result_df.rename(columns={'Item ID': 'Mã Mảnh', 'Bar Number': 'Số Thanh'}))
+
+    try:
+        # Mảnh của từng thanh lấy từ result_df qua CutPlan, không tách lại chuỗi 'Mẫu Cắt'
+        sorted_patterns = patterns_df.sort_values('Mã Thanh', kind='stable') if not patterns_df.empty else patterns_df
+        plan = CutPlan.from_frames(result_df, sorted_patterns)
+        _write_simulation_sheet(workbook, plan, sorted_patterns, piece_styles)
+    except Exception as e:
+        # Nếu có lỗi, ghi thông báo lỗi vào một sheet mới thay cho sheet dở dang
+        if "Mô Phỏng Cắt Từng Thanh" in workbook.sheetnames:
+            workbook.remove(workbook["Mô Phỏng Cắt Từng Thanh"])
+        ws = workbook.create_sheet("Mô Phỏng Cắt Từng Thanh")
+        ws.append([f"Lỗi khi tạo sheet: {str(e)}"])
+
+    # Sheet Tham Số
+    params_df = pd.DataFrame({
+        'Tham Số': ['Kích Thước Thanh Có Sẵn', 'Khoảng Cách Cắt'],
+        'Giá Trị': [', '.join(map(str, stock_length_options)), cutting_gap]
+    })
+    _write_frame_sheet(workbook, "Tham Số", params_df)
+
+    workbook.save(output_stream)
+
+def save_optimization_history(result_df, patterns_df, summary_df, stock_length_options, cutting_gap, optimization_method, name=None, metrics=None):
+    """Lưu kết quả tối ưu hóa (kèm chỉ số hiệu năng nếu có) vào lịch sử, trả về mã lịch sử."""
+    return history_store.save_run(
+        result_df, patterns_df, summary_df, stock_length_options, cutting_gap, optimization_method, name=name, metrics=metrics
+    )
+
+def load_optimization_metrics(entry_id):
+    """Chỉ số hiệu năng của một mục lịch sử (không đọc dữ liệu kết quả); None nếu không có."""
+    entry = history_store.get_run(entry_id, with_frames=False)
+    return entry['metrics'] if entry else None
+
+def record_export_time(entry_id, seconds):
+    """Ghi thời gian tạo file Excel vào chỉ số hiệu năng của mục lịch sử."""
+    history_store.record_export_time(entry_id, seconds)
+
+def list_optimization_history(search=None, limit=None, offset=0):
+    """Liệt kê metadata lịch sử (không kèm dữ liệu kết quả), có tìm kiếm và phân trang."""
+    return history_store.list_runs(search=search, limit=limit, offset=offset)
+
+def count_optimization_history(search=None):
+    """Đếm số mục lịch sử khớp với từ khóa tìm kiếm."""
+    return history_store.count_runs(search=search)
+
+def load_optimization_history_entry(entry_id):
+    """Đọc một mục lịch sử kèm dữ liệu kết quả theo ID."""
+    return history_store.get_run(entry_id)
+
+def rename_optimization_history_entry(entry_id, name):
+    """Đổi tên một mục lịch sử theo ID."""
+    history_store.rename_run(entry_id, name)
 
 def delete_optimization_history_entry(entry_id):
     """Xóa một mục lịch sử theo ID."""
-    history_file = "history.json"
-    if os.path.exists(history_file):
-        try:
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history_data = json.load(f)
-            history_data = [entry for entry in history_data if entry['id'] != entry_id]
-            with open(history_file, 'w', encoding='utf-8') as f:
-                json.dump(history_data, f, ensure_ascii=False, indent=2)
-        except:
-            pass
+    history_store.delete_run(entry_id)